@@ -1,34 +1,237 @@
-from flask import Flask, jsonify, request, render_template
-from process import gene_names_list, cell_lines_list, chromosome_size, chromosomes_list, chromosome_sequences, chromosome_data, example_chromosome_3d_data, comparison_cell_line_list, gene_list, gene_names_list_search, chromosome_size_by_gene_name, chromosome_valid_ibp_data, epigenetic_track_data
+import hashlib
+import json
+import math
+from functools import wraps
+from flask import Flask, Response, g, jsonify, make_response, request, render_template, stream_with_context
+from process import gene_names_list, cell_lines_list, dataset_catalog, chromosome_size, chromosomes_list, chromosome_sequences, chromosome_data, chromosome_data_chunks, chromosome_data_columns, chromosome_data_at_zoom, chromosome_data_at_zoom_columns, example_chromosome_3d_data, example_chromosome_3d_columns, distance_samples, structure_distance_columns, structure_cache_stats, comparison_cell_line_list, comparison_region_data, comparison_region_columns, gene_list, gene_names_list_search, chromosome_size_by_gene_name, chromosome_valid_ibp_data, chromosome_region_data, region_memo_stats, epigenetic_track_data, epigenetic_track_chunks, epigenetic_track_columns, epigenetic_track_summary, epigenetic_track_summary_columns, submit_folding_job, folding_job_status, folding_jobs_stats, db_pool_stats, COMPARISON_PARTS, DISTANCE_MAX_SAMPLES, GENE_SEARCH_LIMIT, PYRAMID_MAX_BINS, ZOOM_AGGREGATES
+from columnar import COLUMNAR_MIMETYPE, encode_columns
+from cache import data_version, metadata_cache
+from metrics import exposition, finish_request, start_request
+from http_compression import compress_response
+from werkzeug.exceptions import BadRequest
+from psycopg2.errors import QueryCanceled
 from flask_cors import CORS
 
 app = Flask(__name__)
 CORS(app)
 
+
+@app.before_request
+def start_metrics():
+    g.metrics = start_request()
+
+
+# Registered after start_metrics, so rejected requests are still measured
+@app.before_request
+def require_json_object():
+    """JSON request bodies are objects of named fields; anything else is answered with 400."""
+    if request.method == 'POST' and request.is_json and not isinstance(request.json, dict):
+        raise BadRequest('The JSON body must be an object')
+
+
+@app.errorhandler(QueryCanceled)
+def statement_timed_out(error):
+    """A statement that ran past DB_STATEMENT_TIMEOUT is answered with 504, like a request timeout under gevent."""
+    print(f"Statement timed out: {request.method} {request.path}: {error}")
+    return jsonify({'error': 'The query took too long, try a smaller region'}), 504
+
+
+@app.after_request
+def finish_metrics(response):
+    """Record the request latency, phases and response size under the route pattern."""
+    state = g.pop('metrics', None)
+    if state is not None:
+        body = request.get_json(silent=True) if request.is_json else None
+        body = body if isinstance(body, dict) else {}
+        cell_line = body.get('cell_line') or ('multiple' if body.get('cell_lines') else '')
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        content_length = None if response.is_streamed else response.calculate_content_length()
+        finish_request(state, endpoint, request.method, response.status_code, cell_line, content_length)
+    return response
+
+
+# Registered after finish_metrics so it runs first, and the metrics see the compressed size
+@app.after_request
+def compress(response):
+    return compress_response(response, request.accept_encodings)
+
+
+def wants_columnar():
+    """Columnar responses are opt-in, through the Accept header or a "format" request field."""
+    if request.is_json and request.json.get('format') == 'columnar':
+        return True
+    return request.accept_mimetypes.best_match(['application/json', COLUMNAR_MIMETYPE]) == COLUMNAR_MIMETYPE
+
+
+def columnar_response(fields, columns):
+    response = Response(encode_columns(fields, columns), mimetype=COLUMNAR_MIMETYPE)
+    response.vary.add('Accept')
+    return response
+
+def requested_precision():
+    """
+    Optional "precision" request field: significant digits of the float fields, as an int for all
+    of them or {field: digits}, e.g. {"fq": 4, "fdr": 3}.
+    """
+    precision = request.json.get('precision')
+    if precision is None:
+        return None
+    digits = precision.values() if isinstance(precision, dict) else [precision]
+    if not all(isinstance(value, int) and not isinstance(value, bool) and 1 <= value <= 17 for value in digits):
+        raise BadRequest('precision must be 1-17 significant digits, or a {field: digits} object')
+    return precision
+
+
+def is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def requested_positive_int(name, default=None):
+    """Optional positive integer request field; digit strings are accepted, anything else is a 400."""
+    value = request.json.get(name, default)
+    if value is None:
+        return None
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    if not is_int(value) or value < 1:
+        raise BadRequest(f'{name} must be a positive integer')
+    return value
+
+
+def requested_ensemble():
+    """
+    Optional /getStructureDistances fields: "n_samples" (1 to DISTANCE_MAX_SAMPLES), or up to DISTANCE_MAX_SAMPLES
+    non-negative "sample_ids", and a positive "cutoff" distance.
+    """
+    n_samples = request.json.get('n_samples')
+    sample_ids = request.json.get('sample_ids')
+    cutoff = request.json.get('cutoff')
+    if n_samples is not None and not (is_int(n_samples) and 1 <= n_samples <= DISTANCE_MAX_SAMPLES):
+        raise BadRequest(f'n_samples must be an integer from 1 to {DISTANCE_MAX_SAMPLES}')
+    if sample_ids is not None and not (
+        isinstance(sample_ids, list)
+        and 1 <= len(sample_ids) <= DISTANCE_MAX_SAMPLES
+        and all(is_int(sample_id) and sample_id >= 0 for sample_id in sample_ids)
+    ):
+        raise BadRequest(f'sample_ids must be a list of 1 to {DISTANCE_MAX_SAMPLES} non-negative integers')
+    if cutoff is not None and not (
+        isinstance(cutoff, (int, float)) and not isinstance(cutoff, bool) and math.isfinite(cutoff) and cutoff > 0
+    ):
+        raise BadRequest('cutoff must be a positive number')
+    return n_samples, sample_ids, None if cutoff is None else float(cutoff)
+
+
+def wants_stream():
+    """Streaming responses are opt-in through a "stream" request field."""
+    return request.is_json and bool(request.json.get('stream'))
+
+
+def stream_json_array(chunks):
+    """Stream lists of rows as one JSON array, encoding a chunk at a time."""
+    def generate():
+        yield '['
+        first = True
+        for rows in chunks:
+            if not rows:
+                continue
+            yield ('' if first else ',') + json.dumps(rows)[1:-1]
+            first = False
+        yield ']'
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+def stream_json_groups(chunks):
+    """Stream (key, rows) chunks, grouped by key in order, as one JSON object of arrays."""
+    def generate():
+        yield '{'
+        current = None
+        for key, rows in chunks:
+            if key != current:
+                yield ('' if current is None else '],') + json.dumps(key) + ':['
+                current = key
+                first = True
+            if rows:
+                yield ('' if first else ',') + json.dumps(rows)[1:-1]
+                first = False
+        yield ('' if current is None else ']') + '}'
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+def lookup_field(name):
+    """
+    Field of a lookup request: a query parameter of a GET (which browsers revalidate with
+    If-None-Match), or a JSON body field of a POST from older clients.
+    """
+    if request.method == 'GET':
+        if name not in request.args:
+            raise BadRequest(f'Missing query parameter {name}')
+        return request.args[name]
+    return request.json[name]
+
+
+def conditional(view):
+    """
+    ETag/Last-Modified for responses that only change when new data is ingested.
+
+    The ETag is derived from the data version, the path with its query string and the request body,
+    so a matching If-None-Match (or If-Modified-Since) is answered with 304 before the view runs.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        version, last_modified = data_version()
+        etag = hashlib.sha1(f"{version}:{request.full_path}:".encode() + request.get_data()).hexdigest()
+
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains_weak(etag)
+        else:
+            not_modified = (
+                last_modified is not None
+                and request.if_modified_since is not None
+                and request.if_modified_since.timestamp() >= last_modified
+            )
+
+        response = Response(status=304) if not_modified else make_response(view(*args, **kwargs))
+        response.set_etag(etag)
+        if last_modified is not None:
+            response.last_modified = last_modified
+        response.cache_control.no_cache = True
+        return response
+    return wrapper
+
 @app.route('/')
 def index():
     return 'Hello, World!'
 
 
 @app.route('/getGeneNameList', methods=['GET'])
+@conditional
 def get_GeneNameList():
     return jsonify(gene_names_list())
 
 
 @app.route('/getCellLines', methods=['GET'])
+@conditional
 def get_CellLines():
     return jsonify(cell_lines_list())
 
 
-@app.route('/getChromosList', methods=['POST'])
+@app.route('/getDatasetCatalog', methods=['GET'])
+@conditional
+def get_DatasetCatalog():
+    return jsonify(dataset_catalog())
+
+
+@app.route('/getChromosList', methods=['GET', 'POST'])
+@conditional
 def get_ChromosList():
-    cell_line = request.json['cell_line']
+    cell_line = lookup_field('cell_line')
     return jsonify(chromosomes_list(cell_line))
 
 
-@app.route('/getChromosSize', methods=['POST'])
+@app.route('/getChromosSize', methods=['GET', 'POST'])
+@conditional
 def get_ChromosSize():
-    chromosome_name = request.json['chromosome_name']
+    chromosome_name = lookup_field('chromosome_name')
     return jsonify(chromosome_size(chromosome_name))
 
 
@@ -50,7 +253,24 @@ def get_ChromosData():
     cell_line = request.json['cell_line']
     chromosome_name = request.json['chromosome_name']
     sequences = request.json['sequences']
-    return jsonify(chromosome_data(cell_line, chromosome_name, sequences))
+    if wants_columnar():
+        return columnar_response(*chromosome_data_columns(cell_line, chromosome_name, sequences))
+    if wants_stream():
+        return stream_json_array(chromosome_data_chunks(cell_line, chromosome_name, sequences, precision=requested_precision()))
+    return jsonify(chromosome_data(cell_line, chromosome_name, sequences, requested_precision()))
+
+@app.route('/getChromosDataByZoom', methods=['POST'])
+def get_ChromosDataByZoom():
+    cell_line = request.json['cell_line']
+    chromosome_name = request.json['chromosome_name']
+    sequences = request.json['sequences']
+    bins = requested_positive_int('bins') or requested_positive_int('pixels') or PYRAMID_MAX_BINS
+    aggregate = request.json.get('aggregate', 'sum')
+    if not isinstance(aggregate, str) or aggregate not in ZOOM_AGGREGATES:
+        raise BadRequest(f'aggregate must be one of {", ".join(ZOOM_AGGREGATES)}')
+    if wants_columnar():
+        return columnar_response(*chromosome_data_at_zoom_columns(cell_line, chromosome_name, sequences, bins, aggregate))
+    return jsonify(chromosome_data_at_zoom(cell_line, chromosome_name, sequences, bins, aggregate))
 
 @app.route('/getChromosValidIBPData', methods=['POST'])
 def get_ChromosValidIBPData():
@@ -59,38 +279,141 @@ def get_ChromosValidIBPData():
     sequences = request.json['sequences']
     return jsonify(chromosome_valid_ibp_data(cell_line, chromosome_name, sequences))
 
+@app.route('/getChromosRegionData', methods=['POST'])
+def get_ChromosRegionData():
+    cell_line = request.json['cell_line']
+    chromosome_name = request.json['chromosome_name']
+    sequences = request.json['sequences']
+    return jsonify(chromosome_region_data(cell_line, chromosome_name, sequences, requested_precision()))
+
 @app.route('/getExampleChromos3DData', methods=['POST'])
 def get_ExampleChromos3DData():
     cell_line = request.json['cell_line']
     chromosome_name = request.json['chromosome_name']
     sequences = request.json['sequences']
     sample_id = request.json['sample_id']
-    return jsonify(example_chromosome_3d_data(cell_line, chromosome_name, sequences, sample_id))
+    if wants_columnar():
+        return columnar_response(*example_chromosome_3d_columns(cell_line, chromosome_name, sequences, sample_id))
+    return jsonify(example_chromosome_3d_data(cell_line, chromosome_name, sequences, sample_id, requested_precision()))
 
 
-@app.route('/getComparisonCellLineList', methods=['POST'])
-def get_ComparisonCellLines():
+@app.route('/getStructureDistances', methods=['POST'])
+def get_StructureDistances():
     cell_line = request.json['cell_line']
+    chromosome_name = request.json['chromosome_name']
+    sequences = request.json['sequences']
+    n_samples, sample_ids, cutoff = requested_ensemble()
+    try:
+        sample_ids, folding = distance_samples(cell_line, chromosome_name, sequences, n_samples, sample_ids)
+        # Samples that are not folded yet are folded in the background; poll /getFoldingJob/<id> and ask again
+        if folding is not None:
+            return jsonify(folding), 202
+        fields, columns = structure_distance_columns(cell_line, chromosome_name, sequences, sample_ids, cutoff)
+    except LookupError as error:
+        return jsonify({'error': str(error)}), 404
+    return columnar_response(fields, columns)
+
+
+@app.route('/submitFoldingJob', methods=['POST'])
+def submitFoldingJob():
+    cell_line = request.json['cell_line']
+    chromosome_name = request.json['chromosome_name']
+    sequences = request.json['sequences']
+    n_samples = request.json.get('n_samples')
+    return jsonify(submit_folding_job(cell_line, chromosome_name, sequences, n_samples)), 202
+
+
+@app.route('/getFoldingJob/<job_id>', methods=['GET'])
+def getFoldingJob(job_id):
+    status = folding_job_status(job_id)
+    if status is None:
+        return jsonify({'error': 'Unknown folding job'}), 404
+    return jsonify(status)
+
+
+@app.route('/getStructureCacheStats', methods=['GET'])
+def getStructureCacheStats():
+    return jsonify(structure_cache_stats())
+
+
+@app.route('/getFoldingJobStats', methods=['GET'])
+def getFoldingJobStats():
+    return jsonify(folding_jobs_stats())
+
+
+@app.route('/getComparisonCellLineList', methods=['GET', 'POST'])
+@conditional
+def get_ComparisonCellLines():
+    cell_line = lookup_field('cell_line')
     return jsonify(comparison_cell_line_list(cell_line))
 
 
+@app.route('/getComparisonRegionData', methods=['POST'])
+def get_ComparisonRegionData():
+    cell_lines = request.json['cell_lines']
+    chromosome_name = request.json['chromosome_name']
+    sequences = request.json['sequences']
+    sample_id = request.json.get('sample_id')
+    # The parts of every cell line to return, e.g. ["structure", "valid_ibp"] to skip the contacts
+    include = request.json.get('include', list(COMPARISON_PARTS))
+    if not isinstance(include, list) or not all(part in COMPARISON_PARTS for part in include):
+        raise BadRequest(f'include must be a list of {", ".join(COMPARISON_PARTS)}')
+    if wants_columnar():
+        return columnar_response(*comparison_region_columns(cell_lines, chromosome_name, sequences, sample_id, include))
+    return jsonify(comparison_region_data(cell_lines, chromosome_name, sequences, sample_id, include))
+
+
 @app.route('/getGeneList', methods=['POST'])
 def get_GeneList():
     chromosome_name = request.json['chromosome_name']
     sequences = request.json['sequences']
-    return jsonify(gene_list(chromosome_name, sequences))
+    return jsonify(gene_list(chromosome_name, sequences, requested_precision()))
 
 @app.route('/getepigeneticTrackData', methods=['POST'])
 def get_epigeneticTrackData():
     cell_line = request.json['cell_line']
     chromosome_name = request.json['chromosome_name']
     sequences = request.json['sequences']
-    return jsonify(epigenetic_track_data(cell_line, chromosome_name, sequences))
+    # With a bin count, per-bin summaries of every mark (raw peaks once zoomed in)
+    bins = requested_positive_int('bins')
+    if bins is not None:
+        if wants_columnar():
+            return columnar_response(*epigenetic_track_summary_columns(cell_line, chromosome_name, sequences, bins))
+        return jsonify(epigenetic_track_summary(cell_line, chromosome_name, sequences, bins, requested_precision()))
+    if wants_columnar():
+        return columnar_response(*epigenetic_track_columns(cell_line, chromosome_name, sequences))
+    if wants_stream():
+        return stream_json_groups(epigenetic_track_chunks(cell_line, chromosome_name, sequences, precision=requested_precision()))
+    return jsonify(epigenetic_track_data(cell_line, chromosome_name, sequences, requested_precision()))
 
 @app.route('/geneListSearch', methods=['POST'])
 def geneListSearch():
     search = request.json['search']
-    return jsonify(gene_names_list_search(search))
+    limit = requested_positive_int('limit', GENE_SEARCH_LIMIT)
+    if not isinstance(search, str):
+        raise BadRequest('search must be a string')
+    return jsonify(gene_names_list_search(search, limit))
+
+
+@app.route('/getPoolStats', methods=['GET'])
+def get_PoolStats():
+    return jsonify(db_pool_stats())
+
+
+@app.route('/getCacheStats', methods=['GET'])
+def get_CacheStats():
+    return jsonify(metadata_cache.stats())
+
+
+@app.route('/getRegionMemoStats', methods=['GET'])
+def get_RegionMemoStats():
+    return jsonify(region_memo_stats())
+
+
+@app.route('/metrics', methods=['GET'])
+def get_Metrics():
+    body, content_type = exposition()
+    return Response(body, content_type=content_type)
 
 
 if __name__ == "__main__":
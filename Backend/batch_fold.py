@@ -0,0 +1,166 @@
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from process import FOLDING_SAMPLES, db_connection, fold_region, get_gene_index
+
+BATCH_FOLD_STATE = os.getenv("BATCH_FOLD_STATE", "../Example_Data/batch_fold_state.jsonl")
+
+SEQUENCE_RANGES_QUERY = """
+    SELECT cell_line, chrID, start_value, end_value
+    FROM sequence
+    ORDER BY cell_line, chrID, start_value
+"""
+
+
+def region_key(region):
+    return f"{region['cell_line']}.{region['chrid']}.{region['start']}.{region['end']}"
+
+
+def regions_from_file(path):
+    """Read regions from a CSV/TSV file with cell_line, chrid, start, end columns."""
+    with open(path, newline="") as f:
+        dialect = csv.Sniffer().sniff(f.read(4096), delimiters=",\t")
+        f.seek(0)
+        return [
+            {"cell_line": row["cell_line"], "chrid": row["chrid"], "start": int(row["start"]), "end": int(row["end"])}
+            for row in csv.DictReader(f, dialect=dialect)
+        ]
+
+
+def sequence_ranges(cell_lines=None):
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(SEQUENCE_RANGES_QUERY)
+        rows = cur.fetchall()
+    return [row for row in rows if not cell_lines or row["cell_line"] in cell_lines]
+
+
+def tiled_regions(tile_size, cell_lines=None):
+    """Tile every sequence range of the (selected) cell lines into windows of tile_size bp."""
+    regions = []
+    for row in sequence_ranges(cell_lines):
+        for start in range(row["start_value"], row["end_value"], tile_size):
+            end = min(start + tile_size, row["end_value"])
+            regions.append({"cell_line": row["cell_line"], "chrid": row["chrid"], "start": start, "end": end})
+    return regions
+
+
+def gene_regions(symbols, flank, cell_lines=None):
+    """The locus of each gene (plus flank bp on both sides), clipped to the sequence range containing it."""
+    index = get_gene_index()
+    ranges = sequence_ranges(cell_lines)
+    regions = []
+    for symbol in symbols:
+        gene = index.lookup(symbol)
+        if gene is None:
+            print(f"Gene {symbol} not found, skipping.")
+            continue
+        chrid = "chr" + gene["chromosome"]
+        for row in ranges:
+            if row["chrid"] == chrid and row["start_value"] <= gene["start_location"] <= row["end_value"]:
+                regions.append({
+                    "cell_line": row["cell_line"],
+                    "chrid": chrid,
+                    "start": max(row["start_value"], gene["start_location"] - flank),
+                    "end": min(row["end_value"], gene["end_location"] + flank),
+                })
+    return regions
+
+
+def load_state(path):
+    """Return the regions recorded as finished (folded, or without contacts) by earlier runs."""
+    finished = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    if record["status"] in ("done", "empty"):
+                        previous = finished.get(record["key"])
+                        if previous is None or previous["n_samples"] < record["n_samples"]:
+                            finished[record["key"]] = record
+    return finished
+
+
+def run_batch(regions, n_samples, cores, jobs, state_path):
+    """
+    Fold the regions, `jobs` at a time, giving each sBIF run cores // jobs threads.
+
+    Every finished region is appended to the state file, so an interrupted batch resumes
+    where it stopped; fold_region also skips regions that already have n_samples samples.
+    """
+    finished = load_state(state_path)
+    pending = list({
+        region_key(region): region
+        for region in regions
+        if region_key(region) not in finished or finished[region_key(region)]["n_samples"] < n_samples
+    }.values())
+    print(f"{len(regions)} regions, {len(regions) - len(pending)} already finished, {len(pending)} to fold.")
+    if not pending:
+        return
+
+    jobs = max(1, min(jobs, len(pending), cores))
+    threads = max(1, cores // jobs)
+    print(f"Folding with {jobs} concurrent jobs x {threads} threads (core budget {cores}).")
+
+    os.makedirs(os.path.dirname(os.path.abspath(state_path)), exist_ok=True)
+    state_lock = threading.Lock()
+    started = time.perf_counter()
+
+    def fold(region):
+        region_started = time.perf_counter()
+        sequences = {"start": region["start"], "end": region["end"]}
+        folded = fold_region(region["cell_line"], region["chrid"], sequences, n_samples, threads=threads)
+        return "done" if folded else "empty", time.perf_counter() - region_started
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor, open(state_path, "a") as state_file:
+        futures = {executor.submit(fold, region): region for region in pending}
+        for count, future in enumerate(as_completed(futures), start=1):
+            region = futures[future]
+            try:
+                status, elapsed = future.result()
+                error = None
+            except Exception as e:
+                status, elapsed, error = "failed", None, str(e)
+
+            with state_lock:
+                state_file.write(json.dumps({
+                    "key": region_key(region), "status": status, "n_samples": n_samples,
+                    "elapsed": elapsed, "error": error, "finished_at": time.time(),
+                }) + "\n")
+                state_file.flush()
+            print(f"[{count}/{len(pending)}] {region_key(region)}: {status}" + (f" ({error})" if error else ""))
+
+    print(f"Batch finished in {time.perf_counter() - started:.1f}s.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-fold regions with sBIF ahead of requests.")
+    parser.add_argument("--regions", help="CSV/TSV file with cell_line, chrid, start, end columns")
+    parser.add_argument("--tile", type=int, help="tile every sequence range into windows of this many bp")
+    parser.add_argument("--genes", help="comma-separated gene symbols to fold the loci of")
+    parser.add_argument("--flank", type=int, default=100000, help="bp added on both sides of a gene locus")
+    parser.add_argument("--cell-lines", help="comma-separated cell lines for --tile and --genes (default: all)")
+    parser.add_argument("--samples", type=int, default=FOLDING_SAMPLES, help="samples per region")
+    parser.add_argument("--cores", type=int, default=os.cpu_count(), help="total core budget")
+    parser.add_argument("--jobs", type=int, default=4, help="regions folded at the same time")
+    parser.add_argument("--state", default=BATCH_FOLD_STATE, help="completion log used to resume")
+    args = parser.parse_args()
+
+    cell_lines = set(args.cell_lines.split(",")) if args.cell_lines else None
+    regions = []
+    if args.regions:
+        regions += regions_from_file(args.regions)
+    if args.tile:
+        regions += tiled_regions(args.tile, cell_lines)
+    if args.genes:
+        regions += gene_regions([symbol.strip() for symbol in args.genes.split(",") if symbol.strip()], args.flank, cell_lines)
+    if not regions:
+        parser.error("no regions: give --regions, --tile and/or --genes")
+
+    run_batch(regions, args.samples, args.cores, args.jobs, args.state)
@@ -0,0 +1,391 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import string
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import psycopg2
+from psycopg2 import sql
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_WINDOWS = "100000,500000,1000000,2000000,4000000"
+
+# Written next to a generated dataset, so --reuse reports the scale it was generated at
+SCALE_FILE = "benchmark_scale.json"
+
+
+def generate_dataset(root, cell_lines, chromosomes, chromosome_size, contacts, genes, peaks, marks, resolution, seed):
+    """
+    Write a synthetic dataset in the layout init_db.py loads from ROOT_DIR.
+
+    Contacts are drawn on the resolution grid with a distance that decays like a power law
+    (most contacts are close to the diagonal, as in real Hi-C). ``contacts`` and ``peaks``
+    are per cell line and chromosome, ``genes`` per chromosome.
+    """
+    rng = np.random.default_rng(seed)
+    chromosome_names = [f"chr{index + 1}" for index in range(chromosomes)]
+    cell_line_names = [f"CL{index + 1}" for index in range(cell_lines)]
+    for folder in ("refined_processed_HiC", "seqs", "epigenetic_tracks"):
+        os.makedirs(os.path.join(root, folder), exist_ok=True)
+
+    with open(os.path.join(root, "chromosome_sizes.txt"), "w") as f:
+        for chromosome in chromosome_names:
+            f.write(f"{chromosome}\t{chromosome_size}\n")
+
+    n_bins = chromosome_size // resolution
+    for cell_line in cell_line_names:
+        frames = []
+        for chromosome in chromosome_names:
+            ibin = rng.integers(0, n_bins, contacts)
+            jbin = np.minimum(ibin + rng.zipf(1.3, contacts) - 1, n_bins - 1)
+            pairs = np.unique(np.column_stack([ibin, jbin]), axis=0)
+            frames.append(pd.DataFrame({
+                "chr": chromosome,
+                "cell_line": cell_line,
+                "ibp": pairs[:, 0] * resolution,
+                "jbp": pairs[:, 1] * resolution,
+                "fq": rng.lognormal(1.0, 0.75, len(pairs)).round(6),
+                "fdr": rng.beta(0.5, 5.0, len(pairs)).round(6),
+            }))
+        pd.concat(frames).to_csv(
+            os.path.join(root, "refined_processed_HiC", f"{cell_line}_contacts.csv.gz"), index=False, compression="gzip"
+        )
+
+        pd.DataFrame({
+            "chrID": chromosome_names,
+            "cell_line": cell_line,
+            "start_value": 0,
+            "end_value": chromosome_size,
+        }).to_csv(os.path.join(root, "seqs", f"{cell_line}_seqs.csv.gz"), index=False, compression="gzip")
+
+        for mark in marks:
+            frames = []
+            for chromosome in chromosome_names:
+                starts = np.sort(rng.integers(0, chromosome_size - 2000, peaks))
+                frames.append(pd.DataFrame({
+                    "chrom": chromosome,
+                    "start": starts,
+                    "end": starts + rng.integers(200, 2000, peaks),
+                    "name": [f"peak{index}" for index in range(peaks)],
+                    "score": rng.integers(0, 1000, peaks),
+                    "strand": ".",
+                    "signal_value": rng.gamma(2.0, 10.0, peaks).round(4),
+                    "p_value": rng.exponential(5.0, peaks).round(4),
+                    "q_value": rng.exponential(4.0, peaks).round(4),
+                    "peak": rng.integers(0, 200, peaks),
+                }))
+            pd.concat(frames).to_csv(
+                os.path.join(root, "epigenetic_tracks", f"{cell_line}_{mark}.bed.gz"),
+                sep="\t", header=False, index=False, compression="gzip",
+            )
+
+    letters = np.array(list(string.ascii_uppercase))
+    symbols = set()
+    while len(symbols) < genes * chromosomes:
+        symbols.add("".join(rng.choice(letters, rng.integers(2, 6))) + str(rng.integers(1, 20)))
+    symbols = sorted(symbols)
+    rng.shuffle(symbols)
+    starts = rng.integers(0, chromosome_size - 200000, len(symbols))
+    pd.DataFrame({
+        "Gene ID": np.arange(1, len(symbols) + 1),
+        "Name": [f"synthetic gene {symbol}" for symbol in symbols],
+        "Symbol": symbols,
+        "Chromosome": [chromosome_names[index // genes][3:] for index in range(len(symbols))],
+        "Begin": starts,
+        "End": starts + rng.integers(1000, 200000, len(symbols)),
+    }).to_csv(os.path.join(root, "ncbi_dataset.tsv"), sep="\t", index=False)
+
+    return cell_line_names, chromosome_names, symbols
+
+
+def admin_connection():
+    conn = psycopg2.connect(
+        host=os.getenv("DB_HOST"), user=os.getenv("DB_USERNAME"), password=os.getenv("DB_PASSWORD"), database="postgres"
+    )
+    conn.autocommit = True
+    return conn
+
+
+def database_exists(name):
+    conn = admin_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT EXISTS (SELECT 1 FROM pg_database WHERE datname = %s);", (name,))
+    exists = cur.fetchone()[0]
+    conn.close()
+    return exists
+
+
+def create_database(name):
+    conn = admin_connection()
+    conn.cursor().execute(sql.SQL("CREATE DATABASE {};").format(sql.Identifier(name)))
+    conn.close()
+
+
+def drop_database(name):
+    conn = admin_connection()
+    conn.cursor().execute(sql.SQL("DROP DATABASE IF EXISTS {} WITH (FORCE);").format(sql.Identifier(name)))
+    conn.close()
+
+
+def configure_environment(database, data_dir, memo):
+    """Point init_db.py and process.py (imported after this) at the benchmark database and data directory."""
+    os.environ.update({
+        "DB_NAME": database,
+        "DATA_DIR": data_dir,
+        "INTERVAL_INDEX_DIR": os.path.join(data_dir, "interval_index"),
+        "DATA_VERSION_FILE": os.path.join(data_dir, ".data_version"),
+        "CONTACT_STORE_DIR": os.path.join(data_dir, "contact_store"),
+    })
+    if not memo:
+        # Every timed call must scan; the region memo would turn repeated windows into hits
+        os.environ["REGION_MEMO_SIZE"] = "0"
+
+
+def load_dataset():
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "init_db.py"], cwd=BACKEND_DIR, check=True)
+    return time.perf_counter() - started
+
+
+def result_size(result):
+    """Return (rows, payload bytes) of a query result, serialized the way the API sends it."""
+    from columnar import encode_columns
+
+    if isinstance(result, tuple):
+        fields, columns = result
+        rows = fields.get("count", max((len(values) for values in columns.values()), default=0))
+        return int(rows), len(encode_columns(fields, columns))
+    return count_rows(result), len(json.dumps(result).encode())
+
+
+def count_rows(result):
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, dict):
+        return sum(count_rows(value) for value in result.values() if isinstance(value, (list, dict)))
+    return 1
+
+
+def query_functions(process, cell_lines):
+    """Benchmarked functions: name -> call(cell_line, chromosome, sequences)."""
+    return {
+        "chromosome_data": process.chromosome_data,
+        "chromosome_data_columns": process.chromosome_data_columns,
+        "chromosome_valid_ibp_data": process.chromosome_valid_ibp_data,
+        "chromosome_data_at_zoom_columns": lambda cell_line, chromosome, sequences: process.chromosome_data_at_zoom_columns(
+            cell_line, chromosome, sequences, process.PYRAMID_MAX_BINS
+        ),
+        "comparison_region_columns": lambda cell_line, chromosome, sequences: process.comparison_region_columns(
+            cell_lines, chromosome, sequences
+        ),
+        "gene_list": lambda cell_line, chromosome, sequences: process.gene_list(chromosome[3:], sequences),
+        "epigenetic_track_data": process.epigenetic_track_data,
+        "epigenetic_track_columns": process.epigenetic_track_columns,
+    }
+
+
+def summarize(function, window, timings, sizes):
+    timings = np.array(timings) * 1000
+    rows = np.array([size[0] for size in sizes])
+    payload = np.array([size[1] for size in sizes])
+    return {
+        "function": function,
+        "window": window,
+        "runs": len(timings),
+        "p50_ms": round(float(np.percentile(timings, 50)), 3),
+        "p95_ms": round(float(np.percentile(timings, 95)), 3),
+        "mean_ms": round(float(timings.mean()), 3),
+        "max_ms": round(float(timings.max()), 3),
+        "rows_mean": round(float(rows.mean()), 1),
+        "bytes_mean": round(float(payload.mean()), 1),
+    }
+
+
+def time_calls(call, arguments):
+    timings, sizes = [], []
+    for args in arguments:
+        started = time.perf_counter()
+        result = call(*args)
+        timings.append(time.perf_counter() - started)
+        sizes.append(result_size(result))
+    return timings, sizes
+
+
+def run_benchmark(windows, repeats, seed, functions=None):
+    """Time every query function over `repeats` random windows of each width; return the result rows."""
+    import process
+
+    rng = np.random.default_rng(seed)
+    with process.db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT cell_line, chrID, start_value, end_value FROM sequence ORDER BY cell_line, chrID, start_value;")
+        ranges = cur.fetchall()
+    cell_lines = sorted({row["cell_line"] for row in ranges})
+    calls = query_functions(process, cell_lines)
+    if functions:
+        calls = {name: call for name, call in calls.items() if name in functions}
+
+    results = []
+    for window in windows:
+        arguments = []
+        for _ in range(repeats):
+            row = ranges[rng.integers(len(ranges))]
+            width = min(window, row["end_value"] - row["start_value"])
+            start = int(rng.integers(row["start_value"], row["end_value"] - width + 1))
+            arguments.append((row["cell_line"], row["chrid"], {"start": start, "end": start + width}))
+
+        for name, call in calls.items():
+            call(*arguments[0])  # warm up pools, indexes and mappings
+            timings, sizes = time_calls(call, arguments)
+            results.append(summarize(name, window, timings, sizes))
+            print(f"{name:34} {window:>10,} bp  p50 {results[-1]['p50_ms']:9.2f} ms  p95 {results[-1]['p95_ms']:9.2f} ms  "
+                  f"{results[-1]['rows_mean']:>10,.0f} rows  {results[-1]['bytes_mean']:>12,.0f} bytes")
+
+    if not functions or "gene_names_list_search" in functions:
+        symbols = process.get_gene_index().symbols
+        terms = []
+        for _ in range(repeats):
+            symbol = symbols[rng.integers(len(symbols))]
+            length = int(rng.integers(1, min(len(symbol), 4) + 1))
+            start = int(rng.integers(0, len(symbol) - length + 1))
+            terms.append((symbol[start:start + length].lower(),))
+        process.gene_names_list_search(*terms[0])
+        timings, sizes = time_calls(process.gene_names_list_search, terms)
+        results.append(summarize("gene_names_list_search", None, timings, sizes))
+        print(f"{'gene_names_list_search':34} {'-':>10}     p50 {results[-1]['p50_ms']:9.2f} ms  p95 {results[-1]['p95_ms']:9.2f} ms")
+
+    return results
+
+
+def compare(results, baseline_path, threshold):
+    """Print the p50/p95 ratios against an earlier run; return the entries slower than threshold x."""
+    with open(baseline_path) as f:
+        baseline = {(entry["function"], entry["window"]): entry for entry in json.load(f)["results"]}
+
+    regressions = []
+    print(f"\nCompared with {baseline_path} (regression: p50 or p95 above {threshold:.2f}x):")
+    for entry in results:
+        previous = baseline.get((entry["function"], entry["window"]))
+        if previous is None:
+            continue
+        p50 = entry["p50_ms"] / previous["p50_ms"] if previous["p50_ms"] else float("inf")
+        p95 = entry["p95_ms"] / previous["p95_ms"] if previous["p95_ms"] else float("inf")
+        slower = p50 > threshold or p95 > threshold
+        if slower:
+            regressions.append(entry)
+        print(f"{entry['function']:34} {entry['window'] or '-':>10}  p50 {p50:5.2f}x  p95 {p95:5.2f}x{'  REGRESSION' if slower else ''}")
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the process.py queries on a synthetic dataset in a throwaway database.")
+    parser.add_argument("--database", default="chrompolymer_benchmark", help="throwaway database (created and dropped)")
+    parser.add_argument("--data-dir", help="where the synthetic dataset is written (default: a temporary directory)")
+    parser.add_argument("--reuse", action="store_true", help="benchmark an existing --database/--data-dir without generating or loading")
+    parser.add_argument("--keep", action="store_true", help="keep the database and dataset afterwards")
+    parser.add_argument("--cell-lines", type=int, default=2)
+    parser.add_argument("--chromosomes", type=int, default=2)
+    parser.add_argument("--chromosome-size", type=int, default=20000000, help="bp per chromosome")
+    parser.add_argument("--contacts", type=int, default=200000, help="contacts per cell line and chromosome")
+    parser.add_argument("--genes", type=int, default=1000, help="genes per chromosome")
+    parser.add_argument("--peaks", type=int, default=5000, help="epigenetic peaks per track and chromosome")
+    parser.add_argument("--marks", default="CTCF,H3K27ac", help="comma-separated epigenetic marks per cell line")
+    parser.add_argument("--windows", default=DEFAULT_WINDOWS, help="comma-separated window widths in bp")
+    parser.add_argument("--repeats", type=int, default=20, help="random windows timed per width")
+    parser.add_argument("--functions", help="comma-separated subset of the benchmarked functions")
+    parser.add_argument("--memo", action="store_true", help="keep the region memo enabled")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark.json", help="JSON results file")
+    parser.add_argument("--compare", help="earlier results file; exit with status 1 on a regression")
+    parser.add_argument("--threshold", type=float, default=1.2, help="slowdown ratio reported as a regression")
+    args = parser.parse_args()
+
+    if args.reuse and not args.data_dir:
+        parser.error("--reuse needs the --data-dir of the earlier run")
+    if not args.reuse and database_exists(args.database):
+        parser.error(f"database {args.database} already exists; drop it, pick another --database or pass --reuse")
+
+    data_dir = os.path.abspath(args.data_dir or tempfile.mkdtemp(prefix="chrompolymer-benchmark-"))
+    configure_environment(args.database, data_dir, args.memo)
+    meta = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "host": platform.node(),
+        "contact_backend": os.getenv("CONTACT_BACKEND", "postgres"),
+        "region_memo": args.memo,
+        "scale": {
+            "cell_lines": args.cell_lines,
+            "chromosomes": args.chromosomes,
+            "chromosome_size": args.chromosome_size,
+            "contacts": args.contacts,
+            "genes": args.genes,
+            "peaks": args.peaks,
+            "marks": args.marks.split(","),
+        },
+        "repeats": args.repeats,
+        "seed": args.seed,
+    }
+
+    created = False
+    try:
+        if args.reuse:
+            with open(os.path.join(data_dir, SCALE_FILE)) as f:
+                meta["scale"] = json.load(f)
+        else:
+            started = time.perf_counter()
+            generate_dataset(
+                data_dir, args.cell_lines, args.chromosomes, args.chromosome_size, args.contacts, args.genes,
+                args.peaks, args.marks.split(","), int(os.getenv("HIC_RESOLUTION", 5000)), args.seed,
+            )
+            meta["generate_seconds"] = round(time.perf_counter() - started, 2)
+            with open(os.path.join(data_dir, SCALE_FILE), "w") as f:
+                json.dump(meta["scale"], f)
+            print(f"Synthetic dataset written to {data_dir} in {meta['generate_seconds']}s.")
+
+            create_database(args.database)
+            created = True
+            meta["load_seconds"] = round(load_dataset(), 2)
+            print(f"Loaded into {args.database} in {meta['load_seconds']}s.")
+
+        windows = [int(window) for window in args.windows.split(",")]
+        functions = set(args.functions.split(",")) if args.functions else None
+        results = run_benchmark(windows, args.repeats, args.seed, functions)
+
+        with open(args.output, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+        print(f"Results written to {args.output}.")
+
+        regressions = compare(results, args.compare, args.threshold) if args.compare else []
+    finally:
+        if not args.keep:
+            if created:
+                if "process" in sys.modules:
+                    sys.modules["process"].get_db_pool().closeall()
+                drop_database(args.database)
+            if not args.reuse:
+                shutil.rmtree(data_dir, ignore_errors=True)
+
+    if regressions:
+        print(f"{len(regressions)} regression(s) above {args.threshold:.2f}x.")
+        sys.exit(1)
@@ -0,0 +1,128 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from metrics import record_cache
+
+# Touched by init_db.py when an ingest finishes; its mtime is the version of the loaded data
+DATA_VERSION_FILE = os.getenv("DATA_VERSION_FILE", "../Example_Data/.data_version")
+
+METADATA_CACHE_TTL = float(os.getenv("METADATA_CACHE_TTL", 3600))
+METADATA_CACHE_SIZE = int(os.getenv("METADATA_CACHE_SIZE", 256))
+
+
+def data_version():
+    """Return (version, last_modified) of the loaded data; ("0", None) before the first ingest stamp."""
+    try:
+        stat = os.stat(DATA_VERSION_FILE)
+    except FileNotFoundError:
+        return "0", None
+    return str(stat.st_mtime_ns), int(stat.st_mtime)
+
+
+def mark_data_changed():
+    """Bump the data version so every process drops its cached metadata."""
+    os.makedirs(os.path.dirname(DATA_VERSION_FILE) or ".", exist_ok=True)
+    with open(DATA_VERSION_FILE, "w") as f:
+        f.write(f"{time.time()}\n")
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire after ``ttl`` seconds or when the data version changes.
+    Concurrent misses on one key share a single load. Lookups are reported to the metrics as ``name``.
+    """
+
+    def __init__(self, maxsize=METADATA_CACHE_SIZE, ttl=METADATA_CACHE_TTL, name="cache"):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (version, expires_at, value)
+        self._loading = {}  # key -> Event set when its loader finishes
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def get_or_load(self, key, loader):
+        """Return the cached value of key, calling loader once for concurrent misses on the same key."""
+        version = data_version()[0]
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    if entry[0] == version and entry[1] > now:
+                        self._entries.move_to_end(key)
+                        self._hits += 1
+                        record_cache(self.name, True)
+                        return entry[2]
+                    del self._entries[key]
+                    self._invalidations += 1
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    self._misses += 1
+                    record_cache(self.name, False)
+                    break
+            # Another caller is loading the same key; use its value (or retry if it failed)
+            loading.wait()
+
+        try:
+            value = loader()
+            with self._lock:
+                self._entries[key] = (version, time.monotonic() + self.ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                    self._evictions += 1
+        finally:
+            with self._lock:
+                del self._loading[key]
+            loading.set()
+        return value
+
+    def peek(self, key):
+        """Return the cached value of key, or None when it is not cached; never loads."""
+        version = data_version()[0]
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version or entry[1] <= time.monotonic():
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+        record_cache(self.name, True)
+        return entry[2]
+
+    def clear(self):
+        with self._lock:
+            self._invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+            }
+
+
+metadata_cache = TTLCache(name="metadata")
+
+
+def cached(func):
+    """Cache a metadata query in ``metadata_cache``, keyed by the function name and its arguments."""
+    @wraps(func)
+    def wrapper(*args):
+        return metadata_cache.get_or_load((func.__name__,) + args, lambda: func(*args))
+    return wrapper
@@ -0,0 +1,93 @@
+import io
+import json
+import struct
+import time
+
+import numpy as np
+from psycopg2 import extensions
+
+from metrics import record_sql
+
+COLUMNAR_MIMETYPE = "application/vnd.chrompolymer.columnar"
+MAGIC = b"CPC1"
+ALIGNMENT = 8
+
+PGCOPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+
+
+def _padding(size):
+    return b"\x00" * (-size % ALIGNMENT)
+
+
+def encode_columns(fields, columns):
+    """
+    Pack shared fields and typed arrays into one binary payload.
+
+    Layout: MAGIC, the header length as little-endian uint32, a UTF-8 JSON header padded
+    with spaces so the data section starts on an 8-byte boundary, then the column buffers,
+    each starting on an 8-byte boundary so the client can view it in place (e.g.
+    ``new Int32Array(buffer, 8 + headerLength + offset, length)``). The header holds
+    ``fields`` plus, per column, its name, little-endian dtype, length and byte offset
+    from the start of the data section.
+    """
+    arrays = []
+    layout = []
+    offset = 0
+    for name, values in columns.items():
+        array = np.ascontiguousarray(values)
+        array = array.astype(array.dtype.newbyteorder("<"), copy=False)
+        arrays.append(array)
+        layout.append({"name": name, "dtype": array.dtype.str, "length": int(array.size), "offset": offset})
+        offset += array.nbytes + (-array.nbytes % ALIGNMENT)
+
+    header = json.dumps({"fields": fields, "columns": layout}, separators=(",", ":")).encode()
+    header += b" " * (-(len(MAGIC) + 4 + len(header)) % ALIGNMENT)
+
+    parts = [MAGIC, struct.pack("<I", len(header)), header]
+    for array in arrays:
+        parts.append(memoryview(array).cast("B"))
+        parts.append(_padding(array.nbytes))
+    return b"".join(parts)
+
+
+def copy_binary_columns(cur, query, params, dtype):
+    """
+    Run a query through ``COPY ... TO STDOUT (FORMAT binary)`` and return its columns as arrays.
+
+    ``dtype`` lists (name, big-endian numpy dtype) for every selected column. All columns
+    must be fixed-width and NOT NULL, so every tuple has the same size and the whole result
+    is decoded with a single ``numpy.frombuffer`` instead of one Python object per row.
+
+    psycopg2 does not allow COPY once a wait callback is installed (the gevent serving
+    mode), so there the query runs as a plain SELECT and the tuples are packed instead.
+    """
+    if extensions.get_wait_callback() is not None:
+        plain = cur.connection.cursor(cursor_factory=extensions.cursor)
+        started = time.perf_counter()
+        plain.execute(query, params)
+        tuples = plain.fetchall()
+        record_sql(time.perf_counter() - started, rows=len(tuples), statements=1)
+        native = np.dtype([(name, np.dtype(column_dtype).newbyteorder("=")) for name, column_dtype in dtype])
+        rows = np.array(tuples, dtype=native)
+        plain.close()
+        return {name: np.ascontiguousarray(rows[name]) for name, _ in dtype}
+
+    fields = [("field_count", ">i2")]
+    for name, column_dtype in dtype:
+        fields.append((name + "_length", ">i4"))
+        fields.append((name, column_dtype))
+    row_dtype = np.dtype(fields)
+
+    buffer = io.BytesIO()
+    cur.copy_expert("COPY (%s) TO STDOUT WITH (FORMAT binary)" % cur.mogrify(query, params).decode(), buffer)
+    data = buffer.getbuffer()
+
+    if bytes(data[:len(PGCOPY_SIGNATURE)]) != PGCOPY_SIGNATURE:
+        raise ValueError("Unexpected COPY binary signature")
+    extension_length = struct.unpack(">I", data[15:19])[0]
+    start = 19 + extension_length
+    count = (len(data) - start - 2) // row_dtype.itemsize
+
+    rows = np.frombuffer(data, dtype=row_dtype, count=count, offset=start)
+    record_sql(0.0, rows=count)
+    return {name: rows[name].astype(np.dtype(column_dtype).newbyteorder("=")) for name, column_dtype in dtype}
@@ -0,0 +1,149 @@
+import json
+import os
+import re
+import shutil
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+CONTACT_STORE_DIR = os.getenv("CONTACT_STORE_DIR", "../Example_Data/contact_store")
+
+# Column name -> on-disk dtype; bp positions fit in int32 for every human chromosome
+CONTACT_DTYPES = {"ibp": np.int32, "jbp": np.int32, "fq": np.float64, "fdr": np.float64}
+
+SOURCES_FILE = "_sources.json"
+NAME_PATTERN = re.compile(r"^[\w.-]+$")
+
+
+def _matrix_dir(store_dir, cell_line, chromosome_name):
+    if not NAME_PATTERN.match(cell_line) or not NAME_PATTERN.match(chromosome_name):
+        raise ValueError(f"Invalid cell line or chromosome name: {cell_line!r}, {chromosome_name!r}")
+    return os.path.join(store_dir, cell_line, chromosome_name)
+
+
+class ContactMatrix:
+    """
+    Sparse contact matrix of one (cell_line, chrID), stored as sorted COO arrays.
+
+    Contacts are sorted by (ibp, jbp), so the rows of a region are one contiguous ibp slice
+    found by binary search; only the jbp bound needs a mask. The arrays are opened with
+    numpy memory-mapping, so they are shared through the page cache by every worker.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.columns = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in CONTACT_DTYPES
+        }
+
+    def __len__(self):
+        return len(self.columns["ibp"])
+
+    def region(self, start, end):
+        """Return the contacts with start <= ibp, jbp <= end as arrays (views when no jbp filtering is needed)."""
+        ibp = self.columns["ibp"]
+        lo = int(np.searchsorted(ibp, start, side="left"))
+        hi = int(np.searchsorted(ibp, end, side="right"))
+        jbp = self.columns["jbp"][lo:hi]
+        mask = (jbp >= start) & (jbp <= end)
+
+        if mask.all():
+            return {name: column[lo:hi] for name, column in self.columns.items()}
+        return {name: column[lo:hi][mask] for name, column in self.columns.items()}
+
+
+class ContactStore:
+    """Directory of ContactMatrix files, one per (cell_line, chrID), opened lazily and kept open."""
+
+    def __init__(self, store_dir=CONTACT_STORE_DIR):
+        self.store_dir = store_dir
+        self._matrices = {}
+        self._lock = threading.Lock()
+
+    def matrix(self, cell_line, chromosome_name):
+        key = (cell_line, chromosome_name)
+        with self._lock:
+            if key not in self._matrices:
+                path = _matrix_dir(self.store_dir, cell_line, chromosome_name)
+                self._matrices[key] = ContactMatrix(path) if os.path.isdir(path) else None
+            return self._matrices[key]
+
+    def region(self, cell_line, chromosome_name, start, end):
+        """Return the contacts of a region as arrays; empty arrays when the chromosome is not in the store."""
+        matrix = self.matrix(cell_line, chromosome_name)
+        if matrix is None:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in CONTACT_DTYPES.items()}
+        return matrix.region(start, end)
+
+    def clear(self):
+        """Forget the opened matrices so rebuilt files are picked up."""
+        with self._lock:
+            self._matrices = {}
+
+
+def write_matrix(store_dir, cell_line, chromosome_name, columns):
+    """Sort the contacts of one (cell_line, chrID) by (ibp, jbp) and atomically replace its matrix files."""
+    path = _matrix_dir(store_dir, cell_line, chromosome_name)
+    staging = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    order = np.lexsort((columns["jbp"], columns["ibp"]))
+    for name, dtype in CONTACT_DTYPES.items():
+        np.save(os.path.join(staging, f"{name}.npy"), columns[name][order].astype(dtype, copy=False))
+
+    if os.path.isdir(path):
+        retired = f"{path}.old-{os.getpid()}"
+        os.rename(path, retired)
+        os.rename(staging, path)
+        shutil.rmtree(retired)
+    else:
+        os.rename(staging, path)
+
+
+def build_contact_store(source_dir, store_dir=CONTACT_STORE_DIR, chunksize=1000000):
+    """
+    Build the contact store from the refined_processed_HiC files.
+
+    Files whose size and modification time match the previous build are skipped. A file is
+    read once in chunks; all contacts of a (cell_line, chrID) are held in memory until the
+    file is done, then sorted and written.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    sources_path = os.path.join(store_dir, SOURCES_FILE)
+    sources = {}
+    if os.path.exists(sources_path):
+        with open(sources_path) as f:
+            sources = json.load(f)
+
+    for file_name in sorted(os.listdir(source_dir)):
+        if not file_name.endswith(".csv.gz"):
+            continue
+        file_path = os.path.join(source_dir, file_name)
+        stat = os.stat(file_path)
+        previous = sources.get(file_name)
+        if previous and previous["size"] == stat.st_size and previous["mtime"] == stat.st_mtime:
+            print(f"Contact store for {file_name} is up to date, skipping.")
+            continue
+
+        started = time.perf_counter()
+        groups = {}
+        for chunk in pd.read_csv(file_path, usecols=["chr", "cell_line", "ibp", "jbp", "fq", "fdr"], chunksize=chunksize):
+            for (chromosome_name, cell_line), group in chunk.groupby(["chr", "cell_line"], sort=False):
+                parts = groups.setdefault((str(cell_line), str(chromosome_name)), {name: [] for name in CONTACT_DTYPES})
+                for name in CONTACT_DTYPES:
+                    parts[name].append(group[name].to_numpy())
+
+        rows = 0
+        for (cell_line, chromosome_name), parts in groups.items():
+            columns = {name: np.concatenate(arrays) for name, arrays in parts.items()}
+            write_matrix(store_dir, cell_line, chromosome_name, columns)
+            rows += len(columns["ibp"])
+
+        sources[file_name] = {"size": stat.st_size, "mtime": stat.st_mtime, "matrices": sorted(groups)}
+        with open(sources_path + ".tmp", "w") as f:
+            json.dump(sources, f)
+        os.replace(sources_path + ".tmp", sources_path)
+        print(f"Contact store built for {file_name}: {rows} contacts in {len(groups)} matrices, {time.perf_counter() - started:.2f}s.")
@@ -0,0 +1,243 @@
+import os
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the checkout timeout."""
+
+
+class ConnectionPool:
+    """
+    Thread-safe psycopg2 connection pool.
+
+    Connections are health-checked on checkout (a ``SELECT 1`` ping for
+    connections that sat idle longer than ``ping_after`` seconds), rolled back
+    on return, and reported as leaked when held longer than ``leak_timeout``.
+    When all ``maxconn`` connections are checked out, callers wait up to
+    ``checkout_timeout`` seconds; saturation and wait time are kept in
+    ``stats()`` so the pool can be sized against the number of workers.
+    """
+
+    def __init__(
+        self,
+        minconn,
+        maxconn,
+        checkout_timeout=30.0,
+        leak_timeout=120.0,
+        ping_after=30.0,
+        **connect_kwargs,
+    ):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Invalid pool size: minconn=%s maxconn=%s" % (minconn, maxconn))
+
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.checkout_timeout = checkout_timeout
+        self.leak_timeout = leak_timeout
+        self.ping_after = ping_after
+        self.pid = os.getpid()
+        self._connect_kwargs = connect_kwargs
+
+        self._cond = threading.Condition()
+        self._idle = []  # [(conn, returned_at)]
+        self._in_use = {}  # id(conn) -> [conn, checked_out_at, stack, reported]
+        self._waiting = deque()
+        self._size = 0
+        self._closed = False
+
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._peak_in_use = 0
+        self._health_check_failures = 0
+        self._leaks_detected = 0
+
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._size += 1
+
+    def _exhausted_locked(self):
+        return not self._idle and self._size >= self.maxconn
+
+    def _connect(self):
+        return psycopg2.connect(**self._connect_kwargs)
+
+    def _is_healthy(self, conn, idle_for):
+        """Make sure a connection is usable before handing it out."""
+        if conn.closed:
+            return False
+        try:
+            status = conn.get_transaction_status()
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                return False
+            if status != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            if idle_for >= self.ping_after:
+                cur = conn.cursor()
+                cur.execute("SELECT 1")
+                cur.fetchone()
+                cur.close()
+                conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self):
+        """Check a connection out of the pool, waiting if it is saturated."""
+        started = time.monotonic()
+        waited = False
+
+        while True:
+            conn = None
+            idle_since = None
+            with self._cond:
+                if self._closed:
+                    raise PoolError("connection pool is closed")
+                if self._waiting or self._exhausted_locked():
+                    # Queue up behind earlier waiters so checkouts are served in FIFO order
+                    waited = True
+                    ticket = object()
+                    self._waiting.append(ticket)
+                    try:
+                        while self._waiting[0] is not ticket or self._exhausted_locked():
+                            remaining = self.checkout_timeout - (time.monotonic() - started)
+                            if remaining <= 0:
+                                self._timeouts += 1
+                                self._report_leaks_locked()
+                                raise PoolTimeout(
+                                    "No database connection available after %.1fs (max %d in use)"
+                                    % (self.checkout_timeout, self.maxconn)
+                                )
+                            self._cond.wait(remaining)
+                    finally:
+                        self._waiting.remove(ticket)
+                        self._cond.notify_all()
+
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                else:
+                    self._size += 1
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify_all()
+                    raise
+            elif not self._is_healthy(conn, time.monotonic() - idle_since):
+                self._discard(conn)
+                with self._cond:
+                    self._size -= 1
+                    self._health_check_failures += 1
+                continue
+
+            wait = time.monotonic() - started
+            with self._cond:
+                self._in_use[id(conn)] = [conn, time.monotonic(), traceback.format_stack(limit=8)[:-1], False]
+                self._checkouts += 1
+                self._peak_in_use = max(self._peak_in_use, len(self._in_use))
+                if waited:
+                    self._waits += 1
+                    self._total_wait += wait
+                    self._max_wait = max(self._max_wait, wait)
+                self._report_leaks_locked()
+            return conn
+
+    def putconn(self, conn, close=False):
+        """Return a connection to the pool."""
+        with self._cond:
+            if self._in_use.pop(id(conn), None) is None:
+                raise PoolError("trying to put unkeyed connection")
+
+        if not close and not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                close = True
+        else:
+            close = True
+
+        with self._cond:
+            if close or self._closed or len(self._idle) >= self.maxconn:
+                self._discard(conn)
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify_all()
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the duration of a ``with`` block."""
+        conn = self.getconn()
+        try:
+            yield conn
+        except BaseException:
+            # BaseException too: a streaming generator closed early raises GeneratorExit here
+            self.putconn(conn, close=conn.closed != 0)
+            raise
+        else:
+            self.putconn(conn)
+
+    def _report_leaks_locked(self):
+        now = time.monotonic()
+        for entry in self._in_use.values():
+            _, checked_out_at, stack, reported = entry
+            if not reported and now - checked_out_at > self.leak_timeout:
+                entry[3] = True
+                self._leaks_detected += 1
+                print(
+                    "Possible connection leak: connection held for %.0fs, checked out at:\n%s"
+                    % (now - checked_out_at, "".join(stack))
+                )
+
+    def stats(self):
+        """Return a snapshot of pool usage."""
+        with self._cond:
+            self._report_leaks_locked()
+            in_use = len(self._in_use)
+            return {
+                "min_size": self.minconn,
+                "max_size": self.maxconn,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": in_use,
+                "peak_in_use": self._peak_in_use,
+                "saturation": in_use / self.maxconn,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "total_wait_seconds": self._total_wait,
+                "max_wait_seconds": self._max_wait,
+                "avg_wait_seconds": self._total_wait / self._waits if self._waits else 0.0,
+                "health_check_failures": self._health_check_failures,
+                "leaks_detected": self._leaks_detected,
+            }
+
+    def closeall(self):
+        """Close every idle connection and refuse further checkouts."""
+        with self._cond:
+            self._closed = True
+            for conn, _ in self._idle:
+                self._discard(conn)
+            self._size -= len(self._idle)
+            self._idle = []
+            self._cond.notify_all()
@@ -0,0 +1,234 @@
+import fcntl
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Job states; a job is "active" while queued or running
+ACTIVE_STATES = ("queued", "running")
+
+# A submission matching an active job of the same region and size attaches to it (single-flight across workers)
+SUBMIT_QUERY = """
+    INSERT INTO folding_job (job_id, cell_line, chrID, start_value, end_value, n_samples, state, worker, submitted_at)
+    VALUES (%s, %s, %s, %s, %s, %s, 'queued', %s, %s)
+    ON CONFLICT (cell_line, chrID, start_value, end_value, n_samples) WHERE state IN ('queued', 'running')
+    DO UPDATE SET attached = folding_job.attached + 1
+    RETURNING *, (xmax = 0) AS inserted
+"""
+
+JOB_QUERY = """
+    SELECT *
+    FROM folding_job
+    WHERE job_id = %s
+"""
+
+ACTIVE_JOBS_QUERY = """
+    SELECT job_id, worker
+    FROM folding_job
+    WHERE state IN ('queued', 'running')
+"""
+
+START_QUERY = """
+    UPDATE folding_job
+    SET state = 'running', started_at = %s
+    WHERE job_id = %s
+"""
+
+FINISH_QUERY = """
+    UPDATE folding_job
+    SET state = %s, folded = %s, error = %s, finished_at = %s
+    WHERE job_id = %s
+"""
+
+FAIL_ORPHAN_QUERY = """
+    UPDATE folding_job
+    SET state = 'failed', error = %s, finished_at = %s
+    WHERE job_id = %s
+    AND state IN ('queued', 'running')
+"""
+
+PRUNE_QUERY = """
+    DELETE FROM folding_job
+    WHERE finished_at < %s
+"""
+
+STATS_QUERY = """
+    SELECT state, COUNT(*) AS jobs
+    FROM folding_job
+    GROUP BY state
+"""
+
+
+class FoldingJob:
+    """One folding run of a region; ``key`` identifies the region, ``n_samples`` the ensemble size."""
+
+    def __init__(self, row):
+        self.id = row["job_id"]
+        self.key = (row["cell_line"], row["chrid"], row["start_value"], row["end_value"])
+        self.n_samples = row["n_samples"]
+        self.state = row["state"]
+        self.result = row["folded"]
+        self.error = row["error"]
+        self.attached = row["attached"]
+        self.worker = row["worker"]
+        self.submitted_at = row["submitted_at"]
+        self.started_at = row["started_at"]
+        self.finished_at = row["finished_at"]
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "key": list(self.key),
+            "n_samples": self.n_samples,
+            "state": self.state,
+            "error": self.error,
+            "attached": self.attached,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+def _worker_alive(worker):
+    """False when ``worker`` ("host:pid") is a process of this host that no longer exists."""
+    host, _, pid = worker.rpartition(":")
+    if host != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class FoldingJobManager:
+    """
+    Runs folding jobs with single-flight deduplication, keeping their state in the folding_job table.
+
+    Any worker process can report a job, and a submission whose (key, n_samples) matches a queued or
+    running job of any worker attaches to it instead of starting another fold. Jobs run on the thread
+    pool of the worker that submitted them; at most ``max_workers`` fold at a time on the whole host,
+    each holding one of the slot locks in ``slot_dir``. Finished jobs stay queryable for ``retention``
+    seconds, and jobs of workers that exited are reported as failed.
+    """
+
+    def __init__(self, fold, connection, slot_dir, max_workers=2, retention=3600.0, poll=0.5):
+        self._fold = fold
+        self._connection = connection
+        self.slot_dir = slot_dir
+        self.max_workers = max_workers
+        self.retention = retention
+        self.poll = poll
+        self.pid = os.getpid()
+        self.worker = f"{socket.gethostname()}:{self.pid}"
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="folding")
+        # Jobs running in this process, set when they finish
+        self._done = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, n_samples):
+        """Return the job folding (key, n_samples), starting one if none is queued or running."""
+        now = time.time()
+        with self._connection() as conn:
+            cur = conn.cursor()
+            self._fail_orphans(cur)
+            cur.execute(PRUNE_QUERY, (now - self.retention,))
+            cur.execute(SUBMIT_QUERY, (uuid.uuid4().hex,) + tuple(key) + (n_samples, self.worker, now))
+            row = cur.fetchone()
+            conn.commit()
+
+        job = FoldingJob(row)
+        if row["inserted"]:
+            with self._lock:
+                self._done[job.id] = threading.Event()
+            self._executor.submit(self._run, job)
+        return job
+
+    def _run(self, job):
+        result, state, error = None, "failed", None
+        try:
+            with self._slot():
+                self._update(START_QUERY, (time.time(), job.id))
+                result, state = self._fold(job.key, job.n_samples), "done"
+        except Exception as e:
+            error = str(e)
+            print(f"Folding job {job.id} for {job.key} failed: {e}")
+        finally:
+            try:
+                self._update(FINISH_QUERY, (state, result, error, time.time(), job.id))
+            finally:
+                with self._lock:
+                    done = self._done.pop(job.id)
+                done.set()
+
+    def _slot(self):
+        """Wait for one of the max_workers host-wide fold slots; returns the open lock file, which releases it on close."""
+        os.makedirs(self.slot_dir, exist_ok=True)
+        while True:
+            for slot in range(self.max_workers):
+                lock_file = open(os.path.join(self.slot_dir, f"fold-slot-{slot}.lock"), "w")
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return lock_file
+                except BlockingIOError:
+                    lock_file.close()
+            # Poll instead of a blocking flock, which would stall every greenlet of a gevent worker
+            time.sleep(self.poll)
+
+    def _update(self, query, params):
+        with self._connection() as conn:
+            conn.cursor().execute(query, params)
+            conn.commit()
+
+    def _fail_orphans(self, cur):
+        cur.execute(ACTIVE_JOBS_QUERY)
+        for row in cur.fetchall():
+            if not _worker_alive(row["worker"]):
+                cur.execute(FAIL_ORPHAN_QUERY, (f"Worker {row['worker']} exited before the job finished", time.time(), row["job_id"]))
+
+    def get(self, job_id):
+        """Return the job with the given id, whichever worker runs it, or None."""
+        with self._connection() as conn:
+            cur = conn.cursor()
+            cur.execute(JOB_QUERY, (job_id,))
+            row = cur.fetchone()
+            if row is not None and row["state"] in ACTIVE_STATES and not _worker_alive(row["worker"]):
+                self._fail_orphans(cur)
+                conn.commit()
+                cur.execute(JOB_QUERY, (job_id,))
+                row = cur.fetchone()
+        return None if row is None else FoldingJob(row)
+
+    def wait(self, job, timeout=None):
+        """Block until the job has finished (or the timeout passed); refresh ``job`` and return whether it finished."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                done = self._done.get(job.id)
+            current = self.get(job.id)
+            if current is None or current.state not in ACTIVE_STATES:
+                if current is not None:
+                    job.__dict__.update(current.__dict__)
+                return True
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            delay = self.poll if remaining is None else min(self.poll, remaining)
+            # A job of this process wakes the waiter as soon as it finishes; others are polled
+            if done is not None:
+                done.wait(delay)
+            else:
+                time.sleep(delay)
+
+    def stats(self):
+        with self._connection() as conn:
+            cur = conn.cursor()
+            self._fail_orphans(cur)
+            conn.commit()
+            cur.execute(STATS_QUERY)
+            states = {row["state"]: row["jobs"] for row in cur.fetchall()}
+        return {"max_workers": self.max_workers, "jobs": states}
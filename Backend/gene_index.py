@@ -0,0 +1,94 @@
+import bisect
+from collections import defaultdict
+
+NGRAM = 3
+
+
+def _ngrams(text):
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+class GeneIndex:
+    """
+    In-memory index of gene symbols.
+
+    Exact lookups go through a symbol -> coordinates dict. Searches are case-insensitive
+    (like ILIKE) and ranked: exact match, then prefix matches from a sorted array, then
+    substring matches found through a trigram index. Only genes on ``chromosomes`` are
+    searchable (all of them when it is empty); exact lookups cover every gene.
+    """
+
+    def __init__(self, genes, chromosomes=None):
+        # genes: rows with symbol, chromosome, start_location, end_location; the first row of a symbol wins
+        self.coordinates = {}
+        searchable = set()
+        for gene in genes:
+            symbol = gene["symbol"]
+            if symbol not in self.coordinates:
+                self.coordinates[symbol] = {
+                    "chromosome": gene["chromosome"],
+                    "start_location": gene["start_location"],
+                    "end_location": gene["end_location"],
+                }
+            if not chromosomes or gene["chromosome"] in chromosomes:
+                searchable.add(symbol)
+
+        self.symbols = sorted(searchable)
+        self._sorted = sorted((symbol.lower(), symbol) for symbol in searchable)
+        self._keys = [key for key, _ in self._sorted]
+        self._exact = defaultdict(list)
+        self._grams = defaultdict(list)
+        for position, (key, symbol) in enumerate(self._sorted):
+            self._exact[key].append(symbol)
+            for gram in _ngrams(key):
+                self._grams[gram].append(position)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def lookup(self, symbol):
+        """Return the coordinates of a symbol, or None."""
+        return self.coordinates.get(symbol)
+
+    def _substring_positions(self, key):
+        if len(key) < NGRAM:
+            return [position for position, candidate in enumerate(self._keys) if key in candidate]
+
+        # Intersect the posting lists, smallest first, then confirm the candidates
+        postings = sorted((self._grams.get(gram, []) for gram in _ngrams(key)), key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                break
+        return sorted(position for position in candidates if key in self._keys[position])
+
+    def search(self, text, limit=None):
+        """Return matching symbols ranked exact, prefix, substring; shorter symbols first within a rank."""
+        key = text.strip().lower()
+        if not key:
+            return self.symbols[:limit] if limit else list(self.symbols)
+
+        results = list(self._exact.get(key, []))
+        seen = set(results)
+
+        start = bisect.bisect_left(self._keys, key)
+        prefix = []
+        for position in range(start, len(self._keys)):
+            if not self._keys[position].startswith(key):
+                break
+            symbol = self._sorted[position][1]
+            if symbol not in seen:
+                prefix.append(symbol)
+        results.extend(sorted(prefix, key=lambda symbol: (len(symbol), symbol)))
+        seen.update(prefix)
+
+        if limit is None or len(results) < limit:
+            substring = [
+                self._sorted[position][1]
+                for position in self._substring_positions(key)
+                if self._sorted[position][1] not in seen
+            ]
+            results.extend(sorted(substring, key=lambda symbol: (len(symbol), symbol)))
+
+        return results[:limit] if limit else results
@@ -0,0 +1,46 @@
+import os
+import shutil
+import tempfile
+
+# Production serving: gunicorn -c gunicorn.conf.py wsgi:application
+bind = os.getenv("WEB_BIND", "0.0.0.0:5001")
+
+# Worker processes; every worker has its own connection pool (DB_POOL_MAX), folding jobs share FOLDING_WORKERS slots
+workers = int(os.getenv("WEB_WORKERS", 4))
+
+# "gthread" serves WEB_THREADS requests per worker on threads. psycopg2 and the numpy work on contact
+# arrays release the GIL, and COPY keeps working, so the binary readers (columnar.copy_binary_columns)
+# stay on their fast path; DB_STATEMENT_TIMEOUT bounds its requests (answered with 504). "gevent" serves WEB_WORKER_CONNECTIONS requests per worker cooperatively and
+# adds the WEB_REQUEST_TIMEOUT limit, but its psycopg2 wait callback disables COPY (those reads fall back
+# to fetchall) and CPU-bound numpy work stalls every other request of the worker while it runs; pick it
+# for many slow, I/O-bound clients. "sync" serves one request per worker.
+worker_class = os.getenv("WEB_WORKER_CLASS", "gthread")
+
+# Threads per gthread worker (keep at most DB_POOL_MAX), concurrent requests per gevent worker
+threads = int(os.getenv("WEB_THREADS", 8))
+worker_connections = int(os.getenv("WEB_WORKER_CONNECTIONS", 100))
+
+# Seconds without a worker heartbeat before it is restarted (per request for sync workers)
+timeout = int(os.getenv("WEB_TIMEOUT", 120))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("WEB_KEEPALIVE", 5))
+
+accesslog = os.getenv("WEB_ACCESS_LOG", "-")
+errorlog = "-"
+
+# Workers write their metrics here and /metrics merges them (prometheus_client multiprocess mode);
+# it must be set before the app is imported, and is emptied on every start
+os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), f"chrompolymer-metrics-{os.getpid()}")
+)
+
+
+def on_starting(server):
+    metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
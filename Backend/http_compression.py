@@ -0,0 +1,117 @@
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Smaller bodies are sent as they are; streamed bodies have no known size and are always compressed
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", 1024))
+
+# Levels favour speed: the large payloads are numeric JSON, which compresses well at low levels
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 5))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", 4))
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", 3))
+
+COMPRESSIBLE_MIMETYPES = {
+    "application/json",
+    "application/vnd.chrompolymer.columnar",
+    "text/plain",
+    "text/html",
+}
+
+
+def _gzip():
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+
+def _brotli():
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    return compressor.process, compressor.flush, compressor.finish
+
+
+def _zstd():
+    compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    return (
+        compressor.compress,
+        lambda: compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK),
+        lambda: compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH),
+    )
+
+
+# Encoding -> factory of (compress, flush, finish), in server preference order for equal client quality
+ENCODERS = {"gzip": _gzip}
+if brotli is not None:
+    ENCODERS = {"br": _brotli, **ENCODERS}
+if zstandard is not None:
+    ENCODERS = {"zstd": _zstd, **ENCODERS}
+
+
+def negotiate_encoding(accept_encodings):
+    """The supported encoding the client (a werkzeug Accept-Encoding header) prefers, or None."""
+    best, best_quality = None, 0
+    for encoding in ENCODERS:
+        quality = accept_encodings.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def _compressed_stream(chunks, encoder):
+    compress, flush, finish = encoder
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            if chunk:
+                # Flush every chunk so the client can start decoding before the response ends
+                yield compress(chunk) + flush()
+        yield finish()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def compress_response(response, accept_encodings):
+    """
+    Compress a Flask response with the best encoding the client accepts (zstd, br, gzip).
+
+    Streamed responses are compressed chunk by chunk. The ETag becomes weak, since the bytes
+    on the wire now depend on the negotiated encoding.
+    """
+    if (
+        response.status_code < 200
+        or response.status_code in (204, 304)
+        or response.direct_passthrough
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate_encoding(accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _compressed_stream(response.response, ENCODERS[encoding]())
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        compress, _, finish = ENCODERS[encoding]()
+        response.set_data(compress(data) + finish())
+
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
@@ -1,9 +1,30 @@
 import os
 import re
+import argparse
+import csv
+import gzip
+import hashlib
+import io
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from psycopg2 import sql
 import psycopg2.extras
 import pandas as pd
 from dotenv import load_dotenv
+from cache import mark_data_changed
+from contact_store import build_contact_store
+from process import (
+    get_interval_index,
+    CONTACT_BACKEND,
+    HIC_RESOLUTION,
+    PYRAMID_RESOLUTIONS,
+    PYRAMID_QUERY,
+    CHROMOSOME_CONTACTS_QUERY,
+    CHROMOSOME_CONTACTS_BY_CELL_LINES_QUERY,
+    CHROMOSOME_DATA_QUERY,
+    STAGED_POSITIONS_QUERY,
+)
 
 
 load_dotenv()
@@ -13,7 +34,122 @@ DB_HOST = os.getenv("DB_HOST")
 DB_USERNAME = os.getenv("DB_USERNAME")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 
-ROOT_DIR = "../Example_Data"
+ROOT_DIR = os.getenv("DATA_DIR", "../Example_Data")
+
+# "copy" streams files through COPY ... FROM STDIN, "batch" keeps the old execute_batch path
+INGEST_METHOD = os.getenv("INGEST_METHOD", "copy")
+COPY_BUFFER_SIZE = 1 << 20
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 4))
+
+# Source directory and file suffix of the tables loaded file by file through the ingest manifest
+INGEST_SOURCES = {
+    "sequence": ("seqs", ".csv.gz"),
+    "epigenetic_track": ("epigenetic_tracks", ".bed.gz"),
+    "non_random_hic": ("refined_processed_HiC", ".csv.gz"),
+}
+
+# Tables partitioned by LIST (cell_line), and every cell line by LIST (chrID). The partitions
+# of a cell line are created before its files are loaded; chromosomes missing from the
+# chromosome table land in the cell line's DEFAULT partition.
+PARTITIONED_TABLES = ("non_random_hic", "epigenetic_track")
+
+INDEX_BUILD_MEMORY = os.getenv("INDEX_BUILD_MEMORY", "512MB")
+
+# Secondary indexes built after the bulk load, tuned to the hot queries in process.py
+INDEX_DEFINITIONS = {
+    "non_random_hic": [
+        (
+            "non_random_hic_region_idx",
+            "CREATE INDEX IF NOT EXISTS non_random_hic_region_idx ON non_random_hic (chrID, cell_line, ibp, jbp) INCLUDE (fq, fdr)",
+        ),
+    ],
+    "gene": [
+        (
+            "gene_chromosome_idx",
+            "CREATE INDEX IF NOT EXISTS gene_chromosome_idx ON gene (chromosome, start_location)",
+        ),
+    ],
+    "position": [
+        (
+            "position_region_idx",
+            "CREATE INDEX IF NOT EXISTS position_region_idx ON position (chrID, cell_line, start_value, end_value, sampleID)",
+        ),
+    ],
+}
+
+# Indexes of queries now answered from the interval index, dropped by build_indexes
+RETIRED_INDEXES = ("gene_range_idx", "gene_symbol_idx", "epigenetic_track_region_idx")
+
+# Hot query name -> (query, sample parameters, table it must read through an index)
+HOT_QUERIES = {
+    "chromosome_data_chunks": (CHROMOSOME_DATA_QUERY, ("chr1", "GM", 0, 1000000, 0, 1000000), "non_random_hic"),
+    "region_contact_arrays": (CHROMOSOME_CONTACTS_QUERY, ("chr1", "GM", 0, 1000000, 0, 1000000), "non_random_hic"),
+    "comparison_region_data": (
+        CHROMOSOME_CONTACTS_BY_CELL_LINES_QUERY,
+        (["GM", "K"], "chr1", ["GM", "K"], 0, 1000000, 0, 1000000),
+        "non_random_hic",
+    ),
+    "chromosome_data_at_zoom": (PYRAMID_QUERY, ("chr1", "GM", 50000, 0, 1000000, 0, 1000000), "non_random_hic_pyramid"),
+    "pack_folded_samples": (STAGED_POSITIONS_QUERY, ("chr1", "GM", 0, 1000000), "position"),
+}
+
+# Column mapping used by the COPY loader: (table column, source column). A source is a
+# header name for files with a header row, a column index for headerless files, or None
+# for values that come from the file name and are supplied per file.
+COPY_COLUMN_MAPPINGS = {
+    "non_random_hic": {
+        "delimiter": ",",
+        "header": True,
+        "columns": [
+            ("chrID", "chr"),
+            ("cell_line", "cell_line"),
+            ("ibp", "ibp"),
+            ("jbp", "jbp"),
+            ("fq", "fq"),
+            ("fdr", "fdr"),
+        ],
+    },
+    "sequence": {
+        "delimiter": ",",
+        "header": True,
+        "columns": [
+            ("chrID", "chrID"),
+            ("cell_line", "cell_line"),
+            ("start_value", "start_value"),
+            ("end_value", "end_value"),
+        ],
+    },
+    "epigenetic_track": {
+        "delimiter": "\t",
+        "header": False,
+        "columns": [
+            ("chrID", 0),
+            ("cell_line", None),
+            ("epigenetic", None),
+            ("start_value", 1),
+            ("end_value", 2),
+            ("name", 3),
+            ("score", 4),
+            ("strand", 5),
+            ("signal_value", 6),
+            ("p_value", 7),
+            ("q_value", 8),
+            ("peak", 9),
+        ],
+    },
+    "gene": {
+        "delimiter": "\t",
+        "header": True,
+        "columns": [
+            ("gene_id", "Gene ID"),
+            ("chromosome", "Chromosome"),
+            ("start_location", "Begin"),
+            ("end_location", "End"),
+            ("gene_name", "Name"),
+            ("symbol", "Symbol"),
+        ],
+    },
+}
 
 
 def get_db_connection(database=None):
@@ -49,6 +185,300 @@ def data_exists(cur, table_name):
     return cur.fetchone()[0]
 
 
+class _HashingReader(io.RawIOBase):
+    """Raw reader that feeds every byte it reads into a hash."""
+
+    def __init__(self, raw, digest):
+        self._raw = raw
+        self._digest = digest
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = self._raw.readinto(buffer)
+        if n:
+            self._digest.update(memoryview(buffer)[:n])
+        return n
+
+    def close(self):
+        self._raw.close()
+        super().close()
+
+
+class CopyStream:
+    """
+    Read-only file object that feeds a (gzipped) delimited file to COPY ... FROM STDIN.
+
+    Rows are projected onto the table columns of a COPY_COLUMN_MAPPINGS entry and
+    re-encoded as CSV on the fly, so the file is never materialised in memory. The
+    SHA-256 of the source file is computed in the same pass.
+    """
+
+    def __init__(self, file_path, mapping, constants=None):
+        constants = constants or {}
+        self._digest = hashlib.sha256()
+        self._source = io.BufferedReader(_HashingReader(open(file_path, "rb"), self._digest))
+        binary = gzip.GzipFile(fileobj=self._source) if file_path.endswith(".gz") else self._source
+        self._file = io.TextIOWrapper(binary, newline="")
+        self._reader = csv.reader(self._file, delimiter=mapping["delimiter"])
+        header = next(self._reader) if mapping["header"] else None
+
+        self._plan = []
+        for column, source in mapping["columns"]:
+            if source is None:
+                self._plan.append((None, constants[column]))
+            elif isinstance(source, int):
+                self._plan.append((source, None))
+            else:
+                self._plan.append((header.index(source), None))
+
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator="\n")
+        self.rows = 0
+
+    def read(self, size=-1):
+        plan = self._plan
+        writerow = self._writer.writerow
+        target = size if size and size > 0 else COPY_BUFFER_SIZE
+
+        while self._buffer.tell() < target:
+            row = next(self._reader, None)
+            if row is None:
+                break
+            writerow([row[index] if index is not None else value for index, value in plan])
+            self.rows += 1
+
+        data = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+    @property
+    def checksum(self):
+        # Hash whatever the decoder left unread (e.g. padding after the gzip trailer)
+        while self._source.read(COPY_BUFFER_SIZE):
+            pass
+        return self._digest.hexdigest()
+
+    def close(self):
+        self._file.close()
+        self._source.close()
+
+
+def report_load_rate(table_name, file_path, rows, elapsed, method):
+    """Print the load throughput of a single file."""
+    rate = rows / elapsed if elapsed > 0 else float("inf")
+    print(
+        f"Loaded {rows} rows from {os.path.basename(file_path)} into {table_name} "
+        f"in {elapsed:.2f}s ({rate:,.0f} rows/sec, {method})."
+    )
+
+
+def file_checksum(file_path):
+    """Return the SHA-256 of a file."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(COPY_BUFFER_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def copy_file(cur, table_name, file_path, constants=None):
+    """Stream a file into a table with COPY ... FROM STDIN and return the row count and file checksum."""
+    mapping = COPY_COLUMN_MAPPINGS[table_name]
+    query = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(
+        sql.Identifier(table_name),
+        sql.SQL(", ").join(sql.Identifier(column.lower()) for column, _ in mapping["columns"]),
+    )
+
+    started = time.perf_counter()
+    stream = CopyStream(file_path, mapping, constants)
+    try:
+        cur.copy_expert(query, stream, size=COPY_BUFFER_SIZE)
+        checksum = stream.checksum
+    finally:
+        stream.close()
+
+    report_load_rate(table_name, file_path, stream.rows, time.perf_counter() - started, "copy")
+    return stream.rows, checksum
+
+
+def is_partitioned(cur, table_name):
+    """Check if a table is declaratively partitioned (databases created before partitioning have plain tables)."""
+    cur.execute(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s));",
+        (table_name,),
+    )
+    return cur.fetchone()[0]
+
+
+def partition_name(table_name, *values):
+    """Return the partition of a table for a cell line (and chromosome), e.g. non_random_hic_gm_chr1."""
+    return "_".join([table_name] + [re.sub(r"\W+", "_", value).lower() for value in values])
+
+
+def create_partitions(cur, table_name, cell_lines, chromosomes):
+    """Create the cell line partitions of a partitioned table and their chromosome sub-partitions."""
+    for cell_line in cell_lines:
+        parent = partition_name(table_name, cell_line)
+        cur.execute(
+            sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES IN ({}) PARTITION BY LIST (chrID);").format(
+                sql.Identifier(parent), sql.Identifier(table_name), sql.Literal(cell_line)
+            )
+        )
+        for chromosome in chromosomes:
+            cur.execute(
+                sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES IN ({});").format(
+                    sql.Identifier(partition_name(table_name, cell_line, chromosome)),
+                    sql.Identifier(parent),
+                    sql.Literal(chromosome),
+                )
+            )
+        cur.execute(
+            sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} DEFAULT;").format(
+                sql.Identifier(partition_name(table_name, cell_line, "default")), sql.Identifier(parent)
+            )
+        )
+
+
+def prepare_partitions(conn, table_name):
+    """Create the partitions for every cell line with a source file of the table, before it is loaded."""
+    folder, suffix = INGEST_SOURCES[table_name]
+    folder_path = os.path.join(ROOT_DIR, folder)
+    cur = conn.cursor()
+    if not os.path.isdir(folder_path) or not is_partitioned(cur, table_name):
+        return
+
+    cell_lines = sorted({
+        file_scope(table_name, file_name)["cell_line"]
+        for file_name in os.listdir(folder_path)
+        if file_name.endswith(suffix)
+    })
+    cur.execute("SELECT chrID FROM chromosome ORDER BY chrID;")
+    chromosomes = [row[0] for row in cur.fetchall()]
+
+    create_partitions(cur, table_name, cell_lines, chromosomes)
+    conn.commit()
+
+
+def drop_cell_line(cell_line):
+    """Remove a cell line from the database.
+
+    Its partitions of the partitioned tables are detached and dropped, the other tables are
+    cleaned with DELETE, and its ingest manifest entries are removed so that the next run
+    reloads its files if they are still in ROOT_DIR.
+    """
+    conn = get_db_connection(database=DB_NAME)
+    cur = conn.cursor()
+
+    for table_name in PARTITIONED_TABLES:
+        if not table_exists(cur, table_name):
+            continue
+        partition = partition_name(table_name, cell_line)
+        cur.execute("SELECT to_regclass(%s);", (partition,))
+        has_partition = cur.fetchone()[0] is not None
+        if has_partition and is_partitioned(cur, table_name):
+            cur.execute(
+                sql.SQL("ALTER TABLE {} DETACH PARTITION {};").format(sql.Identifier(table_name), sql.Identifier(partition))
+            )
+            cur.execute(sql.SQL("DROP TABLE {};").format(sql.Identifier(partition)))
+            print(f"Dropped partition {partition}.")
+        else:
+            cur.execute(sql.SQL("DELETE FROM {} WHERE cell_line = %s;").format(sql.Identifier(table_name)), (cell_line,))
+            print(f"Deleted {cur.rowcount} {table_name} rows of {cell_line}.")
+
+    for table_name in ("sequence", "non_random_hic_pyramid", "dataset_catalog", "position", "structure_cache", "folding_job"):
+        if table_exists(cur, table_name):
+            cur.execute(sql.SQL("DELETE FROM {} WHERE cell_line = %s;").format(sql.Identifier(table_name)), (cell_line,))
+            print(f"Deleted {cur.rowcount} {table_name} rows of {cell_line}.")
+
+    if table_exists(cur, "ingest_manifest"):
+        # file_scope(): the cell line is the part of the file name before the first "_"
+        cur.execute(
+            "DELETE FROM ingest_manifest WHERE split_part(split_part(file_name, '.', 1), '_', 1) = %s;",
+            (cell_line,),
+        )
+
+    conn.commit()
+    cur.close()
+    conn.close()
+    print(f"Cell line {cell_line} dropped.")
+
+
+def defer_constraints(conn, table_name):
+    """Drop foreign keys, unique constraints and secondary indexes before a bulk load.
+
+    The definitions are kept in the deferred_constraint table, so they are rebuilt by
+    restore_constraints() even if the load is interrupted.
+    """
+    cur = conn.cursor()
+    cur.execute(
+        "CREATE TABLE IF NOT EXISTS deferred_constraint ("
+        "table_name VARCHAR(63) NOT NULL,"
+        "name VARCHAR(63) NOT NULL,"
+        "ddl TEXT NOT NULL,"
+        "PRIMARY KEY (table_name, name)"
+        ");"
+    )
+
+    cur.execute(
+        """
+        SELECT conname, pg_get_constraintdef(oid)
+        FROM pg_constraint
+        WHERE conrelid = %s::regclass
+        AND contype IN ('f', 'u')
+    """,
+        (table_name,),
+    )
+    constraints = cur.fetchall()
+
+    cur.execute(
+        """
+        SELECT c.relname, pg_get_indexdef(c.oid)
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = %s::regclass
+        AND NOT i.indisprimary
+        AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conindid = i.indexrelid)
+    """,
+        (table_name,),
+    )
+    indexes = cur.fetchall()
+
+    remember = "INSERT INTO deferred_constraint (table_name, name, ddl) VALUES (%s, %s, %s) ON CONFLICT DO NOTHING;"
+    for name, definition in constraints:
+        ddl = sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} {}").format(
+            sql.Identifier(table_name), sql.Identifier(name), sql.SQL(definition)
+        )
+        cur.execute(remember, (table_name, name, ddl.as_string(conn)))
+        cur.execute(
+            sql.SQL("ALTER TABLE {} DROP CONSTRAINT {}").format(sql.Identifier(table_name), sql.Identifier(name))
+        )
+    for name, definition in indexes:
+        cur.execute(remember, (table_name, name, definition))
+        cur.execute(sql.SQL("DROP INDEX {}").format(sql.Identifier(name)))
+
+    conn.commit()
+    if constraints or indexes:
+        print(f"Deferred {len(constraints)} constraint(s) and {len(indexes)} index(es) on {table_name} until after the load.")
+
+
+def restore_constraints(conn, table_name):
+    """Rebuild the constraints and indexes dropped by defer_constraints()."""
+    cur = conn.cursor()
+    if not table_exists(cur, "deferred_constraint"):
+        return
+
+    cur.execute("SELECT name, ddl FROM deferred_constraint WHERE table_name = %s;", (table_name,))
+    for name, ddl in cur.fetchall():
+        started = time.perf_counter()
+        cur.execute(ddl)
+        cur.execute("DELETE FROM deferred_constraint WHERE table_name = %s AND name = %s;", (table_name, name))
+        conn.commit()
+        print(f"Rebuilt {name} on {table_name} in {time.perf_counter() - started:.2f}s.")
+
+
 def initialize_tables():
     """Create tables"""
 
@@ -56,6 +486,62 @@ def initialize_tables():
     conn = get_db_connection(database=DB_NAME)
     cur = conn.cursor()
 
+    # Created before the checks below return, so databases loaded before these tables existed get them too
+    if not table_exists(cur, "structure_cache"):
+        print("Creating structure_cache table...")
+        cur.execute(
+            "CREATE TABLE IF NOT EXISTS structure_cache ("
+            "cell_line VARCHAR(50) NOT NULL,"
+            "chrID VARCHAR(50) NOT NULL,"
+            "start_value BIGINT NOT NULL,"
+            "end_value BIGINT NOT NULL,"
+            "params VARCHAR(100) NOT NULL,"
+            "sampleID INT NOT NULL,"
+            "n_beads INT NOT NULL,"
+            "coords BYTEA NOT NULL,"
+            "nbytes INT NOT NULL,"
+            "hits BIGINT NOT NULL DEFAULT 0,"
+            "created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,"
+            "last_access TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,"
+            "PRIMARY KEY (cell_line, chrID, start_value, end_value, params, sampleID)"
+            ");"
+        )
+        conn.commit()
+        print("structure_cache table created successfully.")
+    else:
+        print("structure_cache table already exists, skipping creation.")
+
+    # Folding job state shared by the web workers; at most one queued or running job per region and size
+    if not table_exists(cur, "folding_job"):
+        print("Creating folding_job table...")
+        cur.execute(
+            "CREATE TABLE IF NOT EXISTS folding_job ("
+            "job_id VARCHAR(32) PRIMARY KEY,"
+            "cell_line VARCHAR(50) NOT NULL,"
+            "chrID VARCHAR(50) NOT NULL,"
+            "start_value BIGINT NOT NULL,"
+            "end_value BIGINT NOT NULL,"
+            "n_samples INT NOT NULL,"
+            "state VARCHAR(20) NOT NULL,"
+            "folded BOOLEAN,"
+            "error TEXT,"
+            "attached INT NOT NULL DEFAULT 1,"
+            "worker VARCHAR(300) NOT NULL,"
+            "submitted_at DOUBLE PRECISION NOT NULL,"
+            "started_at DOUBLE PRECISION,"
+            "finished_at DOUBLE PRECISION"
+            ");"
+        )
+        cur.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS folding_job_active_idx "
+            "ON folding_job (cell_line, chrID, start_value, end_value, n_samples) "
+            "WHERE state IN ('queued', 'running');"
+        )
+        conn.commit()
+        print("folding_job table created successfully.")
+    else:
+        print("folding_job table already exists, skipping creation.")
+
     # Check if tables already exist
     if not table_exists(cur, "chromosome"):
         print("Creating chromosome table...")
@@ -94,15 +580,16 @@ def initialize_tables():
         print("Creating non_random_hic table...")
         cur.execute(
             "CREATE TABLE IF NOT EXISTS non_random_hic ("
-            "hID serial PRIMARY KEY,"
+            "hID serial,"
             "chrID VARCHAR(50) NOT NULL,"
             "cell_line VARCHAR(50) NOT NULL,"
             "fq FLOAT NOT NULL DEFAULT 0.0,"
             "fdr FLOAT NOT NULL DEFAULT 0.0,"
             "ibp BIGINT NOT NULL DEFAULT 0,"
             "jbp BIGINT NOT NULL DEFAULT 0,"
+            "PRIMARY KEY (hID, cell_line, chrID),"
             "CONSTRAINT fk_non_random_hic_chrID FOREIGN KEY (chrID) REFERENCES chromosome(chrID) ON DELETE CASCADE ON UPDATE CASCADE"
-            ");"
+            ") PARTITION BY LIST (cell_line);"
         )
         conn.commit()
         print("non_random_hic table created successfully.")
@@ -114,7 +601,7 @@ def initialize_tables():
         print("Creating epigenetic_track table...")
         cur.execute(
             "CREATE TABLE IF NOT EXISTS epigenetic_track ("
-            "etID serial PRIMARY KEY,"
+            "etID serial,"
             "chrID VARCHAR(50) NOT NULL,"
             "cell_line VARCHAR(50) NOT NULL,"
             "epigenetic VARCHAR(50) NOT NULL,"
@@ -126,8 +613,9 @@ def initialize_tables():
             "signal_value FLOAT NOT NULL DEFAULT 0.0,"
             "p_value FLOAT NOT NULL DEFAULT 0.0,"
             "q_value FLOAT NOT NULL DEFAULT 0.0,"
-            "peak BIGINT NOT NULL DEFAULT 0"
-            ");"
+            "peak BIGINT NOT NULL DEFAULT 0,"
+            "PRIMARY KEY (etID, cell_line, chrID)"
+            ") PARTITION BY LIST (cell_line);"
         )
         conn.commit()
         print("epigenetic_track table created successfully.")
@@ -195,6 +683,11 @@ def process_chromosome_data(cur, file_path):
 
 def process_gene_data(cur, file_path):
     """Process and insert gene data from the specified file."""
+    if INGEST_METHOD == "copy":
+        copy_file(cur, "gene", file_path)
+        return
+
+    started = time.perf_counter()
     gene_df = pd.read_csv(file_path, sep="\t")
     gene_df = gene_df[["Gene ID", "Name", "Symbol", "Chromosome", "Begin", "End"]]
 
@@ -207,10 +700,11 @@ def process_gene_data(cur, file_path):
     ].values.tolist()
 
     psycopg2.extras.execute_batch(cur, query, data_to_insert)
+    report_load_rate("gene", file_path, len(data_to_insert), time.perf_counter() - started, "batch")
 
 
 def process_non_random_hic_data(chromosome_dir):
-    """Process and insert Hi-C data from CSV files in the specified directory."""
+    """Process and insert Hi-C data from CSV files in the specified directory (INGEST_METHOD=batch)."""
     query = """
     INSERT INTO non_random_hic (chrID, cell_line, ibp, jbp, fq, fdr)
     VALUES (%s, %s, %s, %s, %s, %s);
@@ -223,6 +717,9 @@ def process_non_random_hic_data(chromosome_dir):
             cell_line = re.search(r"^(\w+)_", file_name).group(1)
             file_path = os.path.join(chromosome_dir, file_name)
 
+            started = time.perf_counter()
+            total_rows = 0
+
             # Read the CSV file in chunks
             for chunk in pd.read_csv(
                 file_path, usecols=["chr", "cell_line", "ibp", "jbp", "fq", "fdr"], chunksize=10000
@@ -243,19 +740,21 @@ def process_non_random_hic_data(chromosome_dir):
 
                 # Batch insert the records and commit after each chunk
                 psycopg2.extras.execute_batch(cur, query, data_to_insert)
+                total_rows += len(data_to_insert)
                 print(f"Inserted {len(data_to_insert)} records for {cell_line}.")
                 
                 conn.commit()
                 cur.close()
                 conn.close()
 
+            report_load_rate("non_random_hic", file_path, total_rows, time.perf_counter() - started, "batch")
             print(
                 f"Non-random Hi-C data for cell line {cell_line} inserted successfully."
             )
 
 
 def process_epigenetic_track_data(cur):
-    """Process and insert epigenetic track data from all bed.gz files in the specified folder."""
+    """Process and insert epigenetic track data from all bed.gz files in the specified folder (INGEST_METHOD=batch)."""
     folder_path = os.path.join(ROOT_DIR, "epigenetic_tracks")
     for filename in os.listdir(folder_path):
         # check if the file is a bed.gz file
@@ -266,6 +765,7 @@ def process_epigenetic_track_data(cur):
             cell_line = parts[0]
             epigenetic = parts[1]
 
+            started = time.perf_counter()
             df = pd.read_csv(file_path, sep="\t", header=None)
             df.columns = ["chrID", "start_value", "end_value", "name", "score", "strand", "signalValue", "pValue", "qValue", "peak"]
 
@@ -282,16 +782,18 @@ def process_epigenetic_track_data(cur):
 
             data_to_insert = df.to_records(index=False).tolist()
             psycopg2.extras.execute_batch(cur, query, data_to_insert)
+            report_load_rate("epigenetic_track", file_path, len(data_to_insert), time.perf_counter() - started, "batch")
 
 
 def process_sequence_data(cur):
-    """Process and insert sequence data from all CSV files in the specified folder."""
+    """Process and insert sequence data from all CSV files in the specified folder (INGEST_METHOD=batch)."""
     folder_path = os.path.join(ROOT_DIR, "seqs")
     for filename in os.listdir(folder_path):
         # check if the file is a CSV.gz file
         if filename.endswith(".csv.gz"):
             file_path = os.path.join(folder_path, filename)
 
+            started = time.perf_counter()
             df = pd.read_csv(
                 file_path, usecols=["chrID", "cell_line", "start_value", "end_value"]
             )
@@ -306,6 +808,231 @@ def process_sequence_data(cur):
 
             data_to_insert = df.to_records(index=False).tolist()
             psycopg2.extras.execute_batch(cur, query, data_to_insert)
+            report_load_rate("sequence", file_path, len(data_to_insert), time.perf_counter() - started, "batch")
+
+
+def ensure_manifest_table(cur):
+    """Create the per-file ingest manifest if it does not exist yet."""
+    cur.execute(
+        "CREATE TABLE IF NOT EXISTS ingest_manifest ("
+        "table_name VARCHAR(63) NOT NULL,"
+        "file_name VARCHAR(255) NOT NULL,"
+        "file_size BIGINT NOT NULL DEFAULT 0,"
+        "file_mtime DOUBLE PRECISION NOT NULL DEFAULT 0,"
+        "checksum VARCHAR(64),"
+        "row_count BIGINT,"
+        "status VARCHAR(20) NOT NULL,"
+        "error TEXT,"
+        "started_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,"
+        "finished_at TIMESTAMP,"
+        "PRIMARY KEY (table_name, file_name)"
+        ");"
+    )
+
+
+def file_scope(table_name, file_name):
+    """Return the column values that identify the rows loaded from a source file.
+
+    Files are named <cell_line>_... (and <cell_line>_<epigenetic>.bed.gz for tracks), so the
+    scope also provides the per-file constants of COPY_COLUMN_MAPPINGS.
+    """
+    parts = file_name.split(".")[0].split("_")
+    scope = {"cell_line": parts[0]}
+    if table_name == "epigenetic_track":
+        scope["epigenetic"] = parts[1]
+    return scope
+
+
+def ingest_file(job):
+    """Load one file in its own connection and transaction and record the outcome in the manifest.
+
+    The rows and the 'complete' manifest entry are committed together, so a crash leaves
+    either the whole file or nothing behind.
+    """
+    table_name = job["table_name"]
+    file_path = job["file_path"]
+    file_name = os.path.basename(file_path)
+    scope = job["scope"]
+
+    conn = get_db_connection(database=DB_NAME)
+    if conn is None:
+        return {"file_name": file_name, "status": "failed", "error": "no database connection"}
+    cur = conn.cursor()
+
+    try:
+        cur.execute(
+            """
+            INSERT INTO ingest_manifest (table_name, file_name, file_size, file_mtime, status, started_at)
+            VALUES (%s, %s, %s, %s, 'loading', CURRENT_TIMESTAMP)
+            ON CONFLICT (table_name, file_name) DO UPDATE
+            SET file_size = EXCLUDED.file_size, file_mtime = EXCLUDED.file_mtime, status = 'loading',
+                error = NULL, started_at = CURRENT_TIMESTAMP, finished_at = NULL;
+        """,
+            (table_name, file_name, job["file_size"], job["file_mtime"]),
+        )
+        conn.commit()
+
+        if job["replace"]:
+            # Rows of an earlier (changed, or partially batch-loaded) version of this file
+            stale_tables = [table_name]
+            if set(scope) == {"cell_line"} and table_name in PARTITIONED_TABLES and is_partitioned(cur, table_name):
+                # The file fills the whole cell line partition, empty it without a DELETE
+                cur.execute(
+                    sql.SQL("TRUNCATE {};").format(sql.Identifier(partition_name(table_name, scope["cell_line"])))
+                )
+                stale_tables = []
+            if table_name == "non_random_hic" and table_exists(cur, "non_random_hic_pyramid"):
+                stale_tables.append("non_random_hic_pyramid")
+            for stale_table in stale_tables:
+                cur.execute(
+                    sql.SQL("DELETE FROM {} WHERE {};").format(
+                        sql.Identifier(stale_table),
+                        sql.SQL(" AND ").join(
+                            sql.SQL("{} = %s").format(sql.Identifier(column)) for column in scope
+                        ),
+                    ),
+                    list(scope.values()),
+                )
+
+        rows, checksum = copy_file(cur, table_name, file_path, scope)
+        cur.execute(
+            """
+            UPDATE ingest_manifest
+            SET status = 'complete', checksum = %s, row_count = %s, finished_at = CURRENT_TIMESTAMP
+            WHERE table_name = %s AND file_name = %s;
+        """,
+            (checksum, rows, table_name, file_name),
+        )
+        conn.commit()
+        return {"file_name": file_name, "status": "complete", "rows": rows}
+    except Exception as e:
+        conn.rollback()
+        cur.execute(
+            """
+            UPDATE ingest_manifest
+            SET status = 'failed', error = %s, finished_at = CURRENT_TIMESTAMP
+            WHERE table_name = %s AND file_name = %s;
+        """,
+            (str(e), table_name, file_name),
+        )
+        conn.commit()
+        return {"file_name": file_name, "status": "failed", "error": str(e)}
+    finally:
+        cur.close()
+        conn.close()
+
+
+def ingest_directory(table_name, workers=INGEST_WORKERS):
+    """Load the source files of a table in parallel, skipping files the manifest records as complete.
+
+    Failed or interrupted files are retried on the next run, changed files are reloaded in
+    place, and new files (e.g. a new cell line) are added without touching the rest of the table.
+    """
+    folder, suffix = INGEST_SOURCES[table_name]
+    folder_path = os.path.join(ROOT_DIR, folder)
+    if not os.path.isdir(folder_path):
+        print(f"{folder_path} does not exist, skipping {table_name} ingest.")
+        return []
+
+    conn = get_db_connection(database=DB_NAME)
+    cur = conn.cursor()
+    ensure_manifest_table(cur)
+    conn.commit()
+
+    cur.execute(
+        "SELECT file_name, file_size, file_mtime, checksum, status FROM ingest_manifest WHERE table_name = %s;",
+        (table_name,),
+    )
+    manifest = {row[0]: row[1:] for row in cur.fetchall()}
+    file_names = sorted(f for f in os.listdir(folder_path) if f.endswith(suffix))
+
+    if not manifest and data_exists(cur, table_name):
+        # Table loaded before the manifest existed: keep the old "table is not empty" behaviour
+        print(f"{table_name} already has data without an ingest manifest, recording its files as complete.")
+        for file_name in file_names:
+            file_path = os.path.join(folder_path, file_name)
+            stat = os.stat(file_path)
+            cur.execute(
+                """
+                INSERT INTO ingest_manifest (table_name, file_name, file_size, file_mtime, checksum, status, finished_at)
+                VALUES (%s, %s, %s, %s, %s, 'complete', CURRENT_TIMESTAMP);
+            """,
+                (table_name, file_name, stat.st_size, stat.st_mtime, file_checksum(file_path)),
+            )
+        conn.commit()
+        restore_constraints(conn, table_name)
+        cur.close()
+        conn.close()
+        return []
+
+    jobs = []
+    for file_name in file_names:
+        file_path = os.path.join(folder_path, file_name)
+        stat = os.stat(file_path)
+        entry = manifest.get(file_name)
+
+        if entry is not None and entry[3] == "complete":
+            file_size, file_mtime, checksum, _ = entry
+            if file_size == stat.st_size and file_mtime == stat.st_mtime:
+                continue
+            if file_size == stat.st_size and file_checksum(file_path) == checksum:
+                cur.execute(
+                    "UPDATE ingest_manifest SET file_mtime = %s WHERE table_name = %s AND file_name = %s;",
+                    (stat.st_mtime, table_name, file_name),
+                )
+                conn.commit()
+                continue
+            print(f"{file_name} changed since it was loaded, reloading it.")
+
+        jobs.append(
+            {
+                "table_name": table_name,
+                "file_path": file_path,
+                "file_size": stat.st_size,
+                "file_mtime": stat.st_mtime,
+                "scope": file_scope(table_name, file_name),
+                "replace": entry is not None,
+            }
+        )
+
+    if not jobs:
+        print(f"All {len(file_names)} {table_name} file(s) already loaded, skipping insertion.")
+        restore_constraints(conn, table_name)
+        cur.close()
+        conn.close()
+        return []
+
+    print(f"Loading {len(jobs)} of {len(file_names)} {table_name} file(s) with {min(workers, len(jobs))} worker(s)...")
+    if table_name in PARTITIONED_TABLES:
+        prepare_partitions(conn, table_name)
+    if not data_exists(cur, table_name):
+        # Rebuilding indexes only pays off for a full load, incremental loads keep them
+        defer_constraints(conn, table_name)
+    # End the read transaction, so workers replacing a cell line can truncate its partition
+    conn.commit()
+
+    results = []
+    started = time.perf_counter()
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=context) as executor:
+        futures = [executor.submit(ingest_file, job) for job in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if result["status"] == "failed":
+                print(f"Failed to load {result['file_name']}: {result['error']}")
+
+    restore_constraints(conn, table_name)
+    cur.close()
+    conn.close()
+
+    loaded = sum(result.get("rows", 0) for result in results)
+    failed = [result["file_name"] for result in results if result["status"] == "failed"]
+    elapsed = time.perf_counter() - started
+    print(f"Loaded {loaded} rows into {table_name} in {elapsed:.2f}s ({loaded / elapsed if elapsed > 0 else 0:,.0f} rows/sec).")
+    if failed:
+        print(f"{len(failed)} {table_name} file(s) failed: {', '.join(failed)}. Run init_db.py again to retry them.")
+    return results
 
 
 def insert_data():
@@ -326,25 +1053,37 @@ def insert_data():
     if not data_exists(cur, "gene"):
         file_path = os.path.join(ROOT_DIR, "ncbi_dataset.tsv")
         print("Inserting gene data...")
+        defer_constraints(conn, "gene")
         process_gene_data(cur, file_path)
         print("Gene data inserted successfully.")
     else:
         print("Gene data already exists, skipping insertion.")
 
-    # Insert sequence data only if the table is empty
-    if not data_exists(cur, "sequence"):
-        print("Inserting sequence data...")
-        process_sequence_data(cur)
-        print("Sequence data inserted successfully.")
+    if INGEST_METHOD == "copy":
+        # Sequence and epigenetic track files are loaded file by file through the ingest manifest
+        conn.commit()
+        ingest_directory("sequence")
+        ingest_directory("epigenetic_track")
+    else:
+        # Insert sequence data only if the table is empty
+        if not data_exists(cur, "sequence"):
+            print("Inserting sequence data...")
+            defer_constraints(conn, "sequence")
+            process_sequence_data(cur)
+            print("Sequence data inserted successfully.")
 
-    # Insert epigenetic track data only if the table is empty
-    if not data_exists(cur, "epigenetic_track"):
-        print("Inserting epigenetic track data...")
-        process_epigenetic_track_data(cur)
-        print("epigenetic track data inserted successfully.")
+        # Insert epigenetic track data only if the table is empty
+        if not data_exists(cur, "epigenetic_track"):
+            print("Inserting epigenetic track data...")
+            prepare_partitions(conn, "epigenetic_track")
+            defer_constraints(conn, "epigenetic_track")
+            process_epigenetic_track_data(cur)
+            print("epigenetic track data inserted successfully.")
 
-    # Commit changes and close connection
+    # Commit changes, rebuild anything deferred during the load and close connection
     conn.commit()
+    for table_name in ("gene", "sequence", "epigenetic_track"):
+        restore_constraints(conn, table_name)
     cur.close()
     conn.close()
     return
@@ -352,17 +1091,348 @@ def insert_data():
 
 def insert_non_random_HiC_data():
     """Insert non random HiC data into the database if not already present.(it is seperated from insert_data() to avoid long running transactions)"""
+    if INGEST_METHOD == "copy":
+        ingest_directory("non_random_hic")
+        return
+
     conn = get_db_connection(database=DB_NAME)
     cur = conn.cursor()
 
     # Insert non-random Hi-C data only if the table is empty
     if not data_exists(cur, "non_random_hic"):
         chromosome_dir = os.path.join(ROOT_DIR, "refined_processed_HiC")
+        prepare_partitions(conn, "non_random_hic")
+        defer_constraints(conn, "non_random_hic")
         process_non_random_hic_data(chromosome_dir)
     else:
         print("Non-random Hi-C data already exists, skipping insertion.")
 
+    restore_constraints(conn, "non_random_hic")
+    cur.close()
+    conn.close()
+
+
+def pyramid_source(resolution, built):
+    """Return the coarsest already built level a resolution can be aggregated from (None for the raw contacts)."""
+    sources = [r for r in built if r < resolution and resolution % r == 0]
+    return max(sources) if sources else None
+
+
+def build_pyramid_levels(chromosome_name, cell_line):
+    """Aggregate the contacts of one (cell_line, chrID) into every PYRAMID_RESOLUTIONS level in one transaction."""
+    conn = get_db_connection(database=DB_NAME)
+    cur = conn.cursor()
+    started = time.perf_counter()
+
+    cur.execute(
+        "DELETE FROM non_random_hic_pyramid WHERE chrID = %s AND cell_line = %s;",
+        (chromosome_name, cell_line),
+    )
+
+    built = []
+    for resolution in sorted(PYRAMID_RESOLUTIONS):
+        source = pyramid_source(resolution, built)
+        if source is None and resolution % HIC_RESOLUTION == 0:
+            cur.execute(
+                """
+                INSERT INTO non_random_hic_pyramid (chrID, cell_line, resolution, ibp, jbp, fq_sum, fq_max, fdr_min, contacts)
+                SELECT chrID, cell_line, %(resolution)s, ibp / %(resolution)s * %(resolution)s, jbp / %(resolution)s * %(resolution)s,
+                       SUM(fq), MAX(fq), MIN(fdr), COUNT(*)
+                FROM non_random_hic
+                WHERE chrID = %(chromosome)s AND cell_line = %(cell_line)s
+                GROUP BY 1, 2, 3, 4, 5;
+            """,
+                {"resolution": resolution, "chromosome": chromosome_name, "cell_line": cell_line},
+            )
+        elif source is not None:
+            cur.execute(
+                """
+                INSERT INTO non_random_hic_pyramid (chrID, cell_line, resolution, ibp, jbp, fq_sum, fq_max, fdr_min, contacts)
+                SELECT chrID, cell_line, %(resolution)s, ibp / %(resolution)s * %(resolution)s, jbp / %(resolution)s * %(resolution)s,
+                       SUM(fq_sum), MAX(fq_max), MIN(fdr_min), SUM(contacts)
+                FROM non_random_hic_pyramid
+                WHERE chrID = %(chromosome)s AND cell_line = %(cell_line)s AND resolution = %(source)s
+                GROUP BY 1, 2, 3, 4, 5;
+            """,
+                {"resolution": resolution, "source": source, "chromosome": chromosome_name, "cell_line": cell_line},
+            )
+        else:
+            print(f"Skipping pyramid level {resolution}: not a multiple of the {HIC_RESOLUTION} bp contact resolution.")
+            continue
+        built.append(resolution)
+
+    conn.commit()
+    cur.close()
+    conn.close()
+    return chromosome_name, cell_line, time.perf_counter() - started
+
+
+def build_pyramid(workers=INGEST_WORKERS):
+    """Build the multi-resolution contact levels for every (cell_line, chrID) that does not have them yet."""
+    conn = get_db_connection(database=DB_NAME)
+    cur = conn.cursor()
+    cur.execute(
+        "CREATE TABLE IF NOT EXISTS non_random_hic_pyramid ("
+        "chrID VARCHAR(50) NOT NULL,"
+        "cell_line VARCHAR(50) NOT NULL,"
+        "resolution INT NOT NULL,"
+        "ibp BIGINT NOT NULL,"
+        "jbp BIGINT NOT NULL,"
+        "fq_sum FLOAT NOT NULL DEFAULT 0.0,"
+        "fq_max FLOAT NOT NULL DEFAULT 0.0,"
+        "fdr_min FLOAT NOT NULL DEFAULT 0.0,"
+        "contacts INT NOT NULL DEFAULT 0,"
+        "PRIMARY KEY (chrID, cell_line, resolution, ibp, jbp)"
+        ");"
+    )
+    conn.commit()
+
+    # The sequence table lists the covered (chrID, cell_line) pairs without scanning the contacts
+    cur.execute(
+        """
+        SELECT DISTINCT s.chrID, s.cell_line
+        FROM sequence s
+        WHERE NOT EXISTS (
+            SELECT 1 FROM non_random_hic_pyramid p
+            WHERE p.chrID = s.chrID AND p.cell_line = s.cell_line
+        )
+        ORDER BY 1, 2;
+    """
+    )
+    pending = cur.fetchall()
+    cur.close()
+    conn.close()
+
+    if not pending:
+        print("Contact pyramid is up to date, skipping build.")
+        return
+
+    print(f"Building contact pyramid levels {sorted(PYRAMID_RESOLUTIONS)} for {len(pending)} chromosome(s)...")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(build_pyramid_levels, chromosome_name, cell_line) for chromosome_name, cell_line in pending]
+        for future in as_completed(futures):
+            chromosome_name, cell_line, elapsed = future.result()
+            print(f"Contact pyramid for {cell_line} {chromosome_name} built in {elapsed:.2f}s.")
+
+    conn = get_db_connection(database=DB_NAME)
+    cur = conn.cursor()
+    cur.execute("ANALYZE non_random_hic_pyramid;")
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+
+def build_catalog():
+    """Refresh the dataset catalog rows of the cell lines that are new or had files loaded since their rows were built.
+
+    Cell lines loaded without the ingest manifest (INGEST_METHOD=batch) are only built once.
+    """
+    conn = get_db_connection(database=DB_NAME)
+    cur = conn.cursor()
+    cur.execute(
+        "CREATE TABLE IF NOT EXISTS dataset_catalog ("
+        "cell_line VARCHAR(50) NOT NULL,"
+        "chrID VARCHAR(50) NOT NULL,"
+        "min_bp BIGINT NOT NULL,"
+        "max_bp BIGINT NOT NULL,"
+        "sequences INT NOT NULL,"
+        "contacts BIGINT NOT NULL DEFAULT 0,"
+        "contact_min_bp BIGINT,"
+        "contact_max_bp BIGINT,"
+        "fq_min FLOAT,"
+        "fq_max FLOAT,"
+        "fdr_min FLOAT,"
+        "fdr_max FLOAT,"
+        "epigenetic_marks TEXT[] NOT NULL DEFAULT '{}',"
+        "peaks BIGINT NOT NULL DEFAULT 0,"
+        "genes INT NOT NULL DEFAULT 0,"
+        "built_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,"
+        "PRIMARY KEY (cell_line, chrID)"
+        ");"
+    )
+    ensure_manifest_table(cur)
+    conn.commit()
+
+    cur.execute(
+        """
+        SELECT DISTINCT s.cell_line
+        FROM sequence s
+        LEFT JOIN (
+            SELECT cell_line, MIN(built_at) AS built_at FROM dataset_catalog GROUP BY 1
+        ) c USING (cell_line)
+        WHERE c.built_at IS NULL
+        OR EXISTS (
+            SELECT 1 FROM ingest_manifest m
+            WHERE m.status = 'complete'
+            AND split_part(split_part(m.file_name, '.', 1), '_', 1) = s.cell_line
+            AND m.finished_at > c.built_at
+        )
+        ORDER BY 1;
+    """
+    )
+    pending = [row[0] for row in cur.fetchall()]
+    cur.execute("DELETE FROM dataset_catalog WHERE cell_line NOT IN (SELECT DISTINCT cell_line FROM sequence);")
+    conn.commit()
+
+    if not pending:
+        print("Dataset catalog is up to date, skipping build.")
+    for cell_line in pending:
+        started = time.perf_counter()
+        cur.execute("DELETE FROM dataset_catalog WHERE cell_line = %s;", (cell_line,))
+        # Genes are counted per chromosome; gene.chromosome has no "chr" prefix
+        cur.execute(
+            """
+                INSERT INTO dataset_catalog (
+                    cell_line, chrID, min_bp, max_bp, sequences, contacts, contact_min_bp, contact_max_bp,
+                    fq_min, fq_max, fdr_min, fdr_max, epigenetic_marks, peaks, genes
+                )
+                SELECT s.cell_line, s.chrID, s.min_bp, s.max_bp, s.sequences,
+                       COALESCE(h.contacts, 0), h.contact_min_bp, h.contact_max_bp, h.fq_min, h.fq_max, h.fdr_min, h.fdr_max,
+                       COALESCE(e.epigenetic_marks, '{}'), COALESCE(e.peaks, 0), COALESCE(g.genes, 0)
+                FROM (
+                    SELECT cell_line, chrID, MIN(start_value) AS min_bp, MAX(end_value) AS max_bp, COUNT(*) AS sequences
+                    FROM sequence WHERE cell_line = %(cell_line)s GROUP BY 1, 2
+                ) s
+                LEFT JOIN (
+                    SELECT cell_line, chrID, COUNT(*) AS contacts,
+                           LEAST(MIN(ibp), MIN(jbp)) AS contact_min_bp, GREATEST(MAX(ibp), MAX(jbp)) AS contact_max_bp,
+                           MIN(fq) AS fq_min, MAX(fq) AS fq_max, MIN(fdr) AS fdr_min, MAX(fdr) AS fdr_max
+                    FROM non_random_hic WHERE cell_line = %(cell_line)s GROUP BY 1, 2
+                ) h USING (cell_line, chrID)
+                LEFT JOIN (
+                    SELECT cell_line, chrID, array_agg(DISTINCT epigenetic ORDER BY epigenetic) AS epigenetic_marks, COUNT(*) AS peaks
+                    FROM epigenetic_track WHERE cell_line = %(cell_line)s GROUP BY 1, 2
+                ) e USING (cell_line, chrID)
+                LEFT JOIN (
+                    SELECT 'chr' || chromosome AS chrID, COUNT(*) AS genes FROM gene GROUP BY 1
+                ) g USING (chrID);
+            """,
+            {"cell_line": cell_line},
+        )
+        conn.commit()
+        print(f"Dataset catalog for {cell_line}: {cur.rowcount} chromosome(s) in {time.perf_counter() - started:.2f}s.")
+
+    cur.close()
+    conn.close()
+
+
+def build_indexes():
+    """Build the secondary indexes of the hot queries (skipping existing ones) and refresh planner statistics."""
+    conn = get_db_connection(database=DB_NAME)
+    cur = conn.cursor()
+    cur.execute("SET maintenance_work_mem = %s;", (INDEX_BUILD_MEMORY,))
+
+    for index_name in RETIRED_INDEXES:
+        cur.execute(sql.SQL("DROP INDEX IF EXISTS {};").format(sql.Identifier(index_name)))
+    conn.commit()
+
+    for table_name, indexes in INDEX_DEFINITIONS.items():
+        for index_name, statement in indexes:
+            cur.execute("SELECT to_regclass(%s);", (index_name,))
+            if cur.fetchone()[0] is not None:
+                print(f"{index_name} already exists, skipping creation.")
+                continue
+
+            print(f"Creating {index_name}...")
+            started = time.perf_counter()
+            cur.execute(statement)
+            conn.commit()
+            print(f"{index_name} created in {time.perf_counter() - started:.2f}s.")
+
+        cur.execute(sql.SQL("ANALYZE {};").format(sql.Identifier(table_name)))
+        conn.commit()
+
+    cur.close()
+    conn.close()
+
+
+def plan_nodes(plan):
+    """Yield every node of an EXPLAIN (FORMAT JSON) plan tree."""
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def explain_scans(cur, query, params, table_name):
+    """Return (index scans, sequential scans on table_name or one of its partitions, whether the plan reads table_name at all)."""
+    cur.execute("SELECT relid::text FROM pg_partition_tree(%s);", (table_name,))
+    relations = {row[0] for row in cur.fetchall()} or {table_name}
+
+    cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+    nodes = list(plan_nodes(cur.fetchone()[0][0]["Plan"]))
+    index_scans = [
+        f"{node['Node Type']} using {node['Index Name']}" for node in nodes if "Index Name" in node
+    ]
+    seq_scans = [
+        node for node in nodes if node["Node Type"] == "Seq Scan" and node.get("Relation Name") in relations
+    ]
+    reads_table = any(node.get("Relation Name") in relations for node in nodes)
+    return index_scans, seq_scans, reads_table
+
+
+def verify_indexes():
+    """Check with EXPLAIN that every hot query in process.py can be answered from an index.
+
+    A query the planner only runs as a sequential scan because its table is still small is
+    reported but accepted; a query no index can serve raises RuntimeError.
+    """
+    conn = get_db_connection(database=DB_NAME)
+    cur = conn.cursor()
+    failures = []
+
+    for name, (query, params, table_name) in HOT_QUERIES.items():
+        index_scans, seq_scans, reads_table = explain_scans(cur, query, params, table_name)
+        if index_scans and not seq_scans:
+            print(f"{name}: {', '.join(index_scans)}.")
+            continue
+        if not reads_table:
+            # Every partition was pruned: the sample cell line or chromosome is not loaded
+            print(f"{name}: no {table_name} partition matches the sample parameters, skipping the check.")
+            continue
+
+        # Tell "no usable index" apart from "the planner prefers a scan of a small table"
+        cur.execute("SET LOCAL enable_seqscan = off;")
+        index_scans, seq_scans, _ = explain_scans(cur, query, params, table_name)
+        conn.rollback()
+        if index_scans and not seq_scans:
+            print(f"{name}: planner currently prefers a sequential scan of {table_name}, {', '.join(index_scans)} is available.")
+        else:
+            failures.append(name)
+            print(f"{name}: no index on {table_name} serves this query.")
+
+    cur.close()
+    conn.close()
+
+    if failures:
+        raise RuntimeError(f"Hot queries not served by an index: {', '.join(failures)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create the database schema and load the data in ROOT_DIR.")
+    parser.add_argument(
+        "--drop-cell-line",
+        action="append",
+        metavar="CELL_LINE",
+        help="drop a cell line instead of loading (remove or replace its files first, or they are loaded again on the next run)",
+    )
+    args = parser.parse_args()
+
+    if args.drop_cell_line:
+        for cell_line in args.drop_cell_line:
+            drop_cell_line(cell_line)
+        mark_data_changed()
+        get_interval_index()
+        raise SystemExit
 
-initialize_tables()
-insert_data()
-insert_non_random_HiC_data()
\ No newline at end of file
+    initialize_tables()
+    insert_data()
+    insert_non_random_HiC_data()
+    build_pyramid()
+    build_catalog()
+    build_indexes()
+    verify_indexes()
+    if CONTACT_BACKEND == "store":
+        build_contact_store(os.path.join(ROOT_DIR, "refined_processed_HiC"))
+    mark_data_changed()
+    get_interval_index()
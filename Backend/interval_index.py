@@ -0,0 +1,202 @@
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import quote, unquote
+
+import numpy as np
+import pandas as pd
+
+from precision import round_column
+
+INTERVAL_INDEX_DIR = os.getenv("INTERVAL_INDEX_DIR", "../Example_Data/interval_index")
+
+META_FILE = "_meta.json"
+VERSION_FILE = "_version"
+
+
+class IntervalTable:
+    """
+    Intervals of one key (a chromosome, or a (cell_line, chrID, epigenetic) track), sorted by start.
+
+    Every column is a memory-mapped .npy file; string columns are stored as one UTF-8 byte
+    buffer plus offsets, so workers share all of it through the page cache. ``max_end`` is the
+    running maximum of ``end``: it is non-decreasing, so the first interval that can reach a
+    position is found with a binary search, like the starts.
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+        self.path = path
+        self.kinds = meta["columns"]
+        self.start_column = meta["start"]
+        self.end_column = meta["end"]
+
+        def load(name):
+            # Plain ndarray views of the mapping skip the per-slice overhead of np.memmap
+            return np.asarray(np.load(os.path.join(path, name + ".npy"), mmap_mode="r"))
+
+        self._numeric = {}
+        self._strings = {}
+        for name, kind in self.kinds.items():
+            if kind == "string":
+                self._strings[name] = (load(name + ".data"), load(name + ".offsets"))
+            else:
+                self._numeric[name] = load(name)
+        self.start = self._numeric[self.start_column]
+        self.end = self._numeric[self.end_column]
+        self.max_end = load("_max_end")
+
+    def __len__(self):
+        return len(self.start)
+
+    def overlapping(self, start, end):
+        """Positions of the intervals with interval_start <= end and interval_end >= start."""
+        hi = int(np.searchsorted(self.start, end, side="right"))
+        lo = int(np.searchsorted(self.max_end[:hi], start, side="left"))
+        return lo + np.flatnonzero(self.end[lo:hi] >= start)
+
+    def contained(self, start, end):
+        """Positions of the intervals with start <= interval_start and interval_end <= end."""
+        lo = int(np.searchsorted(self.start, start, side="left"))
+        hi = int(np.searchsorted(self.start, end, side="right"))
+        return lo + np.flatnonzero(self.end[lo:hi] <= end)
+
+    def column(self, name, positions):
+        if name in self._numeric:
+            return np.asarray(self._numeric[name][positions])
+        if not len(positions):
+            return []
+        data, offsets = self._strings[name]
+        starts = offsets[positions]
+        ends = offsets[positions + 1]
+        # One copy of the covering byte range, then cheap slices of it
+        base = int(starts.min())
+        blob = bytes(data[base:int(ends.max())])
+        return [blob[start - base:end - base].decode() for start, end in zip(starts.tolist(), ends.tolist())]
+
+    def rows(self, positions, precision=None):
+        """
+        Materialize the given positions as row dicts (the shape RealDictCursor returned), with float
+        columns rounded to ``precision`` significant digits (see precision.field_digits).
+        """
+        values = {
+            name: column.tolist() if isinstance(column, np.ndarray) else column
+            for name, column in (
+                (name, round_column(name, self.column(name, positions), precision)) for name in self.kinds
+            )
+        }
+        return [dict(zip(values, row)) for row in zip(*values.values())]
+
+
+def write_interval_table(path, frame, start_column, end_column):
+    """Write a DataFrame as an IntervalTable sorted by (start, end)."""
+    os.makedirs(path)
+    frame = frame.sort_values([start_column, end_column], kind="stable")
+    kinds = {}
+    for name in frame.columns:
+        values = frame[name]
+        if not pd.api.types.is_numeric_dtype(values):
+            encoded = [str(value).encode() for value in values]
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            np.cumsum([len(value) for value in encoded], out=offsets[1:])
+            np.save(os.path.join(path, name + ".data.npy"), np.frombuffer(b"".join(encoded), dtype=np.uint8))
+            np.save(os.path.join(path, name + ".offsets.npy"), offsets)
+            kinds[name] = "string"
+        else:
+            values = values.to_numpy()
+            np.save(os.path.join(path, name + ".npy"), values)
+            kinds[name] = values.dtype.str
+    np.save(os.path.join(path, "_max_end.npy"), np.maximum.accumulate(frame[end_column].to_numpy()))
+    with open(os.path.join(path, META_FILE), "w") as f:
+        json.dump({"columns": kinds, "start": start_column, "end": end_column}, f)
+
+
+def _key_path(root, group, key):
+    return os.path.join(root, group, *(quote(str(part), safe="") for part in key))
+
+
+class IntervalIndex:
+    """
+    Directory of IntervalTables: ``genes/<chromosome>`` and ``tracks/<cell_line>/<chrID>/<epigenetic>``.
+
+    The whole directory is rebuilt into a staging directory and swapped in, so open tables keep
+    reading their old files until ``reload`` is called.
+    """
+
+    def __init__(self, root=INTERVAL_INDEX_DIR):
+        self.root = root
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def version(self):
+        try:
+            with open(os.path.join(self.root, VERSION_FILE)) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def reload(self):
+        with self._lock:
+            self._tables = {}
+
+    def table(self, group, *key):
+        cache_key = (group,) + key
+        with self._lock:
+            if cache_key not in self._tables:
+                path = _key_path(self.root, group, key)
+                self._tables[cache_key] = IntervalTable(path) if os.path.isdir(path) else None
+            return self._tables[cache_key]
+
+    def keys(self, group, *prefix):
+        """The next key level under a prefix, e.g. the epigenetic marks of (cell_line, chrID)."""
+        path = _key_path(self.root, group, prefix)
+        if not os.path.isdir(path):
+            return []
+        return sorted(unquote(name) for name in os.listdir(path))
+
+    @contextmanager
+    def build_lock(self):
+        """Serialize rebuilds across worker processes."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.root)), exist_ok=True)
+        with open(self.root + ".lock", "w") as lock_file:
+            # Poll instead of a blocking flock, which would stall every greenlet of a gevent worker
+            while True:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    time.sleep(0.2)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def build(self, groups, version):
+        """
+        Replace the index with ``groups``: {group: (frame, key_columns, start_column, end_column)}.
+        """
+        staging = f"{self.root}.tmp-{os.getpid()}"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+
+        for group, (frame, key_columns, start_column, end_column) in groups.items():
+            for key, part in frame.groupby(key_columns, sort=False):
+                key = key if isinstance(key, tuple) else (key,)
+                write_interval_table(_key_path(staging, group, key), part, start_column, end_column)
+
+        with open(os.path.join(staging, VERSION_FILE), "w") as f:
+            f.write(version)
+
+        if os.path.isdir(self.root):
+            retired = f"{self.root}.old-{os.getpid()}"
+            os.rename(self.root, retired)
+            os.rename(staging, self.root)
+            shutil.rmtree(retired)
+        else:
+            os.rename(staging, self.root)
+        self.reload()
@@ -0,0 +1,244 @@
+import inspect
+import os
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+from psycopg2.extras import RealDictCursor
+
+# Instrumentation only increments in-process counters; METRICS_ENABLED=false removes even that
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() not in ("0", "false", "no")
+
+# Distinct cell_line label values per process before new values are reported as "other"
+METRICS_MAX_CELL_LINES = int(os.getenv("METRICS_MAX_CELL_LINES", 50))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTE_BUCKETS = (1 << 10, 1 << 12, 1 << 14, 1 << 16, 1 << 18, 1 << 20, 1 << 22, 1 << 24, 1 << 26)
+FOLDING_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1200, 3600)
+
+REQUEST_SECONDS = Histogram(
+    "chrompolymer_request_duration_seconds",
+    "Request latency until the response is built.",
+    ["endpoint", "method", "status", "cell_line"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUEST_PHASE_SECONDS = Histogram(
+    "chrompolymer_request_phase_seconds",
+    "Request time per phase: db_wait (connection checkout), sql, compute (process.py outside SQL), respond (serialization).",
+    ["endpoint", "phase"],
+    buckets=LATENCY_BUCKETS,
+)
+RESPONSE_BYTES = Histogram(
+    "chrompolymer_response_bytes",
+    "Response body size (streamed responses are not counted).",
+    ["endpoint"],
+    buckets=BYTE_BUCKETS,
+)
+QUERY_SECONDS = Histogram(
+    "chrompolymer_query_duration_seconds",
+    "Latency of the query functions in process.py.",
+    ["function"],
+    buckets=LATENCY_BUCKETS,
+)
+SQL_SECONDS = Counter("chrompolymer_sql_seconds", "Time spent executing SQL and fetching rows.", ["function"])
+SQL_STATEMENTS = Counter("chrompolymer_sql_statements", "SQL statements executed.", ["function"])
+SQL_ROWS = Counter("chrompolymer_sql_rows", "Rows fetched from the database.", ["function"])
+DB_CHECKOUT_SECONDS = Histogram(
+    "chrompolymer_db_checkout_seconds", "Time waiting for a pooled connection.", buckets=LATENCY_BUCKETS
+)
+CACHE_LOOKUPS = Counter("chrompolymer_cache_lookups", "Cache lookups by outcome.", ["cache", "result"])
+FOLDING_SECONDS = Histogram(
+    "chrompolymer_sbif_duration_seconds", "sBIF folding run durations.", ["cell_line", "outcome"], buckets=FOLDING_BUCKETS
+)
+
+# The query function running in this thread/greenlet (SQL is attributed to it), and the
+# per-phase times of the request being served, if any
+_current_function = ContextVar("metrics_current_function", default=None)
+_request_phases = ContextVar("metrics_request_phases", default=None)
+
+_cell_lines = set()
+_cell_lines_lock = threading.Lock()
+
+
+def cell_line_label(value):
+    """Label value for a cell line, bounded to METRICS_MAX_CELL_LINES distinct values per process."""
+    if not isinstance(value, str) or not value:
+        return ""
+    if value in _cell_lines:
+        return value
+    with _cell_lines_lock:
+        if len(_cell_lines) >= METRICS_MAX_CELL_LINES:
+            return "other"
+        _cell_lines.add(value)
+    return value
+
+
+def _add_phase(phase, seconds):
+    phases = _request_phases.get()
+    if phases is not None:
+        phases[phase] = phases.get(phase, 0.0) + seconds
+
+
+def record_sql(seconds, rows=0, statements=0):
+    """Attribute SQL time, rows and statements to the query function running in this context."""
+    if not METRICS_ENABLED:
+        return
+    function = _current_function.get() or "other"
+    SQL_SECONDS.labels(function).inc(seconds)
+    if statements:
+        SQL_STATEMENTS.labels(function).inc(statements)
+    if rows:
+        SQL_ROWS.labels(function).inc(rows)
+    _add_phase("sql", seconds)
+
+
+def record_checkout(seconds):
+    if METRICS_ENABLED:
+        DB_CHECKOUT_SECONDS.observe(seconds)
+        _add_phase("db_wait", seconds)
+
+
+def record_cache(cache, hit):
+    if METRICS_ENABLED:
+        CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def record_folding(cell_line, seconds, outcome):
+    if METRICS_ENABLED:
+        FOLDING_SECONDS.labels(cell_line_label(cell_line), outcome).observe(seconds)
+
+
+def instrumented(func):
+    """
+    Time a process.py query function and attribute the SQL it runs to it.
+
+    Only the outermost query function of a request counts towards its "query" time, so
+    nested calls are not counted twice. Generators are timed while they produce items.
+    """
+    if not METRICS_ENABLED:
+        return func
+    name = func.__name__
+
+    if inspect.isgeneratorfunction(func):
+        @wraps(func)
+        def generator_wrapper(*args, **kwargs):
+            generator = func(*args, **kwargs)
+            elapsed = 0.0
+            try:
+                while True:
+                    token = _current_function.set(name)
+                    started = time.perf_counter()
+                    try:
+                        item = next(generator)
+                    except StopIteration:
+                        return
+                    finally:
+                        elapsed += time.perf_counter() - started
+                        _current_function.reset(token)
+                    yield item
+            finally:
+                generator.close()
+                QUERY_SECONDS.labels(name).observe(elapsed)
+        return generator_wrapper
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        outermost = _current_function.get() is None
+        token = _current_function.set(name)
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current_function.reset(token)
+            QUERY_SECONDS.labels(name).observe(elapsed)
+            if outermost:
+                _add_phase("query", elapsed)
+    return wrapper
+
+
+class InstrumentedCursor(RealDictCursor):
+    """RealDictCursor that reports statement and fetch times and fetched rows through record_sql."""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            record_sql(time.perf_counter() - started, statements=1)
+
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            record_sql(time.perf_counter() - started, statements=1)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        record_sql(time.perf_counter() - started, rows=0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(size) if size is not None else super().fetchmany()
+        record_sql(time.perf_counter() - started, rows=len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        record_sql(time.perf_counter() - started, rows=len(rows))
+        return rows
+
+
+cursor_factory = InstrumentedCursor if METRICS_ENABLED else RealDictCursor
+
+
+def start_request():
+    """Begin collecting the phases of a request; pass the result to finish_request."""
+    if not METRICS_ENABLED:
+        return None
+    phases = {}
+    return _request_phases.set(phases), phases, time.perf_counter()
+
+
+def finish_request(state, endpoint, method, status, cell_line, content_length):
+    if state is None:
+        return
+    token, phases, started = state
+    total = time.perf_counter() - started
+    _request_phases.reset(token)
+
+    REQUEST_SECONDS.labels(endpoint, method, str(status), cell_line_label(cell_line)).observe(total)
+    query = phases.get("query", 0.0)
+    db_wait = phases.get("db_wait", 0.0)
+    sql = phases.get("sql", 0.0)
+    for phase, seconds in (
+        ("db_wait", db_wait),
+        ("sql", sql),
+        ("compute", max(query - sql - db_wait, 0.0)),
+        ("respond", max(total - query, 0.0)),
+    ):
+        REQUEST_PHASE_SECONDS.labels(endpoint, phase).observe(seconds)
+    if content_length is not None:
+        RESPONSE_BYTES.labels(endpoint).observe(content_length)
+
+
+def exposition():
+    """
+    Return (body, content type) of the Prometheus text exposition.
+
+    Under gunicorn (PROMETHEUS_MULTIPROC_DIR set by gunicorn.conf.py) every worker writes its
+    samples to that directory and the scrape merges all workers.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
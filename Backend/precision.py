@@ -0,0 +1,72 @@
+import numpy as np
+
+# Scaling past 1e308 overflows, so subnormal values (below ~1e-308) round to zero
+_MAX_EXPONENT = 308
+
+# float32 has about 7 significant decimal digits; more only repeat the float64 widening error (0.1 -> 0.10000000149011612)
+FLOAT32_DIGITS = 7
+
+
+def field_digits(precision, name):
+    """
+    Significant digits requested for a field: ``precision`` is None (full precision), an int for
+    every float field, or {field: digits}.
+    """
+    if precision is None:
+        return None
+    if isinstance(precision, dict):
+        return precision.get(name)
+    return precision
+
+
+def round_significant(values, digits):
+    """
+    Round floats to ``digits`` significant digits, as float64 whose shortest repr has at most that many.
+
+    Significant rather than decimal digits, so small values such as an fdr of 1e-12 survive.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    nonzero = np.isfinite(values) & (values != 0)
+    if not nonzero.any():
+        return values.copy()
+    exponent = np.zeros(values.shape, dtype=np.int64)
+    exponent[nonzero] = digits - 1 - np.floor(np.log10(np.abs(values[nonzero]))).astype(np.int64)
+    exponent = np.clip(exponent, -_MAX_EXPONENT, _MAX_EXPONENT)
+    scale = 10.0 ** np.abs(exponent)
+    rounded = values.copy()
+    up = nonzero & (exponent >= 0)
+    down = nonzero & (exponent < 0)
+    rounded[up] = np.round(values[up] * scale[up]) / scale[up]
+    rounded[down] = np.round(values[down] / scale[down]) * scale[down]
+    return rounded
+
+
+def round_column(name, values, precision):
+    """
+    A float column rounded per ``precision``; other columns, and unrequested float64 fields, are returned as they are.
+
+    float32 columns are never given more than FLOAT32_DIGITS, so their JSON does not carry the widening error.
+    """
+    dtype = np.asarray(values).dtype
+    if not np.issubdtype(dtype, np.floating):
+        return values
+    digits = field_digits(precision, name)
+    if dtype == np.float32:
+        digits = FLOAT32_DIGITS if digits is None else min(digits, FLOAT32_DIGITS)
+    if digits is None:
+        return values
+    return round_significant(values, digits)
+
+
+def round_rows(rows, precision):
+    """Round the float values of row dicts in place per ``precision``."""
+    if precision is None or not rows:
+        return rows
+    for name, value in rows[0].items():
+        digits = field_digits(precision, name)
+        if digits is None or not isinstance(value, float):
+            continue
+        rounded = round_significant([row[name] for row in rows], digits).tolist()
+        for row, value in zip(rows, rounded):
+            row[name] = value
+    return rows
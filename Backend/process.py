@@ -1,12 +1,28 @@
 import pandas as pd
-import psycopg2
+import numpy as np
 import os
 import re
 import tempfile
+import hashlib
+import fcntl
 import subprocess
 import shutil
-from psycopg2.extras import RealDictCursor
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from psycopg2 import extensions
 from dotenv import load_dotenv
+from db_pool import ConnectionPool
+from cache import TTLCache, cached, data_version
+from columnar import copy_binary_columns
+from precision import round_column, round_rows
+from metrics import instrumented, record_cache, record_checkout, record_folding
+import metrics
+from contact_store import ContactStore
+from gene_index import GeneIndex
+from interval_index import IntervalIndex
+from folding_jobs import FoldingJobManager
 
 load_dotenv()
 
@@ -15,71 +31,659 @@ DB_HOST = os.getenv("DB_HOST")
 DB_USERNAME = os.getenv("DB_USERNAME")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_LEAK_TIMEOUT = float(os.getenv("DB_POOL_LEAK_TIMEOUT", 120))
+DB_POOL_PING_AFTER = float(os.getenv("DB_POOL_PING_AFTER", 30))
+# Server-side limit on one statement, in milliseconds (0 disables). This is the per-request bound of the
+# default gthread serving mode (WEB_REQUEST_TIMEOUT only applies under gevent); a cancelled statement is a 504
+DB_STATEMENT_TIMEOUT = int(os.getenv("DB_STATEMENT_TIMEOUT", 120000))
+
+# Where region contacts are read from: "postgres" (non_random_hic) or "store" (memory-mapped contact matrices)
+CONTACT_BACKEND = os.getenv("CONTACT_BACKEND", "postgres")
+
+_contact_store = None
+_contact_store_version = None
+_contact_store_lock = threading.Lock()
+
+# Rows per round trip (and per streamed chunk) of the server-side cursors used by the streaming responses
+STREAM_ITERSIZE = int(os.getenv("STREAM_ITERSIZE", 5000))
+
+# Regions whose contacts stay in memory, and for how many seconds, so the heatmap, the valid
+# bins and the folding input of one view share a single scan of non_random_hic
+REGION_MEMO_SIZE = int(os.getenv("REGION_MEMO_SIZE", 8))
+REGION_MEMO_TTL = float(os.getenv("REGION_MEMO_TTL", 60))
+
+# Bin size of the Hi-C contacts (the res of sBIF.sh)
+HIC_RESOLUTION = int(os.getenv("HIC_RESOLUTION", 5000))
+
+# Aggregated contact levels built at ingest, on top of the raw HIC_RESOLUTION contacts
+PYRAMID_RESOLUTIONS = [
+    int(resolution)
+    for resolution in os.getenv("PYRAMID_RESOLUTIONS", "10000,25000,50000,100000,250000,500000").split(",")
+]
+PYRAMID_MAX_BINS = int(os.getenv("PYRAMID_MAX_BINS", 1000))
+# How fq is combined over the contacts of a zoomed bin
+ZOOM_AGGREGATES = ("sum", "mean", "max")
+
+# Bin sizes of the epigenetic track summaries built with the interval index; windows of at most
+# EPIGENETIC_RAW_MAX_WIDTH bp get the raw peaks instead
+EPIGENETIC_BIN_RESOLUTIONS = sorted(
+    int(resolution)
+    for resolution in os.getenv("EPIGENETIC_BIN_RESOLUTIONS", "2000,10000,50000,250000,1000000").split(",")
+)
+EPIGENETIC_MAX_BINS = int(os.getenv("EPIGENETIC_MAX_BINS", 2000))
+EPIGENETIC_RAW_MAX_WIDTH = int(os.getenv("EPIGENETIC_RAW_MAX_WIDTH", 100000))
+
+FOLDING_INPUT_ROOT = "../Example_Data/Folding_input"
+# Contacts with fdr below FOLDING_ALPHA are folded
+FOLDING_ALPHA = float(os.getenv("FOLDING_ALPHA", 0.05))
+# Folding input files kept per region and alpha, so repeat folds skip building them
+FOLDING_INPUT_CACHE = os.path.join(FOLDING_INPUT_ROOT, "inputs")
+FOLDING_INPUT_CACHE_SIZE = int(os.getenv("FOLDING_INPUT_CACHE_SIZE", 512))
+# Samples folded per region, and how many sBIF runs may fold at the same time on the host (across all workers)
+FOLDING_SAMPLES = int(os.getenv("FOLDING_SAMPLES", 3))
+FOLDING_WORKERS = int(os.getenv("FOLDING_WORKERS", 2))
+# sBIF threads per fold
+FOLDING_THREADS = int(os.getenv("FOLDING_THREADS", 50))
+FOLDING_JOB_RETENTION = float(os.getenv("FOLDING_JOB_RETENTION", 3600))
+FOLDING_LOCK_POLL = 0.5
+
+# Total size of the packed structures kept in structure_cache; least recently used samples are evicted past it
+STRUCTURE_CACHE_MAX_BYTES = int(os.getenv("STRUCTURE_CACHE_MAX_BYTES", 1 << 30))
+# Folding parameters that change the structures; part of the structure cache key
+FOLDING_PARAMS = f"res={HIC_RESOLUTION};alpha={FOLDING_ALPHA};runs=1"
+
+# Pairwise bead distance results kept per region and sample set, and the most samples one ensemble may use
+DISTANCE_CACHE_SIZE = int(os.getenv("DISTANCE_CACHE_SIZE", 16))
+DISTANCE_CACHE_TTL = float(os.getenv("DISTANCE_CACHE_TTL", 3600))
+DISTANCE_MAX_SAMPLES = int(os.getenv("DISTANCE_MAX_SAMPLES", 100))
+
+# Parts of each cell line a comparison request can ask for ("structure" also needs a sample_id)
+COMPARISON_PARTS = ("contacts", "valid_ibp", "structure")
+
+# Gene chromosomes (without "chr") offered by the gene search; empty means the chromosomes loaded in sequence
+GENE_SEARCH_CHROMOSOMES = [chromosome for chromosome in os.getenv("GENE_SEARCH_CHROMOSOMES", "").split(",") if chromosome]
+GENE_SEARCH_LIMIT = int(os.getenv("GENE_SEARCH_LIMIT", 100))
+
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+_gene_index = None
+_gene_index_version = None
+_gene_index_lock = threading.Lock()
+
+_interval_index = None
+_interval_index_version = None
+_interval_index_lock = threading.Lock()
+
+_region_memo = TTLCache(maxsize=REGION_MEMO_SIZE, ttl=REGION_MEMO_TTL, name="region_memo")
+_distance_cache = TTLCache(maxsize=DISTANCE_CACHE_SIZE, ttl=DISTANCE_CACHE_TTL, name="distance")
+
+_folding_jobs = None
+_folding_jobs_lock = threading.Lock()
+
+
+"""
+Return the process-wide connection pool, creating it on first use (and again after a fork).
+"""
+def get_db_pool():
+    global _db_pool
+    with _db_pool_lock:
+        if _db_pool is None or _db_pool.pid != os.getpid():
+            _db_pool = ConnectionPool(
+                DB_POOL_MIN,
+                DB_POOL_MAX,
+                checkout_timeout=DB_POOL_TIMEOUT,
+                leak_timeout=DB_POOL_LEAK_TIMEOUT,
+                ping_after=DB_POOL_PING_AFTER,
+                host=DB_HOST,
+                database=DB_NAME,
+                user=DB_USERNAME,
+                password=DB_PASSWORD,
+                cursor_factory=metrics.cursor_factory,
+                options=f"-c statement_timeout={DB_STATEMENT_TIMEOUT}",
+            )
+        return _db_pool
+
+
+"""
+Check out a pooled database connection for the duration of a with block.
+"""
+@contextmanager
+def db_connection():
+    started = time.perf_counter()
+    with get_db_pool().connection() as conn:
+        record_checkout(time.perf_counter() - started)
+        yield conn
+
+
+"""
+Return the connection pool usage statistics (size, saturation, wait time, leaks).
+"""
+def db_pool_stats():
+    return get_db_pool().stats()
+
+
+"""
+Return the process-wide memory-mapped contact store, reopening its matrices after every ingest.
+"""
+def get_contact_store():
+    global _contact_store, _contact_store_version
+    version = data_version()[0]
+    with _contact_store_lock:
+        if _contact_store is None:
+            _contact_store = ContactStore()
+        elif _contact_store_version != version:
+            _contact_store.clear()
+        _contact_store_version = version
+        return _contact_store
+
+
+"""
+Returns the contacts (ibp, jbp, fq, fdr arrays) in the given cell line, chromosome name, start, end from the contact backend.
+Postgres scans are memoized for REGION_MEMO_TTL seconds, so every view of one region reads it once; the arrays are shared, do not modify them.
+"""
+def region_contact_arrays(cell_line, chromosome_name, sequences):
+    if not region_has_contacts(cell_line, chromosome_name, sequences):
+        return {name: np.empty(0, dtype=np.dtype(dtype).newbyteorder("=")) for name, dtype in CHROMOSOME_CONTACTS_COLUMNS}
+
+    if CONTACT_BACKEND == "store":
+        return get_contact_store().region(cell_line, chromosome_name, sequences["start"], sequences["end"])
+
+    return _region_memo.get_or_load(
+        (cell_line, chromosome_name, int(sequences["start"]), int(sequences["end"])),
+        lambda: scan_region_contacts(cell_line, chromosome_name, sequences),
+    )
+
+"""
+Returns False when the dataset catalog shows that the given cell line, chromosome name, start, end has no contacts,
+so the scan can be skipped
+"""
+def region_has_contacts(cell_line, chromosome_name, sequences):
+    stats = dataset_stats(cell_line, chromosome_name)
+    if stats is None or not stats["contacts"]:
+        return False
+    return sequences["start"] <= stats["contact_max_bp"] and sequences["end"] >= stats["contact_min_bp"]
+
+"""
+Reads the contacts (ibp, jbp, fq, fdr arrays) in the given cell line, chromosome name, start, end from non_random_hic
+"""
+def scan_region_contacts(cell_line, chromosome_name, sequences):
+    with db_connection() as conn:
+        return copy_binary_columns(
+            conn.cursor(),
+            CHROMOSOME_CONTACTS_QUERY,
+            (
+                chromosome_name,
+                cell_line,
+                sequences["start"],
+                sequences["end"],
+                sequences["start"],
+                sequences["end"],
+            ),
+            CHROMOSOME_CONTACTS_COLUMNS,
+        )
+
+"""
+Returns the contacts of several cell lines over the same chromosome name, start, end as {cell_line: arrays}, from one scan
+"""
+def region_contact_arrays_by_cell_line(cell_lines, chromosome_name, sequences):
+    # array_position() gives every row the first position of its cell line, so a repeated one would stay empty
+    cell_lines = list(dict.fromkeys(cell_lines))
+    if CONTACT_BACKEND == "store":
+        store = get_contact_store()
+        return {
+            cell_line: store.region(cell_line, chromosome_name, sequences["start"], sequences["end"])
+            for cell_line in cell_lines
+        }
+
+    with db_connection() as conn:
+        columns = copy_binary_columns(
+            conn.cursor(),
+            CHROMOSOME_CONTACTS_BY_CELL_LINES_QUERY,
+            (
+                cell_lines,
+                chromosome_name,
+                cell_lines,
+                sequences["start"],
+                sequences["end"],
+                sequences["start"],
+                sequences["end"],
+            ),
+            CHROMOSOME_CONTACTS_BY_CELL_LINES_COLUMNS,
+        )
+
+    order = np.argsort(columns["cell_line_index"], kind="stable")
+    bounds = np.searchsorted(columns["cell_line_index"][order], np.arange(1, len(cell_lines) + 2))
+    return {
+        cell_line: {
+            name: columns[name][order[bounds[index]:bounds[index + 1]]]
+            for name, _ in CHROMOSOME_CONTACTS_COLUMNS
+        }
+        for index, cell_line in enumerate(cell_lines)
+    }
+
+
+# Hot queries of the region views. init_db.py builds the indexes serving them and
+# checks with EXPLAIN that each one is answered from an index.
+GENE_INDEX_QUERY = """
+    SELECT symbol, chromosome, start_location, end_location
+    FROM gene
+    ORDER BY symbol, gene_id
+"""
+
+LOADED_CHROMOSOMES_QUERY = """
+    SELECT DISTINCT chrID
+    FROM dataset_catalog
+    WHERE genes > 0
+"""
+
+# dataset_catalog is built by init_db.py: one row of statistics per loaded (cell_line, chrID)
+DATASET_CATALOG_QUERY = """
+    SELECT *
+    FROM dataset_catalog
+    ORDER BY cell_line, substring(chrID from '^chr(\\d+)')::INT NULLS LAST, chrID
+"""
+
+CATALOG_CELL_LINES_QUERY = """
+    SELECT DISTINCT cell_line
+    FROM dataset_catalog
+    ORDER BY cell_line
+"""
+
+# Numbered chromosomes in numeric order, then the others by name
+CATALOG_CHROMOSOMES_QUERY = """
+    SELECT chrID
+    FROM dataset_catalog
+    WHERE cell_line = %s
+    ORDER BY substring(chrID from '^chr(\\d+)')::INT NULLS LAST, chrID
+"""
+
+DATASET_STATS_QUERY = """
+    SELECT *
+    FROM dataset_catalog
+    WHERE cell_line = %s
+    AND chrID = %s
+"""
+
+EPIGENETIC_TRACK_COLUMNS = [
+    ("start_value", np.int64),
+    ("end_value", np.int64),
+    ("peak", np.int64),
+    ("score", np.int32),
+    ("signal_value", np.float64),
+    ("p_value", np.float64),
+    ("q_value", np.float64),
+]
+
+GENE_INTERVALS_QUERY = """
+    SELECT *
+    FROM gene
+    ORDER BY chromosome, start_location
+"""
+
+EPIGENETIC_TRACK_INTERVALS_QUERY = """
+    SELECT *
+    FROM epigenetic_track
+    ORDER BY cell_line, chrID, epigenetic, start_value
+"""
+
+CHROMOSOME_DATA_QUERY = """
+    SELECT cell_line, chrid, fdr, ibp, jbp, fq
+    FROM non_random_hic
+    WHERE chrID = %s
+    AND cell_line = %s
+    AND ibp >= %s
+    AND ibp <= %s
+    AND jbp >= %s
+    AND jbp <= %s
+"""
+
+CHROMOSOME_CONTACTS_QUERY = """
+    SELECT ibp, jbp, fq, fdr
+    FROM non_random_hic
+    WHERE chrID = %s
+    AND cell_line = %s
+    AND ibp >= %s
+    AND ibp <= %s
+    AND jbp >= %s
+    AND jbp <= %s
+"""
+
+# The sBIF input (chrid, ibp, jbp, fq, weight) of the significant contacts in a region
+FOLDING_INPUT_QUERY = """
+    SELECT chrid, ibp, jbp, fq, 1 AS w
+    FROM non_random_hic
+    WHERE chrID = %s
+    AND cell_line = %s
+    AND ibp >= %s
+    AND ibp <= %s
+    AND jbp >= %s
+    AND jbp <= %s
+    AND fdr < %s
+"""
+
+# Binary COPY layout of CHROMOSOME_CONTACTS_QUERY (BIGINT and FLOAT columns)
+CHROMOSOME_CONTACTS_COLUMNS = [("ibp", ">i8"), ("jbp", ">i8"), ("fq", ">f8"), ("fdr", ">f8")]
+
+# One scan for several cell lines; the cell line comes back as its (1-based) position in the
+# requested list, so every column stays fixed-width for the binary COPY
+CHROMOSOME_CONTACTS_BY_CELL_LINES_QUERY = """
+    SELECT array_position(%s::text[], cell_line::text)::INT AS cell_line_index, ibp, jbp, fq, fdr
+    FROM non_random_hic
+    WHERE chrID = %s
+    AND cell_line = ANY(%s)
+    AND ibp >= %s
+    AND ibp <= %s
+    AND jbp >= %s
+    AND jbp <= %s
+"""
+CHROMOSOME_CONTACTS_BY_CELL_LINES_COLUMNS = [("cell_line_index", ">i4")] + CHROMOSOME_CONTACTS_COLUMNS
+
+PYRAMID_QUERY = """
+    SELECT ibp, jbp, fq_sum, fq_max, fdr_min, contacts
+    FROM non_random_hic_pyramid
+    WHERE chrID = %s
+    AND cell_line = %s
+    AND resolution = %s
+    AND ibp >= %s
+    AND ibp <= %s
+    AND jbp >= %s
+    AND jbp <= %s
+"""
+
+PYRAMID_COLUMNS = [
+    ("ibp", ">i8"),
+    ("jbp", ">i8"),
+    ("fq_sum", ">f8"),
+    ("fq_max", ">f8"),
+    ("fdr_min", ">f8"),
+    ("contacts", ">i4"),
+]
+
+# A hit also refreshes the LRU timestamp, in the same round trip
+STRUCTURE_LOOKUP_QUERY = """
+    UPDATE structure_cache
+    SET last_access = CURRENT_TIMESTAMP, hits = hits + 1
+    WHERE cell_line = %s
+    AND chrID = %s
+    AND start_value = %s
+    AND end_value = %s
+    AND params = %s
+    AND sampleID = %s
+    RETURNING n_beads, coords
+"""
+
+STRUCTURE_STORE_QUERY = """
+    INSERT INTO structure_cache (cell_line, chrID, start_value, end_value, params, sampleID, n_beads, coords, nbytes)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON CONFLICT (cell_line, chrID, start_value, end_value, params, sampleID) DO UPDATE
+    SET n_beads = EXCLUDED.n_beads, coords = EXCLUDED.coords, nbytes = EXCLUDED.nbytes,
+        created_at = CURRENT_TIMESTAMP, last_access = CURRENT_TIMESTAMP
+"""
+
+# Keep the most recently used samples that fit in the byte budget, evict the rest
+STRUCTURE_EVICT_QUERY = """
+    DELETE FROM structure_cache s
+    USING (
+        SELECT cell_line, chrID, start_value, end_value, params, sampleID,
+            SUM(nbytes) OVER (
+                ORDER BY last_access DESC, cell_line, chrID, start_value, end_value, params, sampleID
+            ) AS kept_bytes
+        FROM structure_cache
+    ) ranked
+    WHERE ranked.kept_bytes > %s
+    AND s.cell_line = ranked.cell_line
+    AND s.chrID = ranked.chrID
+    AND s.start_value = ranked.start_value
+    AND s.end_value = ranked.end_value
+    AND s.params = ranked.params
+    AND s.sampleID = ranked.sampleID
+"""
+
+STRUCTURE_CACHE_STATS_QUERY = """
+    SELECT COUNT(*) AS samples, COALESCE(SUM(nbytes), 0)::BIGINT AS bytes, COALESCE(SUM(hits), 0)::BIGINT AS hits
+    FROM structure_cache
+"""
+
+# sBIF writes one position row per bead; they are staged there until packed into structure_cache
+STAGED_POSITIONS_QUERY = """
+    SELECT sampleID, X, Y, Z
+    FROM position
+    WHERE chrID = %s
+    AND cell_line = %s
+    AND start_value = %s
+    AND end_value = %s
+    ORDER BY sampleID, pID
+"""
+STAGED_POSITIONS_COLUMNS = [("sampleid", ">i4"), ("x", ">f8"), ("y", ">f8"), ("z", ">f8")]
+
+# Samples sBIF has finished but pack_folded_samples has not moved yet are read from their staged rows
+STAGED_SAMPLES_QUERY = """
+    SELECT sampleID, X, Y, Z
+    FROM position
+    WHERE chrID = %s
+    AND cell_line = %s
+    AND start_value = %s
+    AND end_value = %s
+    AND sampleID = ANY(%s)
+    ORDER BY sampleID, pID
+"""
+
+DELETE_STAGED_POSITIONS_QUERY = """
+    DELETE FROM position
+    WHERE chrID = %s
+    AND cell_line = %s
+    AND start_value = %s
+    AND end_value = %s
+"""
+
+STRUCTURE_SAMPLES_QUERY = """
+    UPDATE structure_cache
+    SET last_access = CURRENT_TIMESTAMP, hits = hits + 1
+    WHERE cell_line = %s
+    AND chrID = %s
+    AND start_value = %s
+    AND end_value = %s
+    AND params = %s
+    AND sampleID = ANY(%s)
+    RETURNING sampleID, n_beads, coords
+"""
+
+FOLDED_SAMPLES_QUERY = """
+    SELECT sampleID
+    FROM structure_cache
+    WHERE chrID = %s
+    AND cell_line = %s
+    AND start_value = %s
+    AND end_value = %s
+    AND params = %s
+    UNION
+    SELECT sampleID
+    FROM position
+    WHERE chrID = %s
+    AND cell_line = %s
+    AND start_value = %s
+    AND end_value = %s
+    ORDER BY sampleID
+"""
+
+# When each sample was written (packed, or staged by sBIF), so results derived from a sample that was
+# evicted and folded again are not reused
+STRUCTURE_GENERATIONS_QUERY = """
+    SELECT sampleID, created_at AS written_at
+    FROM structure_cache
+    WHERE cell_line = %s
+    AND chrID = %s
+    AND start_value = %s
+    AND end_value = %s
+    AND params = %s
+    AND sampleID = ANY(%s)
+    UNION ALL
+    SELECT sampleID, MAX(insert_time) AS written_at
+    FROM position
+    WHERE cell_line = %s
+    AND chrID = %s
+    AND start_value = %s
+    AND end_value = %s
+    AND sampleID = ANY(%s)
+    GROUP BY sampleID
+    ORDER BY sampleID, written_at
+"""
+
 
 """
-Establish a connection to the database.
+Return the in-memory gene symbol index, (re)loading it on first use and after every ingest.
 """
-def get_db_connection():
-    conn = psycopg2.connect(
-        host=DB_HOST,
-        database=DB_NAME,
-        user=DB_USERNAME,
-        password=DB_PASSWORD,
-        cursor_factory=RealDictCursor,
+def get_gene_index():
+    global _gene_index, _gene_index_version
+    version = data_version()[0]
+    with _gene_index_lock:
+        if _gene_index is None or _gene_index_version != version:
+            with db_connection() as conn:
+                cur = conn.cursor()
+                cur.execute(GENE_INDEX_QUERY)
+                genes = cur.fetchall()
+
+                chromosomes = set(GENE_SEARCH_CHROMOSOMES)
+                if not chromosomes:
+                    cur.execute(LOADED_CHROMOSOMES_QUERY)
+                    chromosomes = {re.sub(r"^chr", "", row["chrid"]) for row in cur.fetchall()}
+
+            _gene_index = GeneIndex(genes, chromosomes)
+            _gene_index_version = version
+            print(f"Gene index loaded: {len(_gene_index)} searchable symbols on chromosomes {sorted(chromosomes)}.")
+        return _gene_index
+
+
+"""
+Rebuild the gene and epigenetic track interval index from the database.
+"""
+def build_interval_index(index, version):
+    def fetch_frame(cur, query):
+        cur.execute(query)
+        rows = cur.fetchall()
+        return pd.DataFrame(rows, columns=[desc[0] for desc in cur.description])
+
+    with db_connection() as conn:
+        cur = conn.cursor()
+        genes = fetch_frame(cur, GENE_INTERVALS_QUERY)
+        tracks = fetch_frame(cur, EPIGENETIC_TRACK_INTERVALS_QUERY)
+
+    track_bins = epigenetic_track_bins(tracks)
+    index.build(
+        {
+            "genes": (genes, ["chromosome"], "start_location", "end_location"),
+            "tracks": (tracks, ["cell_line", "chrid", "epigenetic"], "start_value", "end_value"),
+            "track_bins": (track_bins, ["cell_line", "chrid", "epigenetic", "resolution"], "bin_start", "bin_end"),
+        },
+        version,
+    )
+    print(
+        f"Interval index built: {len(genes)} genes, {len(tracks)} epigenetic track peaks, "
+        f"{len(track_bins)} track summary bins."
     )
-    return conn
+
+
+"""
+Summarize epigenetic track peaks into the non-empty bins of every EPIGENETIC_BIN_RESOLUTIONS level, per
+(cell_line, chrid, epigenetic): max and mean signal_value, peak count and min q_value of the peaks overlapping a bin
+"""
+def epigenetic_track_bins(tracks):
+    keys = ["cell_line", "chrid", "epigenetic"]
+    columns = keys + ["signal_max", "signal_mean", "peaks", "q_value_min", "resolution", "bin_start", "bin_end"]
+    # An empty fetch gives object columns, which cannot be binned
+    if tracks.empty:
+        return pd.DataFrame(columns=columns)
+
+    frames = []
+    for resolution in EPIGENETIC_BIN_RESOLUTIONS:
+        first = tracks["start_value"].to_numpy(dtype=np.int64) // resolution
+        spans = tracks["end_value"].to_numpy(dtype=np.int64) // resolution - first + 1
+        # One row per (peak, overlapped bin)
+        expanded = tracks.loc[tracks.index.repeat(spans), keys + ["signal_value", "q_value"]]
+        expanded["bin"] = np.repeat(first, spans) + np.arange(spans.sum()) - np.repeat(np.cumsum(spans) - spans, spans)
+        summary = expanded.groupby(keys + ["bin"], sort=False).agg(
+            signal_max=("signal_value", "max"),
+            signal_mean=("signal_value", "mean"),
+            peaks=("signal_value", "size"),
+            q_value_min=("q_value", "min"),
+        ).reset_index()
+        summary["resolution"] = resolution
+        summary["bin_start"] = summary["bin"] * resolution
+        summary["bin_end"] = summary["bin_start"] + resolution - 1
+        frames.append(summary.drop(columns="bin"))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+
+
+"""
+Return the interval index of the current data version, building it if no worker has yet.
+"""
+def get_interval_index():
+    global _interval_index, _interval_index_version
+    version = data_version()[0]
+    with _interval_index_lock:
+        if _interval_index is None:
+            _interval_index = IntervalIndex()
+        if _interval_index_version != version:
+            if _interval_index.version() != version:
+                with _interval_index.build_lock():
+                    if _interval_index.version() != version:
+                        build_interval_index(_interval_index, version)
+            _interval_index.reload()
+            _interval_index_version = version
+        return _interval_index
+
 
 """
 Return the list of genes
 """
+@instrumented
+@cached
 def gene_names_list():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT DISTINCT symbol
-        FROM gene
-        WHERE chromosome = '12' OR chromosome = '17'
-    """
-    )
-    rows = cur.fetchall()
-    options = [{"value": row["symbol"], "label": row["symbol"]} for row in rows]
-    conn.close()
-    return options
+    return [{"value": symbol, "label": symbol} for symbol in get_gene_index().symbols]
 
 """
-Return the gene name list in searching specific letters
+Return the gene name list in searching specific letters, ranked exact, prefix, then substring matches
 """
-def gene_names_list_search(search):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT DISTINCT symbol
-        FROM gene
-        WHERE symbol ILIKE %s
-        AND (chromosome = '12' OR chromosome = '17')
-    """,
-        (f"%{search}%",),
-    )
-    rows = cur.fetchall()
-    options = [{"value": row["symbol"], "label": row["symbol"]} for row in rows]
-    conn.close()
-    return options
+@instrumented
+def gene_names_list_search(search, limit=GENE_SEARCH_LIMIT):
+    return [{"value": symbol, "label": symbol} for symbol in get_gene_index().search(search, limit)]
+
+"""
+Returns the dataset catalog: the statistics of every loaded cell line and chromosome
+"""
+@instrumented
+@cached
+def dataset_catalog():
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(DATASET_CATALOG_QUERY)
+        return [dict(row, built_at=row["built_at"].isoformat()) for row in cur.fetchall()]
+
+"""
+Returns the dataset catalog statistics of the given cell line, chromosome name, or None when it is not loaded
+"""
+@cached
+def dataset_stats(cell_line, chromosome_name):
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(DATASET_STATS_QUERY, (cell_line, chromosome_name))
+        row = cur.fetchone()
+    return dict(row) if row is not None else None
 
 """
 Returns the list of cell line
 """
+@instrumented
+@cached
 def cell_lines_list():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT DISTINCT cell_line
-        FROM sequence
-    """
-    )
-    rows = cur.fetchall()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(CATALOG_CELL_LINES_QUERY)
+        rows = cur.fetchall()
 
     label_mapping = {
         "IMR": "Lung(IMR90)",
@@ -94,162 +698,116 @@ def cell_lines_list():
         for row in rows
     ]
 
-    conn.close()
     return options
 
 
 """
 Returns the list of chromosomes in the cell line
 """
+@instrumented
+@cached
 def chromosomes_list(cell_line):
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    cur.execute(
-        """
-        SELECT DISTINCT chrID
-        FROM sequence
-        WHERE cell_line = %s
-    """,
-        (cell_line,),
-    )
-
-    chromosomes = [row["chrid"] for row in cur.fetchall()]
-
-    def sort_key(chromosome):
-        match = re.match(r"chr(\d+|\D+)", chromosome)
-        if match:
-            value = match.group(1)
-            return (int(value) if value.isdigit() else float("inf"), value)
-        return (float("inf"), "")
-
-    sorted_chromosomes_list = sorted(chromosomes, key=sort_key)
-    sorted_chromosomes_list = [
-        {"value": chrom, "label": chrom} for chrom in sorted_chromosomes_list
-    ]
-
-    conn.close()
-    return sorted_chromosomes_list
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(CATALOG_CHROMOSOMES_QUERY, (cell_line,))
+        return [{"value": row["chrid"], "label": row["chrid"]} for row in cur.fetchall()]
 
 
 """
 Return the chromosome size in the given chromosome name
 """
+@instrumented
+@cached
 def chromosome_size(chromosome_name):
-    conn = get_db_connection()
-    cur = conn.cursor()
+    with db_connection() as conn:
+        cur = conn.cursor()
 
-    cur.execute(
-        """
-        SELECT size
-        FROM chromosome
-        WHERE chrID = %s
-    """,
-        (chromosome_name,),
-    )
+        cur.execute(
+            """
+            SELECT size
+            FROM chromosome
+            WHERE chrID = %s
+        """,
+            (chromosome_name,),
+        )
 
-    size = cur.fetchone()["size"]
-    conn.close()
+        size = cur.fetchone()["size"]
     return size
 
 
 """
 Returns the all sequences of the chromosome data in the given cell line, chromosome name
 """
+@instrumented
 def chromosome_sequences(cell_line, chromosome_name):
-    conn = get_db_connection()
-    cur = conn.cursor()
+    with db_connection() as conn:
+        cur = conn.cursor()
 
-    cur.execute(
-        """
-        SELECT start_value, end_value
-        FROM sequence
-        WHERE cell_line = %s
-        AND chrID = %s
-        ORDER BY start_value
-    """,
-        (cell_line, chromosome_name),
-    )
+        cur.execute(
+            """
+            SELECT start_value, end_value
+            FROM sequence
+            WHERE cell_line = %s
+            AND chrID = %s
+            ORDER BY start_value
+        """,
+            (cell_line, chromosome_name),
+        )
 
-    ranges = [
-        {"start": row["start_value"], "end": row["end_value"]} for row in cur.fetchall()
-    ]
+        ranges = [
+            {"start": row["start_value"], "end": row["end_value"]} for row in cur.fetchall()
+        ]
 
-    conn.close()
     return ranges
 
 
 """
 Return the chromosome size in the given gene name
 """
+@instrumented
 def chromosome_size_by_gene_name(gene_name):
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    cur.execute(
-        """
-        SELECT chromosome, start_location, end_location
-        FROM gene
-        WHERE symbol = %s
-    """,
-        (gene_name,),
-    )
-
-    gene = cur.fetchone()
-    conn.close()
-    return gene
+    return get_gene_index().lookup(gene_name)
 
 
 """
 Returns the existing chromosome data in the given cell line, chromosome name, start, end
+Floats are rounded to precision significant digits: an int for every float field, or {field: digits}
 """
-def chromosome_data(cell_line, chromosome_name, sequences):
-    conn = get_db_connection()
-    cur = conn.cursor()
+@instrumented
+def chromosome_data(cell_line, chromosome_name, sequences, precision=None):
+    columns = region_contact_arrays(cell_line, chromosome_name, sequences)
+    return contact_rows(cell_line, chromosome_name, columns, precision)
 
-    cur.execute(
-        """
-        SELECT cell_line, chrid, fdr, ibp, jbp, fq
-        FROM non_random_hic
-        WHERE chrID = %s
-        AND cell_line = %s
-        AND ibp >= %s
-        AND ibp <= %s
-        AND jbp >= %s
-        AND jbp <= %s
-    """,
-        (
-            chromosome_name,
-            cell_line,
-            sequences["start"],
-            sequences["end"],
-            sequences["start"],
-            sequences["end"],
-        ),
+"""
+Convert contact arrays to the row dicts of the JSON responses, rounding the floats to precision
+"""
+def contact_rows(cell_line, chromosome_name, columns, precision=None):
+    ibps, jbps, fqs, fdrs = (
+        round_column(name, columns[name], precision).tolist() for name in ("ibp", "jbp", "fq", "fdr")
     )
-    chromosome_sequence = cur.fetchall()
-    conn.close()
-
-    return chromosome_sequence
+    return [
+        {"cell_line": cell_line, "chrid": chromosome_name, "fdr": fdr, "ibp": ibp, "jbp": jbp, "fq": fq}
+        for ibp, jbp, fq, fdr in zip(ibps, jbps, fqs, fdrs)
+    ]
 
 """
-Returns the existing chromosome data in the given cell line, chromosome name, start, end
+Yields the chromosome data in the given cell line, chromosome name, start, end in lists of at most chunk_size rows.
+Rows are read through a server-side cursor, so only one chunk is in memory at a time.
 """
-def chromosome_valid_ibp_data(cell_line, chromosome_name, sequences):
-        conn = get_db_connection()
-        cur = conn.cursor()
-
+@instrumented
+def chromosome_data_chunks(cell_line, chromosome_name, sequences, chunk_size=STREAM_ITERSIZE, precision=None):
+    if CONTACT_BACKEND == "store":
+        columns = region_contact_arrays(cell_line, chromosome_name, sequences)
+        for start in range(0, len(columns["ibp"]), chunk_size):
+            chunk = {name: values[start:start + chunk_size] for name, values in columns.items()}
+            yield contact_rows(cell_line, chromosome_name, chunk, precision)
+        return
+
+    with db_connection() as conn:
+        cur = conn.cursor(name=f"chromosome_data_{uuid.uuid4().hex}")
+        cur.itersize = chunk_size
         cur.execute(
-            """
-            SELECT DISTINCT ibp
-            FROM non_random_hic
-            WHERE chrID = %s
-            AND cell_line = %s
-            AND ibp >= %s
-            AND ibp <= %s
-            AND jbp >= %s
-            AND jbp <= %s
-        """,
+            CHROMOSOME_DATA_QUERY,
             (
                 chromosome_name,
                 cell_line,
@@ -259,129 +817,606 @@ def chromosome_valid_ibp_data(cell_line, chromosome_name, sequences):
                 sequences["end"],
             ),
         )
-        chromosome_valid_ibps = cur.fetchall()
-        conn.close()
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield round_rows(rows, precision)
+        cur.close()
 
-        ibp_values = [ibp["ibp"] for ibp in chromosome_valid_ibps]
+"""
+Returns the chromosome data in the given cell line, chromosome name, start, end as shared fields and typed columns.
+ibp/jbp are int32 bin indices from the region origin (bp offsets when a contact is off the bin grid), fq/fdr are float32.
+"""
+@instrumented
+def chromosome_data_columns(cell_line, chromosome_name, sequences):
+    origin, resolution, binned = binned_contact_columns([region_contact_arrays(cell_line, chromosome_name, sequences)], sequences)
+
+    fields = {
+        "cell_line": cell_line,
+        "chrid": chromosome_name,
+        "origin": origin,
+        "resolution": resolution,
+        "count": int(binned[0]["ibp"].size),
+    }
+    return fields, binned[0]
+
+"""
+Convert contact arrays of one region to int32 bin indices from a shared origin (bp offsets when any contact is
+off the bin grid) and float32 fq/fdr. Returns (origin, resolution, [binned columns]).
+"""
+def binned_contact_columns(contact_arrays, sequences):
+    resolution = HIC_RESOLUTION
+    origin = sequences["start"] - sequences["start"] % resolution
+    offsets = [(columns["ibp"] - origin, columns["jbp"] - origin) for columns in contact_arrays]
+    if any((ibp % resolution).any() or (jbp % resolution).any() for ibp, jbp in offsets):
+        resolution = 1
+
+    binned = [
+        {
+            "ibp": (ibp // resolution).astype(np.int32),
+            "jbp": (jbp // resolution).astype(np.int32),
+            "fq": columns["fq"].astype(np.float32),
+            "fdr": columns["fdr"].astype(np.float32),
+        }
+        for columns, (ibp, jbp) in zip(contact_arrays, offsets)
+    ]
+    return origin, resolution, binned
+
+"""
+Returns the finest contact resolution whose bins across the region fit in max_bins (the coarsest level otherwise)
+"""
+def zoom_resolution(sequences, max_bins):
+    width = sequences["end"] - sequences["start"] + 1
+    for resolution in sorted({HIC_RESOLUTION, *PYRAMID_RESOLUTIONS}):
+        if -(-width // resolution) <= max_bins:
+            return resolution
+    return max(HIC_RESOLUTION, *PYRAMID_RESOLUTIONS)
 
-        return ibp_values
 
 """
-Returns the example(3) 3D chromosome data in the given cell line, chromosome name, start, end
+Returns the chromosome data in the given cell line, chromosome name, start, end aggregated to at most max_bins bins per axis.
+fq is aggregated with "sum", "mean" or "max" over the contacts of a bin and fdr is the minimum.
 """
-def example_chromosome_3d_data(cell_line, chromosome_name, sequences, sample_id):
-    conn = get_db_connection()
-    cur = conn.cursor()
+@instrumented
+def chromosome_data_at_zoom_columns(cell_line, chromosome_name, sequences, max_bins, aggregate="sum"):
+    max_bins = max(1, min(int(max_bins), PYRAMID_MAX_BINS))
+    resolution = zoom_resolution(sequences, max_bins)
+
+    if resolution == HIC_RESOLUTION:
+        fields, columns = chromosome_data_columns(cell_line, chromosome_name, sequences)
+        columns["contacts"] = np.ones(fields["count"], dtype=np.int32)
+        fields["bins"] = max_bins
+        return fields, columns
+
+    origin = sequences["start"] - sequences["start"] % resolution
+    with db_connection() as conn:
+        columns = copy_binary_columns(
+            conn.cursor(),
+            PYRAMID_QUERY,
+            (chromosome_name, cell_line, resolution, origin, sequences["end"], origin, sequences["end"]),
+            PYRAMID_COLUMNS,
+        )
+
+    if aggregate == "max":
+        fq = columns["fq_max"]
+    elif aggregate == "mean":
+        fq = columns["fq_sum"] / columns["contacts"]
+    else:
+        fq = columns["fq_sum"]
+
+    fields = {
+        "cell_line": cell_line,
+        "chrid": chromosome_name,
+        "origin": origin,
+        "resolution": resolution,
+        "count": int(columns["ibp"].size),
+        "bins": max_bins,
+    }
+    return fields, {
+        "ibp": ((columns["ibp"] - origin) // resolution).astype(np.int32),
+        "jbp": ((columns["jbp"] - origin) // resolution).astype(np.int32),
+        "fq": fq.astype(np.float32),
+        "fdr": columns["fdr_min"].astype(np.float32),
+        "contacts": columns["contacts"],
+    }
+
 
-    def delete_old_samples(conn):
-        """Delete old samples from the position table."""
+"""
+Returns the chromosome data in the given cell line, chromosome name, start, end at the zoom level fitting max_bins,
+as {"resolution": ..., "data": [contacts with bp coordinates]}
+"""
+@instrumented
+def chromosome_data_at_zoom(cell_line, chromosome_name, sequences, max_bins, aggregate="sum"):
+    fields, columns = chromosome_data_at_zoom_columns(cell_line, chromosome_name, sequences, max_bins, aggregate)
+    ibp = (fields["origin"] + columns["ibp"].astype(np.int64) * fields["resolution"]).tolist()
+    jbp = (fields["origin"] + columns["jbp"].astype(np.int64) * fields["resolution"]).tolist()
+    data = [
+        {"cell_line": cell_line, "chrid": chromosome_name, "fdr": fdr, "ibp": i, "jbp": j, "fq": fq, "contacts": contacts}
+        for i, j, fq, fdr, contacts in zip(
+            ibp, jbp, columns["fq"].tolist(), columns["fdr"].tolist(), columns["contacts"].tolist()
+        )
+    ]
+    return {"resolution": fields["resolution"], "data": data}
+
+"""
+Returns the distinct ibp values of the contacts in the given cell line, chromosome name, start, end
+"""
+@instrumented
+def chromosome_valid_ibp_data(cell_line, chromosome_name, sequences):
+    return np.unique(region_contact_arrays(cell_line, chromosome_name, sequences)["ibp"]).tolist()
+
+"""
+Returns the contacts and the valid ibp values of the given cell line, chromosome name, start, end from one scan
+"""
+@instrumented
+def chromosome_region_data(cell_line, chromosome_name, sequences, precision=None):
+    return {
+        "data": chromosome_data(cell_line, chromosome_name, sequences, precision),
+        "valid_ibps": chromosome_valid_ibp_data(cell_line, chromosome_name, sequences),
+    }
+
+"""
+Returns the region memo size and hit rate
+"""
+def region_memo_stats():
+    return _region_memo.stats()
+
+"""
+Returns the sample ids already folded (cached, or still staged in position) for the given cell line, chromosome name, start, end
+"""
+def folded_samples(cell_line, chromosome_name, sequences):
+    region = (chromosome_name, cell_line, sequences["start"], sequences["end"])
+    with db_connection() as conn:
         cur = conn.cursor()
+        cur.execute(FOLDED_SAMPLES_QUERY, region + (FOLDING_PARAMS,) + region)
+        return [row["sampleid"] for row in cur.fetchall()]
 
-        cur.execute("""
-            DELETE FROM position
-            WHERE insert_time < CURRENT_TIMESTAMP - INTERVAL '10 minutes';
-        """)
 
-        print("Old samples deleted successfully.")
-    
-    delete_old_samples(conn)
-    
-    temp_folding_input_path = "../Example_Data/Folding_input"
-    def get_spe_inter(hic_data, alpha=0.05):
-        """Filter Hi-C data for significant interactions based on the alpha threshold."""
-        hic_spe = hic_data.loc[hic_data["fdr"] < alpha]
-        return hic_spe
+"""
+Move the position rows sBIF wrote for the given region into structure_cache, one packed float32 (x, y, z) array per sample
+"""
+def pack_folded_samples(cell_line, chromosome_name, sequences):
+    region = (chromosome_name, cell_line, sequences["start"], sequences["end"])
+    with db_connection() as conn:
+        cur = conn.cursor()
+        staged = copy_binary_columns(cur, STAGED_POSITIONS_QUERY, region, STAGED_POSITIONS_COLUMNS)
+        if not len(staged["sampleid"]):
+            return 0
+
+        coords = np.column_stack([staged["x"], staged["y"], staged["z"]]).astype("<f4")
+        sample_ids, starts = np.unique(staged["sampleid"], return_index=True)
+        bounds = starts.tolist() + [len(coords)]
+        for index, sample_id in enumerate(sample_ids.tolist()):
+            packed = coords[bounds[index]:bounds[index + 1]].tobytes()
+            cur.execute(
+                STRUCTURE_STORE_QUERY,
+                (
+                    cell_line, chromosome_name, sequences["start"], sequences["end"], FOLDING_PARAMS, sample_id,
+                    bounds[index + 1] - bounds[index], packed, len(packed),
+                ),
+            )
+        cur.execute(DELETE_STAGED_POSITIONS_QUERY, region)
+        cur.execute(STRUCTURE_EVICT_QUERY, (STRUCTURE_CACHE_MAX_BYTES,))
+        if cur.rowcount:
+            print(f"Structure cache evicted {cur.rowcount} samples to stay under {STRUCTURE_CACHE_MAX_BYTES} bytes.")
+        conn.commit()
+        return len(sample_ids)
 
-    def get_fold_inputs(spe_df):
-        """Prepare folding input file from the filtered significant interactions."""
-        spe_out_df = spe_df[["ibp", "jbp", "fq", "chrid", "fdr"]]
-        spe_out_df["w"] = 1
-        result = spe_out_df[["chrid", "ibp", "jbp", "fq", "w"]]
-        return result
 
-    def checking_existing_data(conn, chromosome_name, cell_line, sequences, sample_id):
+"""
+Returns {sample_id: (n_beads, packed float32 x, y, z bytes)} of the samples among sample_ids still staged in position
+"""
+def staged_structures(cur, cell_line, chromosome_name, sequences, sample_ids):
+    cur.execute(
+        STAGED_SAMPLES_QUERY,
+        (chromosome_name, cell_line, sequences["start"], sequences["end"], list(sample_ids)),
+    )
+    rows = cur.fetchall()
+    if not rows:
+        return {}
+    staged = np.array([row["sampleid"] for row in rows])
+    coords = np.array([(row["x"], row["y"], row["z"]) for row in rows], dtype="<f4")
+    sample_ids, starts = np.unique(staged, return_index=True)
+    bounds = starts.tolist() + [len(coords)]
+    return {
+        sample_id: (bounds[index + 1] - bounds[index], coords[bounds[index]:bounds[index + 1]].tobytes())
+        for index, sample_id in enumerate(sample_ids.tolist())
+    }
+
+
+"""
+Returns (n_beads, packed float32 x, y, z bytes) of a folded sample (cached, or still staged in position), or None
+"""
+def cached_structure(cell_line, chromosome_name, sequences, sample_id):
+    with db_connection() as conn:
         cur = conn.cursor()
         cur.execute(
-            """
-            SELECT *
-            FROM position
-            WHERE chrID = %s
-            AND cell_line = %s
-            AND start_value = %s
-            AND end_value = %s
-            AND sampleID = %s
-        """,
-            (chromosome_name, cell_line, sequences["start"], sequences["end"], sample_id),
+            STRUCTURE_LOOKUP_QUERY,
+            (cell_line, chromosome_name, sequences["start"], sequences["end"], FOLDING_PARAMS, sample_id),
         )
-        position_data = cur.fetchall()
-        
-        if position_data:
-            return position_data
-        else: 
-            return None
-
-    if checking_existing_data(conn, chromosome_name, cell_line, sequences, sample_id):
-        return checking_existing_data(conn, chromosome_name, cell_line, sequences, sample_id)
-    else:
-        cur.execute(
-            """
-            SELECT *
-            FROM non_random_hic
-            WHERE chrID = %s
-            AND cell_line = %s
-            AND ibp >= %s
-            AND ibp <= %s
-            AND jbp >= %s
-            AND jbp <= %s
-        """,
-            (chromosome_name, cell_line, sequences["start"], sequences["end"], sequences["start"], sequences["end"]),
-        )
-        original_data = cur.fetchall()
+        row = cur.fetchone()
+        conn.commit()
+        if row is None:
+            structure = staged_structures(cur, cell_line, chromosome_name, sequences, [sample_id]).get(sample_id)
+        else:
+            structure = row["n_beads"], bytes(row["coords"])
+    record_cache("structure", structure is not None)
+    return structure
 
-        if original_data:
-            original_df = pd.DataFrame(original_data, columns=["chrid", "fdr", "ibp", "jbp", "fq"])
 
-            filtered_df = get_spe_inter(original_df)
-            fold_inputs = get_fold_inputs(filtered_df)
+"""
+Returns the structure cache size and hit count
+"""
+def structure_cache_stats():
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(STRUCTURE_CACHE_STATS_QUERY)
+        stats = dict(cur.fetchone())
+    stats["max_bytes"] = STRUCTURE_CACHE_MAX_BYTES
+    return stats
 
-            txt_data = fold_inputs.to_csv(index=False, sep="\t", header=False)
-            custom_name = f"{cell_line}.{chromosome_name}.{sequences['start']}.{sequences['end']}"
 
-            # Ensure the custom path exists, create it if it doesn't
-            os.makedirs(temp_folding_input_path, exist_ok=True)
+"""
+Returns the path of the sBIF input (chrid, ibp, jbp, fq, w TSV) of the contacts with fdr < alpha in the given cell line,
+chromosome name, start, end. Inputs are cached under FOLDING_INPUT_CACHE by a hash of the region, alpha and data version;
+the file is empty when no contact is significant.
+"""
+def folding_input(cell_line, chromosome_name, sequences, alpha=FOLDING_ALPHA):
+    region = (cell_line, chromosome_name, int(sequences["start"]), int(sequences["end"]))
+    key = hashlib.sha1(repr((data_version()[0], CONTACT_BACKEND, alpha) + region).encode()).hexdigest()
+    path = os.path.join(FOLDING_INPUT_CACHE, key + ".txt")
+    if os.path.exists(path):
+        os.utime(path)
+        return path
+
+    os.makedirs(FOLDING_INPUT_CACHE, exist_ok=True)
+    staging = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    try:
+        # Filter the region arrays when they are at hand (contact store, region memo); COPY is not
+        # available in the gevent serving mode, where the arrays are read instead
+        columns = _region_memo.peek(region) if CONTACT_BACKEND == "postgres" else None
+        if CONTACT_BACKEND == "store" or columns is not None or extensions.get_wait_callback() is not None:
+            if columns is None:
+                columns = region_contact_arrays(cell_line, chromosome_name, sequences)
+            write_folding_input(staging, chromosome_name, columns, alpha)
+        else:
+            with db_connection() as conn, open(staging, "wb") as f:
+                cur = conn.cursor()
+                query = cur.mogrify(
+                    FOLDING_INPUT_QUERY,
+                    (
+                        chromosome_name,
+                        cell_line,
+                        sequences["start"],
+                        sequences["end"],
+                        sequences["start"],
+                        sequences["end"],
+                        alpha,
+                    ),
+                )
+                # Text COPY output is already the tab-separated input sBIF reads
+                cur.copy_expert("COPY (%s) TO STDOUT" % query.decode(), f)
+        os.replace(staging, path)
+    finally:
+        if os.path.exists(staging):
+            os.remove(staging)
+
+    # Least recently used inputs go first
+    inputs = [entry for entry in os.scandir(FOLDING_INPUT_CACHE) if entry.name.endswith(".txt")]
+    if len(inputs) > FOLDING_INPUT_CACHE_SIZE:
+        inputs.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in inputs[:len(inputs) - FOLDING_INPUT_CACHE_SIZE]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+    return path
 
-            # Define the full path where the file will be stored
-            custom_file_path = os.path.join(temp_folding_input_path, custom_name + ".txt")
+"""
+Write the contacts with fdr < alpha of the given contact arrays as an sBIF input file
+"""
+def write_folding_input(path, chromosome_name, columns, alpha):
+    significant = columns["fdr"] < alpha
+    ibps = columns["ibp"][significant].tolist()
+    jbps = columns["jbp"][significant].tolist()
+    # astype(str) gives the shortest repr of the stored float width, like the text COPY does
+    fqs = columns["fq"][significant].astype(str).tolist()
+    with open(path, "w") as f:
+        for start in range(0, len(ibps), STREAM_ITERSIZE):
+            stop = start + STREAM_ITERSIZE
+            f.write("".join(
+                f"{chromosome_name}\t{ibp}\t{jbp}\t{fq}\t1\n"
+                for ibp, jbp, fq in zip(ibps[start:stop], jbps[start:stop], fqs[start:stop])
+            ))
+
+
+"""
+Hold an exclusive flock on path for the duration of a with block, and remove the lock file on release.
+A waiter that locked a file which the previous holder already removed opens the new one and tries again.
+"""
+@contextmanager
+def region_lock(path):
+    while True:
+        lock_file = open(path, "a")
+        try:
+            # Poll instead of a blocking flock, which would stall every greenlet of a gevent worker
+            while True:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    time.sleep(FOLDING_LOCK_POLL)
+            try:
+                current = os.stat(path)
+            except FileNotFoundError:
+                current = None
+            if current is not None and current.st_ino == os.fstat(lock_file.fileno()).st_ino:
+                try:
+                    yield
+                finally:
+                    os.remove(path)
+                return
+        finally:
+            lock_file.close()
 
-            # Write the file to the custom path
-            with open(custom_file_path, 'w') as temp_file:
-                temp_file.write(txt_data)
+
+"""
+Fold the given cell line, chromosome name, start, end with sBIF (on threads threads) until it has n_samples samples.
+Returns False when the region has no significant contacts to fold.
+"""
+@instrumented
+def fold_region(cell_line, chromosome_name, sequences, n_samples, threads=None):
+    custom_name = f"{cell_line}.{chromosome_name}.{sequences['start']}.{sequences['end']}"
+    os.makedirs(FOLDING_INPUT_ROOT, exist_ok=True)
+
+    # The region lock makes other worker processes wait for this fold instead of repeating it
+    lock_name = hashlib.sha1(custom_name.encode()).hexdigest() + ".lock"
+    with region_lock(os.path.join(FOLDING_INPUT_ROOT, lock_name)):
+        pack_folded_samples(cell_line, chromosome_name, sequences)
+        if len(folded_samples(cell_line, chromosome_name, sequences)) >= n_samples:
+            return True
+
+        input_path = folding_input(cell_line, chromosome_name, sequences)
+        if os.path.getsize(input_path) == 0:
+            return False
+
+        # Every fold gets its own input directory, sBIF.sh folds every file in the directory it is given
+        input_dir = tempfile.mkdtemp(prefix="job-", dir=FOLDING_INPUT_ROOT)
+        try:
+            # A hard link keeps the input even if the cache evicts it during the fold
+            try:
+                os.link(input_path, os.path.join(input_dir, custom_name + ".txt"))
+            except OSError:
+                shutil.copyfile(input_path, os.path.join(input_dir, custom_name + ".txt"))
 
             script = "./sBIF.sh"
-            n_samples = 3
             n_samples_per_run = 1
             is_download = "false"
-            subprocess.run(
-                ["bash", script, str(n_samples), str(n_samples_per_run), str(is_download)],
-                capture_output=True,
-                text=True,
-                check=True,
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                subprocess.run(
+                    [
+                        "bash", script, str(n_samples), str(n_samples_per_run), str(is_download), input_dir,
+                        str(threads or FOLDING_THREADS), str(HIC_RESOLUTION),
+                    ],
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                )
+                outcome = "ok"
+            finally:
+                record_folding(cell_line, time.perf_counter() - started, outcome)
+        finally:
+            shutil.rmtree(input_dir, ignore_errors=True)
+
+        pack_folded_samples(cell_line, chromosome_name, sequences)
+
+    return True
+
+
+"""
+Return the process-wide folding job manager (created again after a fork, like the connection pool).
+"""
+def get_folding_jobs():
+    global _folding_jobs
+    with _folding_jobs_lock:
+        if _folding_jobs is None or _folding_jobs.pid != os.getpid():
+            _folding_jobs = FoldingJobManager(
+                lambda key, n_samples: fold_region(key[0], key[1], {"start": key[2], "end": key[3]}, n_samples),
+                db_connection,
+                FOLDING_INPUT_ROOT,
+                max_workers=FOLDING_WORKERS,
+                retention=FOLDING_JOB_RETENTION,
+                poll=FOLDING_LOCK_POLL,
             )
+        return _folding_jobs
 
-            os.remove(custom_file_path)
 
-            return checking_existing_data(conn, chromosome_name, cell_line, sequences, sample_id)
-        else:
-            return []
+"""
+Submit a folding job for the given cell line, chromosome name, start, end; identical running jobs are shared
+"""
+def submit_folding_job(cell_line, chromosome_name, sequences, n_samples=None):
+    key = (cell_line, chromosome_name, int(sequences["start"]), int(sequences["end"]))
+    job = get_folding_jobs().submit(key, int(n_samples or FOLDING_SAMPLES))
+    return folding_job_status(job.id)
+
+
+"""
+Returns the state of a folding job and the samples folded so far (readable while later samples still fold)
+"""
+def folding_job_status(job_id):
+    job = get_folding_jobs().get(job_id)
+    if job is None:
+        return None
+
+    cell_line, chromosome_name, start, end = job.key
+    samples = folded_samples(cell_line, chromosome_name, {"start": start, "end": end})
+    status = job.to_dict()
+    status["completed_samples"] = samples
+    status["progress"] = min(len(samples) / job.n_samples, 1.0) if job.n_samples else 1.0
+    return status
+
+
+"""
+Returns the folding job counts by state
+"""
+def folding_jobs_stats():
+    return get_folding_jobs().stats()
+
+
+"""
+Returns {cell_line: (n_beads, packed float32 x, y, z bytes) or None} of one sample of the given chromosome name, start, end,
+folding the cell lines whose sample is not cached in parallel; None when a region has no contacts or no such sample
+"""
+def example_chromosome_3d_structures(cell_lines, chromosome_name, sequences, sample_id):
+    structures = {}
+    jobs = get_folding_jobs()
+    pending = {}
+    for cell_line in cell_lines:
+        structures[cell_line] = cached_structure(cell_line, chromosome_name, sequences, sample_id)
+        if structures[cell_line] is None:
+            # Requests for a region that is already folding wait on that job instead of starting another sBIF run
+            key = (cell_line, chromosome_name, int(sequences["start"]), int(sequences["end"]))
+            pending[cell_line] = jobs.submit(key, FOLDING_SAMPLES)
+
+    for cell_line, job in pending.items():
+        jobs.wait(job)
+        if job.state == "failed":
+            raise RuntimeError(f"Folding failed for {cell_line} {chromosome_name}:{sequences['start']}-{sequences['end']}: {job.error}")
+        if job.result:
+            structures[cell_line] = cached_structure(cell_line, chromosome_name, sequences, sample_id)
+
+    return structures
+
+
+"""
+Returns (n_beads, packed float32 x, y, z bytes) of a sample of the given cell line, chromosome name, start, end,
+folding the region first when the sample is not cached; None when the region has no contacts or no such sample
+"""
+def example_chromosome_3d_structure(cell_line, chromosome_name, sequences, sample_id):
+    return example_chromosome_3d_structures([cell_line], chromosome_name, sequences, sample_id)[cell_line]
+
+
+"""
+Returns the example(3) 3D chromosome data in the given cell line, chromosome name, start, end, floats rounded to precision significant digits
+"""
+@instrumented
+def example_chromosome_3d_data(cell_line, chromosome_name, sequences, sample_id, precision=None):
+    structure = example_chromosome_3d_structure(cell_line, chromosome_name, sequences, sample_id)
+    if structure is None:
+        return []
+
+    n_beads, coords = structure
+    xyz = np.frombuffer(coords, dtype="<f4").reshape(n_beads, 3)
+    xs, ys, zs = (round_column(name, xyz[:, axis], precision).tolist() for axis, name in enumerate("xyz"))
+    return [
+        {
+            "cell_line": cell_line,
+            "chrid": chromosome_name,
+            "sampleid": sample_id,
+            "start_value": sequences["start"],
+            "end_value": sequences["end"],
+            "x": x,
+            "y": y,
+            "z": z,
+        }
+        for x, y, z in zip(xs, ys, zs)
+    ]
+
+
+"""
+Returns the example(3) 3D chromosome data as shared fields and one interleaved float32 x, y, z column
+"""
+@instrumented
+def example_chromosome_3d_columns(cell_line, chromosome_name, sequences, sample_id):
+    structure = example_chromosome_3d_structure(cell_line, chromosome_name, sequences, sample_id)
+    n_beads, coords = structure if structure is not None else (0, b"")
+    fields = {
+        "cell_line": cell_line,
+        "chrid": chromosome_name,
+        "sampleid": sample_id,
+        "start_value": sequences["start"],
+        "end_value": sequences["end"],
+        "count": n_beads,
+    }
+    return fields, {"xyz": np.frombuffer(coords, dtype="<f4")}
+
+
+"""
+Returns the contacts (as {column: values}), valid ibps and (with a sample_id) 3D structure of several cell lines over one
+chromosome name, start, end, limited to the parts named in include. The region is scanned once for all cell lines and
+the region fields are shared instead of repeated in every row.
+"""
+@instrumented
+def comparison_region_data(cell_lines, chromosome_name, sequences, sample_id=None, include=COMPARISON_PARTS):
+    cell_lines = list(dict.fromkeys(cell_lines))
+    contacts = region_contact_arrays_by_cell_line(cell_lines, chromosome_name, sequences)
+    sample_id = sample_id if "structure" in include else None
+    structures = (
+        example_chromosome_3d_structures(cell_lines, chromosome_name, sequences, sample_id) if sample_id is not None else {}
+    )
+
+    result = {"chrid": chromosome_name, "start": sequences["start"], "end": sequences["end"], "sample_id": sample_id, "cell_lines": {}}
+    for cell_line in cell_lines:
+        columns = contacts[cell_line]
+        data = {}
+        if "contacts" in include:
+            data["contacts"] = {name: columns[name].tolist() for name in ("ibp", "jbp", "fq", "fdr")}
+        if "valid_ibp" in include:
+            data["valid_ibp"] = np.unique(columns["ibp"]).tolist()
+        if sample_id is not None:
+            structure = structures.get(cell_line)
+            xyz = (
+                round_column("xyz", np.frombuffer(structure[1], dtype="<f4"), None).reshape(structure[0], 3).tolist()
+                if structure else []
+            )
+            data["structure"] = [{"x": x, "y": y, "z": z} for x, y, z in xyz]
+        result["cell_lines"][cell_line] = data
+    return result
+
+
+"""
+Returns comparison_region_data as shared fields and typed columns named "<cell_line>.<column>"; contacts of all
+cell lines use the same bin origin and resolution
+"""
+@instrumented
+def comparison_region_columns(cell_lines, chromosome_name, sequences, sample_id=None, include=COMPARISON_PARTS):
+    cell_lines = list(dict.fromkeys(cell_lines))
+    contacts = region_contact_arrays_by_cell_line(cell_lines, chromosome_name, sequences)
+    sample_id = sample_id if "structure" in include else None
+    structures = (
+        example_chromosome_3d_structures(cell_lines, chromosome_name, sequences, sample_id) if sample_id is not None else {}
+    )
+    origin, resolution, binned = binned_contact_columns([contacts[cell_line] for cell_line in cell_lines], sequences)
+
+    fields = {
+        "chrid": chromosome_name,
+        "origin": origin,
+        "resolution": resolution,
+        "sample_id": sample_id,
+        "cell_lines": [],
+    }
+    columns = {}
+    for cell_line, binned_columns in zip(cell_lines, binned):
+        fields["cell_lines"].append({"cell_line": cell_line, "count": int(binned_columns["ibp"].size)})
+        if "contacts" in include:
+            for name, values in binned_columns.items():
+                columns[f"{cell_line}.{name}"] = values
+        if "valid_ibp" in include:
+            columns[f"{cell_line}.valid_ibp"] = np.unique(binned_columns["ibp"])
+        if sample_id is not None:
+            structure = structures.get(cell_line)
+            columns[f"{cell_line}.xyz"] = np.frombuffer(structure[1] if structure else b"", dtype="<f4")
+    return fields, columns
 
 
 """
 Download the full 3D chromosome data(including distances, 50000) in the given cell line, chromosome name, start, end
 """
+@instrumented
 def download_full_chromosome_3d_data(cell_line, chromosome_name, sequences):
-    conn = get_db_connection()
-    cur = conn.cursor()
-
     def get_spe_inter(hic_data, alpha=0.05):
         """Filter Hi-C data for significant interactions based on the alpha threshold."""
         hic_spe = hic_data.loc[hic_data["fdr"] < alpha]
@@ -394,20 +1429,21 @@ def download_full_chromosome_3d_data(cell_line, chromosome_name, sequences):
         result = spe_out_df[["cell_line", "chr", "ibp", "jbp", "fq", "w"]]
         return result
 
-    cur.execute(
-        """
-        SELECT *
-        FROM non_random_hic
-        WHERE chrID = %s
-        AND cell_line = %s
-        AND ibp >= %s
-        AND ibp <= %s
-        ORDER BY start_value
-    """,
-        (chromosome_name, cell_line, sequences["start"], sequences["end"]),
-    )
-    original_data = cur.fetchall()
-    conn.close()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT *
+            FROM non_random_hic
+            WHERE chrID = %s
+            AND cell_line = %s
+            AND ibp >= %s
+            AND ibp <= %s
+            ORDER BY start_value
+        """,
+            (chromosome_name, cell_line, sequences["start"], sequences["end"]),
+        )
+        original_data = cur.fetchall()
 
     column_names = [desc[0] for desc in cur.description]
     original_df = pd.DataFrame(original_data, columns=column_names)
@@ -446,18 +1482,13 @@ def download_full_chromosome_3d_data(cell_line, chromosome_name, sequences):
 """
 Returns currently existing other cell line list in given chromosome name and sequences
 """
+@instrumented
+@cached
 def comparison_cell_line_list(cell_line):
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    cur.execute(
-        """
-        SELECT DISTINCT cell_line
-        FROM sequence
-    """
-    )
-
-    rows = cur.fetchall()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(CATALOG_CELL_LINES_QUERY)
+        rows = cur.fetchall()
 
     label_mapping = {
         "IMR": "Lung(IMR90)",
@@ -473,73 +1504,292 @@ def comparison_cell_line_list(cell_line):
         for row in rows
         if row["cell_line"] != cell_line
     ]
-    conn.close()
 
     return options
 
 
 """
-Return the gene list in the given chromosome_name and sequence
+Return the gene list in the given chromosome_name and sequence, floats rounded to precision significant digits
 """
-def gene_list(chromosome_name, sequences):
-    conn = get_db_connection()
-    cur = conn.cursor()
+@instrumented
+def gene_list(chromosome_name, sequences, precision=None):
+    table = get_interval_index().table("genes", chromosome_name)
+    if table is None:
+        return []
+    return table.rows(table.overlapping(sequences["start"], sequences["end"]), precision)
 
-    cur.execute(
-        """
-        SELECT *
-        FROM gene
-        WHERE chromosome = %s
-        AND (
-            (start_location BETWEEN %s AND %s)
-            OR (end_location BETWEEN %s AND %s)
-            OR (start_location <= %s AND end_location >= %s)
-        )
-    """,
-        (chromosome_name, sequences["start"], sequences["end"], sequences["start"], sequences["end"], sequences["start"], sequences["end"]),
-    )
+"""
+Return the epigenetic track data in the given cell_line, chromosome_name and sequence, floats rounded to precision significant digits
+"""
+@instrumented
+def epigenetic_track_data(cell_line, chromosome_name, sequences, precision=None):
+    index = get_interval_index()
+    aggregated_data = {}
+    for epigenetic in index.keys("tracks", cell_line, chromosome_name):
+        table = index.table("tracks", cell_line, chromosome_name, epigenetic)
+        positions = table.contained(sequences["start"], sequences["end"])
+        if len(positions):
+            aggregated_data[epigenetic] = table.rows(positions, precision)
 
-    gene_list = cur.fetchall()
-    conn.close()
+    return aggregated_data
 
-    return gene_list
 
 """
-Return the epigenetic track data in the given cell_line, chromosome_name and sequence
+Yields (epigenetic, rows) chunks of the epigenetic track data in the given cell_line, chromosome_name and sequence,
+at most chunk_size rows at a time and grouped by epigenetic key in order
 """
-def epigenetic_track_data(cell_line, chromosome_name, sequences):
-    conn = get_db_connection()
-    cur = conn.cursor()
+@instrumented
+def epigenetic_track_chunks(cell_line, chromosome_name, sequences, chunk_size=STREAM_ITERSIZE, precision=None):
+    index = get_interval_index()
+    for epigenetic in index.keys("tracks", cell_line, chromosome_name):
+        table = index.table("tracks", cell_line, chromosome_name, epigenetic)
+        positions = table.contained(sequences["start"], sequences["end"])
+        for start in range(0, len(positions), chunk_size):
+            yield epigenetic, table.rows(positions[start:start + chunk_size], precision)
 
-    cur.execute(
-        """
-        SELECT *
-        FROM epigenetic_track
-        WHERE chrID = %s
-        AND cell_line = %s
-        AND start_value >= %s
-        AND end_value <= %s
-    """,
-        (chromosome_name, cell_line, sequences["start"], sequences["end"]),
-    )
 
-    # Fetch all the data from the query
-    epigenetic_track_data = cur.fetchall()
+"""
+Return the epigenetic track data as one set of numeric columns; "groups" gives each epigenetic key's slice
+"""
+@instrumented
+def epigenetic_track_columns(cell_line, chromosome_name, sequences):
+    index = get_interval_index()
+    groups = []
+    parts = {name: [] for name, _ in EPIGENETIC_TRACK_COLUMNS}
+    offset = 0
+    for epigenetic in index.keys("tracks", cell_line, chromosome_name):
+        table = index.table("tracks", cell_line, chromosome_name, epigenetic)
+        positions = table.contained(sequences["start"], sequences["end"])
+        if not len(positions):
+            continue
+        groups.append({"epigenetic": epigenetic, "offset": offset, "length": len(positions)})
+        offset += len(positions)
+        for name, dtype in EPIGENETIC_TRACK_COLUMNS:
+            parts[name].append(table.column(name, positions).astype(dtype))
+
+    columns = {
+        name: np.concatenate(parts[name]) if parts[name] else np.empty(0, dtype=dtype)
+        for name, dtype in EPIGENETIC_TRACK_COLUMNS
+    }
+    fields = {"cell_line": cell_line, "chrid": chromosome_name, "groups": groups, "count": offset}
+    return fields, columns
 
-    # Close the database connection
-    conn.close()
 
-    # Initialize a dictionary to store the aggregated data by epigenetic key
-    aggregated_data = {}
+"""
+Returns the finest summary resolution fitting the given sequence into at most bins bins (the coarsest level when none
+does), or None for windows of at most EPIGENETIC_RAW_MAX_WIDTH bp, which get the raw peaks
+"""
+def epigenetic_bin_resolution(sequences, bins):
+    width = sequences["end"] - sequences["start"] + 1
+    if width <= EPIGENETIC_RAW_MAX_WIDTH:
+        return None
+    for resolution in EPIGENETIC_BIN_RESOLUTIONS:
+        if -(-width // resolution) <= bins:
+            return resolution
+    return EPIGENETIC_BIN_RESOLUTIONS[-1]
 
-    # Loop through the fetched rows and aggregate by epigenetic key
-    for row in epigenetic_track_data:
-        # Assuming 'epigenetic' is one of the columns in the row
-        epigenetic_key = row['epigenetic']  # Replace with the actual column name
-        if epigenetic_key not in aggregated_data:
-            aggregated_data[epigenetic_key] = []
-        
-        # Append the current row or necessary data to the list under the epigenetic key
-        aggregated_data[epigenetic_key].append(row)
 
-    return aggregated_data
+"""
+Returns (origin, n_bins, marks, {column: marks x n_bins array}) of the epigenetic track summary at the given resolution.
+Empty bins have 0 peaks, 0 signal and a NaN q_value_min.
+"""
+def epigenetic_track_summary_arrays(cell_line, chromosome_name, sequences, resolution):
+    index = get_interval_index()
+    origin = sequences["start"] - sequences["start"] % resolution
+    n_bins = -(-(sequences["end"] - origin + 1) // resolution)
+    marks = index.keys("track_bins", cell_line, chromosome_name)
+    columns = {
+        "signal_max": np.zeros((len(marks), n_bins)),
+        "signal_mean": np.zeros((len(marks), n_bins)),
+        "peaks": np.zeros((len(marks), n_bins), dtype=np.int64),
+        "q_value_min": np.full((len(marks), n_bins), np.nan),
+    }
+    for row, epigenetic in enumerate(marks):
+        table = index.table("track_bins", cell_line, chromosome_name, epigenetic, resolution)
+        if table is None:
+            continue
+        positions = table.overlapping(origin, sequences["end"])
+        offsets = (table.column("bin_start", positions) - origin) // resolution
+        for name, values in columns.items():
+            values[row, offsets] = table.column(name, positions)
+    return int(origin), int(n_bins), marks, columns
+
+
+"""
+Returns the epigenetic track summary of the given cell_line, chromosome_name and sequence in at most bins bins per mark,
+as shared fields and columns of one block of "bins" values per mark, in "marks" order (float32 signal and q_value_min,
+int32 peaks). resolution is None, with the epigenetic_track_columns of the raw peaks, for windows of at most
+EPIGENETIC_RAW_MAX_WIDTH bp.
+"""
+@instrumented
+def epigenetic_track_summary_columns(cell_line, chromosome_name, sequences, bins):
+    bins = max(1, min(int(bins), EPIGENETIC_MAX_BINS))
+    resolution = epigenetic_bin_resolution(sequences, bins)
+    if resolution is None:
+        fields, columns = epigenetic_track_columns(cell_line, chromosome_name, sequences)
+        fields["resolution"] = None
+        return fields, columns
+
+    origin, n_bins, marks, columns = epigenetic_track_summary_arrays(cell_line, chromosome_name, sequences, resolution)
+    fields = {
+        "cell_line": cell_line,
+        "chrid": chromosome_name,
+        "resolution": resolution,
+        "origin": origin,
+        "bins": n_bins,
+        "marks": marks,
+    }
+    return fields, {
+        name: values.reshape(-1).astype(np.int32 if name == "peaks" else np.float32)
+        for name, values in columns.items()
+    }
+
+
+"""
+Returns the epigenetic track summary of the given cell_line, chromosome_name and sequence in at most bins bins per mark as
+{"resolution", "origin", "bins", "data": {mark: {"signal_max": [...], "signal_mean": [...], "peaks": [...], "q_value_min": [...]}}},
+with null q_value_min for empty bins; or {"resolution": None, "data": raw peaks by mark} for windows of at most
+EPIGENETIC_RAW_MAX_WIDTH bp
+"""
+@instrumented
+def epigenetic_track_summary(cell_line, chromosome_name, sequences, bins, precision=None):
+    bins = max(1, min(int(bins), EPIGENETIC_MAX_BINS))
+    resolution = epigenetic_bin_resolution(sequences, bins)
+    if resolution is None:
+        return {"resolution": None, "data": epigenetic_track_data(cell_line, chromosome_name, sequences, precision)}
+
+    origin, n_bins, marks, columns = epigenetic_track_summary_arrays(cell_line, chromosome_name, sequences, resolution)
+    columns = {name: round_column(name, values, precision) for name, values in columns.items()}
+    data = {}
+    for row, epigenetic in enumerate(marks):
+        summary = {name: values[row].tolist() for name, values in columns.items()}
+        summary["q_value_min"] = [None if value != value else value for value in summary["q_value_min"]]
+        data[epigenetic] = summary
+    return {"resolution": resolution, "origin": origin, "bins": n_bins, "data": data}
+
+
+"""
+Returns {sample_id: (n_beads, packed float32 x, y, z bytes)} of the folded samples (cached, or still staged in position)
+among sample_ids
+"""
+def cached_structures(cell_line, chromosome_name, sequences, sample_ids):
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            STRUCTURE_SAMPLES_QUERY,
+            (cell_line, chromosome_name, sequences["start"], sequences["end"], FOLDING_PARAMS, list(sample_ids)),
+        )
+        rows = cur.fetchall()
+        conn.commit()
+        structures = {row["sampleid"]: (row["n_beads"], bytes(row["coords"])) for row in rows}
+        missing = [sample_id for sample_id in sample_ids if sample_id not in structures]
+        if missing:
+            structures.update(staged_structures(cur, cell_line, chromosome_name, sequences, missing))
+    return structures
+
+
+"""
+Returns (sample ids, None) of the ensemble of the given cell line, chromosome name, start, end: sample_ids, or the first
+n_samples. When some are not folded yet, returns (None, folding job status) of the job folding them instead of waiting.
+Raises LookupError when the samples cannot be folded.
+"""
+def distance_samples(cell_line, chromosome_name, sequences, n_samples=None, sample_ids=None):
+    folded = sorted(folded_samples(cell_line, chromosome_name, sequences))
+    if sample_ids is None:
+        n_samples = n_samples or FOLDING_SAMPLES
+        if len(folded) >= n_samples:
+            return tuple(folded[:n_samples]), None
+    else:
+        sample_ids = tuple(sorted(set(sample_ids)))
+        missing = sorted(set(sample_ids) - set(folded))
+        if not missing:
+            return sample_ids, None
+        # sBIF numbers the samples of a run from 0, so folding max + 1 samples produces every missing one
+        if missing[-1] >= DISTANCE_MAX_SAMPLES:
+            raise LookupError(f"Unknown samples {missing} for {cell_line} {chromosome_name}:{sequences['start']}-{sequences['end']}")
+        n_samples = missing[-1] + 1
+
+    if not region_has_contacts(cell_line, chromosome_name, sequences):
+        raise LookupError(f"No structures for {cell_line} {chromosome_name}:{sequences['start']}-{sequences['end']}")
+    return None, submit_folding_job(cell_line, chromosome_name, sequences, n_samples)
+
+
+"""
+Returns ((sample_id, written at), ...) of the folded samples among sample_ids; a sample that is folded again gets a new entry
+"""
+def structure_generations(cell_line, chromosome_name, sequences, sample_ids):
+    region = (cell_line, chromosome_name, sequences["start"], sequences["end"])
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(STRUCTURE_GENERATIONS_QUERY, region + (FOLDING_PARAMS, list(sample_ids)) + region + (list(sample_ids),))
+        return tuple((row["sampleid"], row["written_at"].isoformat()) for row in cur.fetchall())
+
+
+"""
+Compute statistics of the bead-to-bead distances over an ensemble of structures.
+coords is (samples, beads, 3); returns {statistic: float32 array} over the upper triangle (i < j) in row-major order.
+"mean" and "median" are over the samples, "contact_probability" is the fraction of samples closer than cutoff.
+"""
+def pairwise_distance_statistics(coords, statistics, cutoff=None):
+    n_beads = coords.shape[1]
+    n_pairs = n_beads * (n_beads - 1) // 2
+    results = {name: np.empty(n_pairs, dtype=np.float32) for name in statistics}
+    offset = 0
+    # One bead against every later bead, for all samples at once
+    for bead in range(n_beads - 1):
+        diff = coords[:, bead + 1:] - coords[:, bead:bead + 1]
+        distances = np.sqrt(np.einsum("spk,spk->sp", diff, diff))
+        block = slice(offset, offset + distances.shape[1])
+        if "mean" in results:
+            results["mean"][block] = distances.mean(axis=0)
+        if "median" in results:
+            results["median"][block] = np.median(distances, axis=0)
+        if "contact_probability" in results:
+            results["contact_probability"][block] = (distances < cutoff).mean(axis=0)
+        offset = block.stop
+    return results
+
+
+"""
+Returns the pairwise bead distances of the given cell line, chromosome name, start, end as shared fields and float32
+upper-triangle columns: "mean" and "median" over the samples, plus "contact_probability" (distance < cutoff) when a cutoff
+is given. The distance of beads i < j is at i * n_beads - i * (i + 1) / 2 + j - i - 1.
+The samples are sample_ids (see distance_samples); results are cached per region, sample set and sample generation.
+Raises LookupError when a requested sample does not exist.
+"""
+@instrumented
+def structure_distance_columns(cell_line, chromosome_name, sequences, sample_ids, cutoff=None):
+    sample_ids = tuple(sorted(set(sample_ids)))
+    if not sample_ids:
+        raise LookupError(f"No structures for {cell_line} {chromosome_name}:{sequences['start']}-{sequences['end']}")
+    statistics = ("mean", "median") + (("contact_probability",) if cutoff is not None else ())
+
+    def compute():
+        structures = cached_structures(cell_line, chromosome_name, sequences, sample_ids)
+        missing = sorted(set(sample_ids) - set(structures))
+        if missing:
+            raise LookupError(f"Unknown samples {missing} for {cell_line} {chromosome_name}:{sequences['start']}-{sequences['end']}")
+        if len({n_beads for n_beads, _ in structures.values()}) > 1:
+            raise ValueError("Samples of one region have different bead counts")
+
+        n_beads = structures[sample_ids[0]][0]
+        coords = np.stack([
+            np.frombuffer(structures[sample_id][1], dtype="<f4").reshape(n_beads, 3) for sample_id in sample_ids
+        ])
+        fields = {
+            "cell_line": cell_line,
+            "chrid": chromosome_name,
+            "start_value": sequences["start"],
+            "end_value": sequences["end"],
+            "n_beads": n_beads,
+            "samples": list(sample_ids),
+            "cutoff": cutoff,
+            "layout": "upper_triangle",
+        }
+        return fields, pairwise_distance_statistics(coords, statistics, cutoff)
+
+    key = (
+        cell_line, chromosome_name, int(sequences["start"]), int(sequences["end"]), FOLDING_PARAMS, sample_ids, cutoff,
+        structure_generations(cell_line, chromosome_name, sequences, sample_ids),
+    )
+    return _distance_cache.get_or_load(key, compute)
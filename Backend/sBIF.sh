@@ -2,18 +2,19 @@
 
 ##parameters
 chrlensfile="../Example_Data/chromosome_sizes.txt"
-res=5000
-threads=50
 EXE_PATH="../sBIF/bin/sBIF"
 n_samples=$1
 n_samples_per_run=$2
 is_download=$3
+input_dir=${4:-../Example_Data/Folding_input}
+threads=${5:-50}
+res=${6:-5000}
 
 count=1
-total_files=$(find ../Example_Data/Folding_input -name "*.txt" | wc -l | xargs)
+total_files=$(find "$input_dir" -maxdepth 1 -name "*.txt" | wc -l | xargs)
 
 
-for interfile in ../Example_Data/Folding_input/*.txt; do
+for interfile in "$input_dir"/*.txt; do
     filename=$(basename "$interfile")
     
     # Extract cell_line, chromosome, start, and end from the filename
@@ -0,0 +1,101 @@
+import os
+import threading
+import time
+
+import pytest
+
+import cache
+from cache import TTLCache
+
+
+@pytest.fixture
+def version_file(monkeypatch, tmp_path):
+    path = tmp_path / ".data_version"
+    monkeypatch.setattr(cache, "DATA_VERSION_FILE", str(path))
+    cache.mark_data_changed()
+    return path
+
+
+def bump(path, seconds):
+    """Stamp a new data version, with an explicit mtime so it differs on coarse-grained filesystems."""
+    os.utime(path, (seconds, seconds))
+
+
+def test_concurrent_misses_share_one_load(version_file):
+    store = TTLCache(ttl=60)
+    loads = []
+    release = threading.Event()
+
+    def loader():
+        loads.append(1)
+        release.wait(1)
+        return "value"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(store.get_or_load("key", loader))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join(1)
+
+    assert results == ["value"] * 8
+    assert len(loads) == 1
+    assert store.stats()["misses"] == 1
+    assert store.stats()["hits"] == 7
+
+
+def test_waiters_retry_when_the_load_fails(version_file):
+    store = TTLCache(ttl=60)
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.05)
+        raise RuntimeError("database down")
+
+    errors = []
+
+    def first():
+        try:
+            store.get_or_load("key", failing)
+        except RuntimeError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=first)
+    thread.start()
+    started.wait(1)
+    assert store.get_or_load("key", lambda: "loaded") == "loaded"
+    thread.join(1)
+    assert len(errors) == 1
+
+
+def test_a_new_data_version_invalidates_entries(version_file):
+    store = TTLCache(ttl=60)
+    bump(version_file, 1000)
+    assert store.get_or_load("key", lambda: "old") == "old"
+    assert store.get_or_load("key", lambda: "unused") == "old"
+
+    bump(version_file, 2000)
+    assert store.peek("key") is None
+    assert store.get_or_load("key", lambda: "new") == "new"
+    assert store.stats()["invalidations"] == 1
+
+
+def test_entries_expire_after_the_ttl(version_file):
+    store = TTLCache(ttl=0)
+    assert store.get_or_load("key", lambda: 1) == 1
+    assert store.get_or_load("key", lambda: 2) == 2
+
+
+def test_least_recently_used_entries_are_evicted(version_file):
+    store = TTLCache(maxsize=2, ttl=60)
+    store.get_or_load("a", lambda: "a")
+    store.get_or_load("b", lambda: "b")
+    store.get_or_load("a", lambda: "unused")
+    store.get_or_load("c", lambda: "c")
+
+    assert store.peek("a") == "a"
+    assert store.peek("b") is None
+    assert store.stats()["evictions"] == 1
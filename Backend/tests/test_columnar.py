@@ -0,0 +1,127 @@
+import json
+import struct
+
+import numpy as np
+import pytest
+from psycopg2 import extensions
+
+from columnar import ALIGNMENT, MAGIC, PGCOPY_SIGNATURE, copy_binary_columns, encode_columns
+
+ROWS = [(0, 5000, 1.5, 0.01), (5000, 5000, 2.25, 0.5), (10000, 20000, 7.0, 0.0)]
+DTYPE = [("ibp", ">i8"), ("jbp", ">i8"), ("fq", ">f8"), ("fdr", ">f4")]
+
+
+def decode(payload):
+    """Read an encode_columns payload back the way the frontend does."""
+    assert payload[:4] == MAGIC
+    header_length = struct.unpack("<I", payload[4:8])[0]
+    header = json.loads(payload[8:8 + header_length])
+    data_start = 8 + header_length
+    assert data_start % ALIGNMENT == 0
+    columns = {}
+    for column in header["columns"]:
+        assert column["offset"] % ALIGNMENT == 0
+        columns[column["name"]] = np.frombuffer(
+            payload, dtype=column["dtype"], count=column["length"], offset=data_start + column["offset"]
+        )
+    return header["fields"], columns
+
+
+def test_encode_columns_layout():
+    columns = {
+        "ibp": np.array([1, 2, 3], dtype=np.int32),
+        "fq": np.array([0.5, 1.5], dtype=">f4"),
+        "flag": np.array([1, 0, 1, 1, 0], dtype=np.uint8),
+        "xyz": np.arange(6, dtype=np.float64),
+    }
+    payload = encode_columns({"chrid": "chr17", "count": 3}, columns)
+    fields, decoded = decode(payload)
+
+    assert fields == {"chrid": "chr17", "count": 3}
+    assert list(decoded) == ["ibp", "fq", "flag", "xyz"]
+    for name, values in columns.items():
+        assert decoded[name].dtype.byteorder in "<|="
+        np.testing.assert_array_equal(decoded[name], values)
+    assert len(payload) % ALIGNMENT == 0
+
+
+def test_encode_columns_without_rows():
+    fields, decoded = decode(encode_columns({}, {"xyz": np.zeros(0, dtype="<f4")}))
+    assert fields == {}
+    assert decoded["xyz"].size == 0
+
+
+def pgcopy(rows, dtype):
+    """A COPY ... (FORMAT binary) stream of rows."""
+    parts = [PGCOPY_SIGNATURE, struct.pack(">II", 0, 0)]
+    for row in rows:
+        parts.append(struct.pack(">h", len(row)))
+        for value, (_, column_dtype) in zip(row, dtype):
+            raw = np.array(value, dtype=column_dtype).tobytes()
+            parts.append(struct.pack(">i", len(raw)) + raw)
+    parts.append(struct.pack(">h", -1))
+    return b"".join(parts)
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.copied = None
+        self.connection = self
+
+    def mogrify(self, query, params):
+        return (query % params).encode()
+
+    def copy_expert(self, sql, file):
+        self.copied = sql
+        file.write(pgcopy(self.rows, DTYPE))
+
+    # The plain cursor of the wait-callback fallback
+    def cursor(self, cursor_factory=None):
+        return self
+
+    def execute(self, query, params):
+        self.executed = query % params
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+def test_copy_binary_columns_decodes_the_copy_stream():
+    cur = FakeCursor(ROWS)
+    columns = copy_binary_columns(cur, "SELECT ibp, jbp, fq, fdr FROM t WHERE x = %s", (1,), DTYPE)
+
+    assert cur.copied == "COPY (SELECT ibp, jbp, fq, fdr FROM t WHERE x = 1) TO STDOUT WITH (FORMAT binary)"
+    assert columns["ibp"].tolist() == [0, 5000, 10000]
+    assert columns["jbp"].tolist() == [5000, 5000, 20000]
+    assert columns["fq"].tolist() == [1.5, 2.25, 7.0]
+    np.testing.assert_allclose(columns["fdr"], [0.01, 0.5, 0.0])
+    assert all(column.dtype.isnative for column in columns.values())
+
+
+def test_copy_binary_columns_of_an_empty_result():
+    columns = copy_binary_columns(FakeCursor([]), "SELECT 1", (), DTYPE)
+    assert all(column.size == 0 for column in columns.values())
+
+
+def test_copy_binary_columns_rejects_other_streams():
+    cur = FakeCursor(ROWS)
+    cur.copy_expert = lambda sql, file: file.write(b"not a copy stream")
+    with pytest.raises(ValueError):
+        copy_binary_columns(cur, "SELECT 1", (), DTYPE)
+
+
+def test_copy_binary_columns_fetches_rows_under_a_wait_callback():
+    extensions.set_wait_callback(lambda conn: None)
+    try:
+        cur = FakeCursor(ROWS)
+        columns = copy_binary_columns(cur, "SELECT ibp, jbp, fq, fdr FROM t WHERE x = %s", (1,), DTYPE)
+    finally:
+        extensions.set_wait_callback(None)
+
+    assert cur.copied is None
+    assert columns["ibp"].tolist() == [0, 5000, 10000]
+    assert columns["fq"].tolist() == [1.5, 2.25, 7.0]
@@ -0,0 +1,128 @@
+import threading
+import time
+
+import pytest
+from psycopg2 import extensions
+
+import db_pool
+from db_pool import ConnectionPool, PoolTimeout
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query, params=None):
+        self.conn.status = extensions.TRANSACTION_STATUS_INTRANS
+        self.conn.queries.append(query)
+
+    def fetchone(self):
+        return (1,)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    """Stands in for a psycopg2 connection: tracks its transaction status, rollbacks and queries."""
+
+    def __init__(self):
+        self.closed = 0
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+        self.rollbacks = 0
+        self.queries = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    opened = []
+
+    def connect(**kwargs):
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    monkeypatch.setattr(db_pool.psycopg2, "connect", connect)
+    return opened
+
+
+def test_connections_are_reused_and_rolled_back_on_return(connections):
+    pool = ConnectionPool(0, 2)
+    with pool.connection() as conn:
+        conn.cursor().execute("UPDATE t SET x = 1")
+    assert conn.rollbacks == 1
+
+    with pool.connection() as again:
+        pass
+    assert again is conn
+    assert len(connections) == 1
+    assert pool.stats()["checkouts"] == 2
+
+
+def test_checkout_times_out_when_saturated(connections):
+    pool = ConnectionPool(0, 1, checkout_timeout=0.05)
+    held = pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+
+    stats = pool.stats()
+    assert stats["timeouts"] == 1
+    assert stats["in_use"] == 1
+    assert stats["saturation"] == 1.0
+    pool.putconn(held)
+
+
+def test_waiting_checkout_gets_the_returned_connection(connections):
+    pool = ConnectionPool(0, 1, checkout_timeout=5)
+    held = pool.getconn()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.getconn()))
+    waiter.start()
+    time.sleep(0.05)
+    assert not got
+
+    pool.putconn(held)
+    waiter.join(1)
+    assert got == [held]
+    assert pool.stats()["waits"] == 1
+
+
+def test_closed_idle_connections_are_replaced(connections):
+    pool = ConnectionPool(1, 1)
+    connections[0].close()
+    conn = pool.getconn()
+
+    assert conn is connections[1]
+    assert pool.stats()["health_check_failures"] == 1
+    assert pool.stats()["size"] == 1
+
+
+def test_idle_connections_are_pinged_after_ping_after(connections):
+    pool = ConnectionPool(1, 1, ping_after=0)
+    conn = pool.getconn()
+    assert conn.queries == ["SELECT 1"]
+    assert conn.status == extensions.TRANSACTION_STATUS_IDLE
+
+
+def test_connection_closed_inside_the_block_is_discarded(connections):
+    pool = ConnectionPool(0, 1)
+    with pytest.raises(RuntimeError):
+        with pool.connection() as conn:
+            conn.close()
+            raise RuntimeError("lost connection")
+
+    assert pool.stats()["size"] == 0
+    with pool.connection() as fresh:
+        assert fresh is not conn
@@ -0,0 +1,52 @@
+import pandas as pd
+import pytest
+
+from interval_index import IntervalIndex
+from process import EPIGENETIC_BIN_RESOLUTIONS, EPIGENETIC_RAW_MAX_WIDTH, epigenetic_bin_resolution, epigenetic_track_bins
+
+TRACK_COLUMNS = ["cell_line", "chrid", "epigenetic", "start_value", "end_value", "signal_value", "q_value"]
+
+
+def test_empty_epigenetic_track_table(tmp_path):
+    # What fetch_frame returns for an empty epigenetic_track: object columns, no rows
+    tracks = pd.DataFrame([], columns=TRACK_COLUMNS)
+
+    bins = epigenetic_track_bins(tracks)
+    assert bins.empty
+
+    index = IntervalIndex(str(tmp_path / "index"))
+    index.build({"track_bins": (bins, ["cell_line", "chrid", "epigenetic", "resolution"], "bin_start", "bin_end")}, "1")
+    assert index.keys("track_bins", "GM", "chr1") == []
+
+
+def test_peaks_spanning_bins():
+    resolution = EPIGENETIC_BIN_RESOLUTIONS[0]
+    tracks = pd.DataFrame(
+        [
+            ["GM", "chr1", "CTCF", 0, resolution + 10, 4.0, 2.0],
+            ["GM", "chr1", "CTCF", resolution + 20, resolution + 30, 8.0, 1.0],
+        ],
+        columns=TRACK_COLUMNS,
+    )
+
+    bins = epigenetic_track_bins(tracks)
+    finest = bins[bins["resolution"] == resolution].sort_values("bin_start")
+    assert finest["bin_start"].tolist() == [0, resolution]
+    assert finest["peaks"].tolist() == [1, 2]
+    assert finest["signal_max"].tolist() == [4.0, 8.0]
+    assert finest["q_value_min"].tolist() == [2.0, 1.0]
+
+
+@pytest.mark.parametrize(
+    "width, bins, resolution",
+    [
+        (EPIGENETIC_RAW_MAX_WIDTH, 10, None),
+        (EPIGENETIC_RAW_MAX_WIDTH + 1, 2000, 2000),
+        (1000000, 500, 2000),
+        (1000000, 499, 10000),
+        (4000000, 100, 50000),
+        (10 ** 9, 10, 1000000),
+    ],
+)
+def test_epigenetic_bin_resolution(width, bins, resolution):
+    assert epigenetic_bin_resolution({"start": 1, "end": width}, bins) == resolution
@@ -0,0 +1,44 @@
+from gene_index import GeneIndex
+
+
+def gene(symbol, chromosome="17", start=1, end=2):
+    return {"symbol": symbol, "chromosome": chromosome, "start_location": start, "end_location": end}
+
+
+GENES = [gene(symbol) for symbol in ("TP53", "TP53BP1", "TP53I3", "ATP5", "XTP5A", "BRCA1", "tp53")] + [gene("TP5", "12")]
+
+
+def test_search_ranks_exact_then_prefix_then_substring():
+    index = GeneIndex(GENES)
+    assert index.search("tp53") == ["TP53", "tp53", "TP53I3", "TP53BP1"]
+    assert index.search("TP5") == ["TP5", "TP53", "tp53", "TP53I3", "TP53BP1", "ATP5", "XTP5A"]
+
+
+def test_search_is_case_insensitive_and_trimmed():
+    index = GeneIndex(GENES)
+    assert index.search("  brca1 ") == ["BRCA1"]
+
+
+def test_search_limit_keeps_the_best_ranked():
+    index = GeneIndex(GENES)
+    assert index.search("tp5", limit=2) == ["TP5", "TP53"]
+    assert index.search("", limit=3) == ["ATP5", "BRCA1", "TP5"]
+
+
+def test_short_queries_match_substrings_without_trigrams():
+    index = GeneIndex(GENES)
+    assert index.search("a1") == ["BRCA1"]
+    assert index.search("zz") == []
+
+
+def test_chromosomes_limit_search_but_not_lookup():
+    index = GeneIndex(GENES, chromosomes={"12"})
+    assert index.search("tp5") == ["TP5"]
+    assert len(index) == 1
+    assert index.lookup("TP53") == {"chromosome": "17", "start_location": 1, "end_location": 2}
+
+
+def test_first_row_of_a_symbol_wins():
+    index = GeneIndex([gene("TP53", start=10, end=20), gene("TP53", start=30, end=40)])
+    assert index.lookup("TP53")["start_location"] == 10
+    assert index.lookup("MISSING") is None
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from interval_index import IntervalIndex
+
+
+@pytest.fixture
+def intervals():
+    rng = np.random.default_rng(7)
+    start = rng.integers(0, 100000, 500)
+    return pd.DataFrame({
+        "chromosome": rng.choice(["1", "X"], 500),
+        "symbol": [f"G{i}" for i in range(500)],
+        "start_location": start,
+        # A few very long intervals, so overlaps must be found from far before the window
+        "end_location": start + np.where(rng.random(500) < 0.02, 50000, rng.integers(0, 2000, 500)),
+    })
+
+
+@pytest.fixture
+def index(tmp_path, intervals):
+    index = IntervalIndex(str(tmp_path / "interval_index"))
+    index.build({"genes": (intervals, ["chromosome"], "start_location", "end_location")}, "v1")
+    return index
+
+
+@pytest.mark.parametrize("start,end", [(0, 100), (40000, 41000), (99000, 200000), (50000, 50000), (-10, -1)])
+def test_overlapping_matches_a_scan(index, intervals, start, end):
+    for chromosome in ("1", "X"):
+        table = index.table("genes", chromosome)
+        expected = intervals[
+            (intervals.chromosome == chromosome)
+            & (intervals.start_location <= end)
+            & (intervals.end_location >= start)
+        ]
+        found = table.column("symbol", table.overlapping(start, end))
+        assert sorted(found) == sorted(expected.symbol)
+
+
+@pytest.mark.parametrize("start,end", [(0, 100000), (40000, 45000), (10, 10)])
+def test_contained_matches_a_scan(index, intervals, start, end):
+    table = index.table("genes", "1")
+    expected = intervals[
+        (intervals.chromosome == "1")
+        & (intervals.start_location >= start)
+        & (intervals.end_location <= end)
+    ]
+    assert sorted(table.column("symbol", table.contained(start, end))) == sorted(expected.symbol)
+
+
+def test_rows_keep_column_types(index, intervals):
+    table = index.table("genes", "X")
+    first = intervals[intervals.chromosome == "X"].sort_values(["start_location", "end_location"], kind="stable").iloc[0]
+    assert table.rows(np.array([0])) == [{
+        "chromosome": "X",
+        "symbol": first.symbol,
+        "start_location": int(first.start_location),
+        "end_location": int(first.end_location),
+    }]
+    assert table.column("symbol", np.array([], dtype=np.int64)) == []
+
+
+def test_rebuild_swaps_in_the_new_index(index, intervals):
+    assert index.version() == "v1"
+    assert index.keys("genes") == ["1", "X"]
+    assert index.table("genes", "Y") is None
+
+    moved = intervals.assign(chromosome="Y")
+    index.build({"genes": (moved, ["chromosome"], "start_location", "end_location")}, "v2")
+    assert index.version() == "v2"
+    assert index.keys("genes") == ["Y"]
+    assert len(index.table("genes", "Y")) == len(intervals)
+    assert index.table("genes", "1") is None
@@ -0,0 +1,15 @@
+import numpy as np
+
+from precision import round_column
+
+
+def test_float32_columns_drop_the_widening_error():
+    values = np.array([0.1, -2.5e-3, 12345.678], dtype=np.float32)
+    assert round_column("x", values, None).tolist() == [0.1, -0.0025, 12345.68]
+    assert round_column("x", values, 3).tolist() == [0.1, -0.0025, 12300.0]
+
+
+def test_float64_columns_keep_full_precision():
+    values = np.array([0.1 + 1e-12, 1 / 3])
+    assert round_column("fq", values, None) is values
+    assert round_column("fq", values, {"fdr": 2}) is values
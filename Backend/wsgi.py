@@ -0,0 +1,60 @@
+import os
+
+import psycopg2
+from psycopg2 import extensions
+
+# Seconds a request may run in the gevent serving mode before it is answered with 504 (0 disables)
+WEB_REQUEST_TIMEOUT = float(os.getenv("WEB_REQUEST_TIMEOUT", 300))
+
+try:
+    import gevent
+    from gevent import monkey
+    from gevent.socket import wait_read, wait_write
+except ImportError:
+    gevent = None
+
+
+def gevent_wait_callback(conn, timeout=None):
+    """psycopg2 wait callback that yields to other greenlets instead of blocking the worker."""
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            break
+        elif state == extensions.POLL_READ:
+            wait_read(conn.fileno(), timeout=timeout)
+        elif state == extensions.POLL_WRITE:
+            wait_write(conn.fileno(), timeout=timeout)
+        else:
+            raise psycopg2.OperationalError(f"Bad result from poll: {state!r}")
+
+
+class RequestTimeout:
+    """WSGI middleware answering requests that run longer than `seconds` with 504."""
+
+    def __init__(self, app, seconds):
+        self.app = app
+        self.seconds = seconds
+
+    def __call__(self, environ, start_response):
+        timeout = gevent.Timeout(self.seconds)
+        timeout.start()
+        try:
+            return self.app(environ, start_response)
+        except gevent.Timeout as e:
+            if e is not timeout:
+                raise
+            print(f"Request timed out after {self.seconds}s: {environ.get('REQUEST_METHOD')} {environ.get('PATH_INFO')}")
+            start_response("504 Gateway Timeout", [("Content-Type", "text/plain")])
+            return [b"Request timed out"]
+        finally:
+            timeout.cancel()
+
+
+green = gevent is not None and monkey.is_module_patched("socket")
+if green:
+    # The gunicorn gevent worker has monkey-patched the standard library; make psycopg2 cooperative too
+    extensions.set_wait_callback(gevent_wait_callback)
+
+from app import app  # noqa: E402  (after the wait callback, so every pooled connection is green)
+
+application = RequestTimeout(app, WEB_REQUEST_TIMEOUT) if green and WEB_REQUEST_TIMEOUT > 0 else app
@@ -5,6 +5,7 @@ import './App.css';
 import { Heatmap } from './canvasHeatmap.js';
 import { ChromosomeBar } from './chromosomeBar.js';
 import { Chromosome3D } from './Chromosome3D.js';
+import { fetchColumnar, xyzBeads } from './columnar.js';
 import { PlusOutlined, MinusOutlined, InfoCircleOutlined } from "@ant-design/icons";
 
 
@@ -37,6 +38,7 @@ function App() {
   const [comparisonCellLine3DData, setComparisonCellLine3DData] = useState([]);
   const [comparisonCellLine3DSampleID, setComparisonCellLine3DSampleID] = useState(0);
   const [comparisonCellLine3DLoading, setComparisonCellLine3DLoading] = useState(false);
+  const [comparisonValidIbpData, setComparisonValidIbpData] = useState([]);
 
 
   // Tour visibility state
@@ -142,13 +144,8 @@ function App() {
   };
 
   const fetchChromosomeList = (value) => {
-    fetch('/getChromosList', {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-      body: JSON.stringify({ cell_line: value })
-    })
+    // GET, so the browser revalidates the cached list with If-None-Match
+    fetch(`/getChromosList?${new URLSearchParams({ cell_line: value })}`)
       .then(res => res.json())
       .then(data => {
         setChromosList(data);
@@ -156,13 +153,7 @@ function App() {
   };
 
   const fetchChromosomeSize = (value) => {
-    fetch("/getChromosSize", {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-      body: JSON.stringify({ chromosome_name: value })
-    })
+    fetch(`/getChromosSize?${new URLSearchParams({ chromosome_name: value })}`)
       .then(res => res.json())
       .then(data => {
         setChromosomeSize({ start: 1, end: data });
@@ -193,7 +184,8 @@ function App() {
     } else if (!cellLineName || !chromosomeName) {
       warning('noData');
     } else {
-      fetch("/getChromosData", {
+      // Contacts and valid ibps come from one scan of the region
+      fetch("/getChromosRegionData", {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -202,50 +194,40 @@ function App() {
       })
         .then(res => res.json())
         .then(data => {
-          setChromosomeData(data);
+          setChromosomeData(data.data);
+          setValidChromosomeValidIbpData(data.valid_ibps);
           setHeatmapLoading(false);
         });
     }
   };
 
-  const fetchValidChromosomeValidIbpData = () => {
-    fetch("/getChromosValidIBPData", {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-      body: JSON.stringify({ cell_line: cellLineName, chromosome_name: chromosomeName, sequences: selectedChromosomeSequence })
-    })
-      .then(res => res.json())
-      .then(data => {
-        setValidChromosomeValidIbpData(data);
-      });
-  }
-
-  const fetchExampleChromos3DData = (cell_line, sample_id, sampleChange, isComparison) => {
+  const fetchExampleChromos3DData = (cell_line, sample_id, sampleChange) => {
     if (cell_line && chromosomeName && selectedChromosomeSequence) {
-      fetch("/getExampleChromos3DData", {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({ cell_line: cell_line, chromosome_name: chromosomeName, sequences: selectedChromosomeSequence, sample_id: sample_id })
-      })
-        .then(res => res.json())
-        .then(data => {
-          if (isComparison) {
-            setComparisonCellLine3DData(data);
-            setComparisonCellLine3DLoading(false);
-          } else {
-            setChromosome3DExampleData(data);
-            if (sampleChange === "submit") {
-              setChromosome3DLoading(false);
-            }
+      // The beads come as one float32 x, y, z column instead of a JSON object per bead
+      fetchColumnar("/getExampleChromos3DData", { cell_line: cell_line, chromosome_name: chromosomeName, sequences: selectedChromosomeSequence, sample_id: sample_id })
+        .then(({ columns }) => {
+          setChromosome3DExampleData(xyzBeads(columns.xyz));
+          if (sampleChange === "submit") {
+            setChromosome3DLoading(false);
           }
         });
     }
   };
 
+  const fetchComparisonRegionData = (cell_line, sample_id) => {
+    if (cell_line && chromosomeName && selectedChromosomeSequence) {
+      // The structure and the valid ibps of the comparison cell line come from one request, without its contacts
+      fetchColumnar("/getComparisonRegionData", { cell_lines: [cell_line], chromosome_name: chromosomeName, sequences: selectedChromosomeSequence, sample_id: sample_id, include: ['structure', 'valid_ibp'] })
+        .then(({ fields, columns }) => {
+          // Valid ibps come as bin indexes from the region origin
+          const validIbps = Array.from(columns[`${cell_line}.valid_ibp`], bin => fields.origin + bin * fields.resolution);
+          setComparisonCellLine3DData(xyzBeads(columns[`${cell_line}.xyz`]));
+          setComparisonValidIbpData(validIbps);
+          setComparisonCellLine3DLoading(false);
+        });
+    }
+  };
+
   const fetchGeneList = () => {
     if (chromosomeName && selectedChromosomeSequence) {
       let filteredChromosomeName = chromosomeName.slice(3);
@@ -279,13 +261,7 @@ function App() {
 
   const fetchComparisonCellLineList = () => {
     if (chromosomeName && selectedChromosomeSequence) {
-      fetch("/getComparisonCellLineList", {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({ cell_line: cellLineName })
-      })
+      fetch(`/getComparisonCellLineList?${new URLSearchParams({ cell_line: cellLineName })}`)
         .then(res => res.json())
         .then(data => {
           if (data.length > 0) {
@@ -369,6 +345,7 @@ function App() {
     setChromosomeData([]);
     setChromosome3DExampleData([]);
     setComparisonCellLine3DData([]);
+    setComparisonValidIbpData([]);
     fetchChromosomeList(value);
     setChromosome3DComparisonShowing(false);
   };
@@ -393,6 +370,7 @@ function App() {
     setChromosomeData([]);
     setChromosome3DExampleData([]);
     setComparisonCellLine3DData([]);
+    setComparisonValidIbpData([]);
     setComparisonCellLineList([]);
     setComparisonCellLine(null);
     setComparisonCellLine3DSampleID(0);
@@ -409,6 +387,7 @@ function App() {
     setComparisonCellLine3DSampleID(0);
     setComparisonCellLineList([]);
     setComparisonCellLine3DData([]);
+    setComparisonValidIbpData([]);
 
     setSelectedChromosomeSequence((prevState) => ({
       ...prevState,
@@ -419,13 +398,13 @@ function App() {
   // 3D Original Chromosome sample change
   const originalSampleChange = (key) => {
     setChromosome3DExampleID(key);
-    fetchExampleChromos3DData(cellLineName, key, "sampleChange", false);
+    fetchExampleChromos3DData(cellLineName, key, "sampleChange");
   };
 
   // 3D Comparison Chromosome sample change
   const comparisonSampleChange = (key) => {
     setComparisonCellLine3DSampleID(key);
-    fetchExampleChromos3DData(comparisonCellLine, key, "sampleChange", true);
+    fetchComparisonRegionData(comparisonCellLine, key);
   };
 
   // Add 3D Chromosome Comparison
@@ -442,7 +421,7 @@ function App() {
   const comparisonCellLineChange = (value) => {
     setComparisonCellLine(value);
     setComparisonCellLine3DLoading(true);
-    fetchExampleChromos3DData(value, comparisonCellLine3DSampleID, "sampleChange", true);
+    fetchComparisonRegionData(value, comparisonCellLine3DSampleID);
   };
 
   // Submit button click
@@ -460,10 +439,10 @@ function App() {
       setComparisonCellLine3DSampleID(0);
       setComparisonCellLineList([]);
       setComparisonCellLine3DData([]);
+      setComparisonValidIbpData([]);
       setChromosome3DExampleID(0);
       setChromosome3DExampleData([]);
       fetchChromosomeData();
-      fetchValidChromosomeValidIbpData();
       fetchGeneList();
     }
   };
@@ -752,7 +731,7 @@ function App() {
                           <Chromosome3D
                             geneSize={geneSize}
                             chromosome3DExampleData={comparisonCellLine3DData}
-                            validChromosomeValidIbpData={validChromosomeValidIbpData}
+                            validChromosomeValidIbpData={comparisonValidIbpData}
                             selectedChromosomeSequence={selectedChromosomeSequence}
                           />
                         ),
@@ -3,6 +3,7 @@ import { Button, Input, Modal, Tooltip } from "antd";
 import { DownloadOutlined, RollbackOutlined, FullscreenOutlined } from "@ant-design/icons";
 import { GeneList } from './geneList.js';
 import { HeatmapTriangle } from './heatmapTriangle.js';
+import { fetchColumnar, xyzBeads } from './columnar.js';
 import * as d3 from 'd3';
 
 export const Heatmap = ({ cellLineName, chromosomeName, chromosomeData, selectedChromosomeSequence, totalChromosomeSequences, geneList, setSelectedChromosomeSequence, chromosome3DExampleID, setChromosome3DLoading, setGeneName, geneName, geneSize, setChromosome3DExampleData, setComparisonCellLine3DLoading, setComparisonCellLine3DData, setGeneSize }) => {
@@ -45,15 +46,9 @@ export const Heatmap = ({ cellLineName, chromosomeName, chromosomeData, selected
 
     const fetchExampleChromos3DData = (cell_line, sample_id, sampleChange, isComparison) => {
         if (cell_line && chromosomeName && selectedChromosomeSequence) {
-            fetch("/getExampleChromos3DData", {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({ cell_line: cell_line, chromosome_name: chromosomeName, sequences: currentChromosomeSequence, sample_id: sample_id })
-            })
-                .then(res => res.json())
-                .then(data => {
+            fetchColumnar("/getExampleChromos3DData", { cell_line: cell_line, chromosome_name: chromosomeName, sequences: currentChromosomeSequence, sample_id: sample_id })
+                .then(({ columns }) => {
+                    const data = xyzBeads(columns.xyz);
                     if (isComparison) {
                         setComparisonCellLine3DData(data);
                         setComparisonCellLine3DLoading(false);
@@ -0,0 +1,60 @@
+// Decoder of the columnar responses (application/vnd.chrompolymer.columnar) of the backend:
+// "CPC1", the header length as little-endian uint32, a JSON header, then 8-byte aligned column buffers
+const MAGIC = 'CPC1';
+
+const TYPED_ARRAYS = {
+    '<f4': Float32Array,
+    '<f8': Float64Array,
+    '<i1': Int8Array,
+    '|i1': Int8Array,
+    '<u1': Uint8Array,
+    '|u1': Uint8Array,
+    '<i2': Int16Array,
+    '<u2': Uint16Array,
+    '<i4': Int32Array,
+    '<u4': Uint32Array,
+    '<i8': BigInt64Array,
+    '<u8': BigUint64Array,
+};
+
+export const decodeColumnar = (buffer) => {
+    const magic = new TextDecoder().decode(new Uint8Array(buffer, 0, 4));
+    if (magic !== MAGIC) {
+        throw new Error('Not a columnar response');
+    }
+    const headerLength = new DataView(buffer).getUint32(4, true);
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 8, headerLength)));
+    const dataStart = 8 + headerLength;
+
+    const columns = {};
+    header.columns.forEach(({ name, dtype, length, offset }) => {
+        const TypedArray = TYPED_ARRAYS[dtype];
+        if (!TypedArray) {
+            throw new Error(`Unsupported column type ${dtype} of ${name}`);
+        }
+        // The buffers are aligned, so the columns are views on the response without copies
+        columns[name] = new TypedArray(buffer, dataStart + offset, length);
+    });
+    return { fields: header.fields, columns };
+};
+
+export const fetchColumnar = (url, body) => {
+    return fetch(url, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ ...body, format: 'columnar' })
+    })
+        .then(res => res.arrayBuffer())
+        .then(decodeColumnar);
+};
+
+// Beads of an interleaved float32 x, y, z column, in the { x, y, z } shape of the 3D views
+export const xyzBeads = (xyz) => {
+    const beads = new Array(Math.floor(xyz.length / 3));
+    for (let i = 0; i < beads.length; i++) {
+        beads[i] = { x: xyz[3 * i], y: xyz[3 * i + 1], z: xyz[3 * i + 2] };
+    }
+    return beads;
+};